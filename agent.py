@@ -1,5 +1,6 @@
 import numpy as np
-from config import Config
+from trust_matrix import RegisterView
+from strategies import STRATEGIES
 
 class LearnTrustAgent:
     '''
@@ -10,8 +11,9 @@ class LearnTrustAgent:
         unique identifier for this agent
     reliability : float
         reliability score of this agent, value in range (0,1)
-    registers : dict
-        dict mapping neighbor id to reliabilty opinion
+    registers : RegisterView
+        dict-like view mapping neighbor id to reliabilty opinion, backed by a row of a TrustMatrix
+        (or, in a game with a topology, by the agent's neighbours in a SparseTrustMatrix)
     alpha_direct : float
         decay rate for direct opinion updates
     alpha_indirect : float
@@ -20,6 +22,12 @@ class LearnTrustAgent:
         list of encounter results
     payoff_threshold : float
         threshold for when this agent will accept an encounter
+    strategy : str
+        name of the agent's decision rule, see strategies.py. opinions are learned the same way under every strategy
+    rng : numpy.random.Generator
+        random generator for encounter outcomes. a Game passes its own generator; standalone agents use np.random
+    profiler : profiling.Profiler
+        optional per-phase timers and counters (see profiling.py), shared by all agents of a profiled Game
 
     Methods
     -------
@@ -29,23 +37,42 @@ class LearnTrustAgent:
     get_registers()
         returns dict mapping neighbor id to reliabilty opinion
     
-    handle_encounter(active_id, active_id_reliability, active_id_registers, p_g, p_b)
+    handle_encounter(active_id, active_id_reliability, active_id_registers, p_g, p_b, reliability_sample, defer_indirect, accepted)
         handle encounter when this agent is asked to participate in an encounter as the passive agent.
+
+    decide(opinion, p_g, p_b, reliability)
+        returns whether to accept an encounter given the opinion of the other agent (and its true reliability)
+
+    update_direct(passive_id, success)
+        first-hand opinion update after an accepted encounter
+
+    adopt_opinions(passive_id, passive_id_registers)
+        second-hand opinion update after a good encounter
     '''
 
     #def __init__(self, id: int, reliability: float, agent_type: string, alpha_direct: float, alpha_indirect: float, expected_r_dist: int = 0.5, payoff_threshold: float = 0):
-    def __init__(self, id: int, reliability: float, alpha_direct: float, alpha_indirect: float, expected_r_dist: int = 0.5, payoff_threshold: float = 0):
+    def __init__(self, id: int, reliability: float, alpha_direct: float, alpha_indirect: float, expected_r_dist: int = 0.5, payoff_threshold: float = 0, registers: RegisterView = None, rng: np.random.Generator = None, num_agents: int = None, profiler=None, strategy: str = 'learn_trust'):
         self.id = id
         self.reliability = reliability # quantity between 0 and 1
         # self.agent_type = agent_type
-        registers_indices = list(range(Config.num_agents))
-        registers_indices.remove(id)
         self.expected_r_dist = expected_r_dist
-        self.registers = dict.fromkeys(registers_indices, self.expected_r_dist) # reliability estimates of the other agents. dict mapping neighbor id to reliabilty opinion
+        # reliability estimates of the other agents. dict-like view mapping neighbor id to reliabilty opinion.
+        # a Game passes in a row of its shared TrustMatrix; a standalone agent gets its own row over num_agents agents
+        if registers is None:
+            if num_agents is None:
+                from config import Config
+                num_agents = Config.num_agents
+            registers = RegisterView(np.empty(num_agents), id)
+        registers.fill(self.expected_r_dist)
+        self.registers = registers
         self.alpha_direct = alpha_direct
         self.alpha_indirect = alpha_indirect
         self.encounter_history = [] # this attribute is not yet used, but could be useful
         self.payoff_threshold = payoff_threshold # tau_i in the paper
+        self.strategy = strategy
+        self.decide_fn = STRATEGIES[strategy] # vectorized decision function, also applied to arrays of opinions
+        self.rng = rng if rng is not None else np.random
+        self.profiler = profiler
 
     def get_reliability(self):
         return self.reliability
@@ -59,7 +86,7 @@ class LearnTrustAgent:
         '''
         return self.registers[agent_id]
 
-    def handle_encounter(self, passive_id: int, passive_id_reliability: int, passive_id_registers: dict, p_g: float, p_b: float):
+    def handle_encounter(self, passive_id: int, passive_id_reliability: int, passive_id_registers: dict, p_g: float, p_b: float, reliability_sample: float = None, defer_indirect: bool = False, accepted: bool = None):
         '''
         handle encounter when this agent is asked to participate in an encounter as the active agent.
         this handling includes choosing whether to accept the encounter request, and updating opinions
@@ -67,34 +94,76 @@ class LearnTrustAgent:
         args:
             passive_id: id of passive agent "initiating" this encounter
             passive_id_reliability: reliability score of passive agent
-            passive_id_registers: registers (opinions) of passive agent
+            passive_id_registers: registers (opinions) of passive agent, a RegisterView or a dict
             p_g: payout if encounter if good
             p_b: payout if encounter is bad
+            reliability_sample: uniform in [0, 1) that decides the outcome if the encounter is accepted.
+                a Game pre-samples these in blocks; if None, one is drawn from self.rng
+            defer_indirect: if True, a good encounter does not blend in the passive agent's opinions;
+                the caller delivers them later with adopt_opinions (e.g. after a gossip latency)
+            accepted: the decision, if the caller has already made it for a batch of encounters with strategies.decide;
+                if None, this agent decides from its current opinion of the passive agent
         returns:
             accepted: boolean for whether or not this agent accepted the encounter
             success: boolean for whether or not this encounter was good
                 these two quantities are returned so that the
                 game state object can log this encounter in its history
         '''
-        opinion = self.get_opinion(passive_id)
-        predicted_expected_payoff = opinion * p_g + (1 - opinion) * p_b
-        # accept encounter if predicted expected payoff is above threshold
-        accepted = predicted_expected_payoff >= self.payoff_threshold
+        profiler = self.profiler
+        timed = profiler is not None and profiler.timing
+        if timed:
+            t0 = profiler.clock()
+        if accepted is None:
+            accepted = self.decide(self.get_opinion(passive_id), p_g, p_b, passive_id_reliability)
         
         success = 0
         if accepted:
-            reliability_sample = np.random.random()
+            if reliability_sample is None:
+                reliability_sample = self.rng.random()
             success = reliability_sample < passive_id_reliability # result is true (1) if encounter is successful, false (0) otherwise
+        if timed:
+            t1 = profiler.clock()
+            profiler.add_agent_phase('decision', t0, t1)
     
         # have active agent do opinion updating
         if accepted:
             # update opinion of passive agent directly
-            self.registers[passive_id] = (1 - self.alpha_direct) * self.registers[passive_id] + self.alpha_direct * success
-            if success:
-                # update opinions of all other agents through passive agent's opinions, since this active agent now trusts the passive agent
-                for id in passive_id_registers.keys():
-                    if id == self.id:
-                        continue
-                    self.registers[id] = (1 - self.alpha_indirect) * self.registers[id] + self.alpha_indirect * passive_id_registers[id]
+            self.update_direct(passive_id, success)
+            if timed:
+                t2 = profiler.clock()
+                profiler.add_agent_phase('direct_update', t1, t2)
+            if success and not defer_indirect:
+                # update opinions of all other agents through passive agent's opinions, since this active agent now trusts the passive agent.
+                self.adopt_opinions(passive_id, passive_id_registers)
+                if timed:
+                    profiler.add_agent_phase('indirect_update', t2, profiler.clock())
+
+        return accepted, success
+
+    def decide(self, opinion: float, p_g: float, p_b: float, reliability: float = None) -> bool:
+        '''
+        returns whether to accept an encounter with an agent this agent holds the given opinion of.
+        learn_trust agents accept if the predicted expected payoff is above their threshold; reliability,
+        the other agent's true reliability, is only used by the know_reliability strategy
+        '''
+        return self.decide_fn(opinion, reliability, p_g, p_b, self.payoff_threshold)
+
+    def update_direct(self, passive_id: int, success: bool):
+        '''
+        first-hand update of this agent's opinion of the passive agent after an accepted encounter
+        '''
+        self.registers[passive_id] = (1 - self.alpha_direct) * self.registers[passive_id] + self.alpha_direct * success
+        if self.profiler is not None:
+            self.profiler.count('direct_updates')
+            self.profiler.count('register_entries')
 
-        return accepted, success
\ No newline at end of file
+    def adopt_opinions(self, passive_id: int, passive_id_registers: dict):
+        '''
+        second-hand update after a good encounter: blend the passive agent's opinions into this agent's.
+        this is a single row-level array operation over the trust matrix; with a topology it only
+        touches the neighbours the two agents have in common
+        '''
+        touched = self.registers.blend(passive_id_registers, self.alpha_indirect, exclude=passive_id)
+        if self.profiler is not None:
+            self.profiler.count('indirect_updates')
+            self.profiler.count('register_entries', touched)
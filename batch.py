@@ -0,0 +1,194 @@
+'''
+This Python library runs many independent replicates of the payoff game
+(benchmarks 1 and 2) in one vectorized pass. All replicates' opinions are held
+in a stacked (R, N, N) tensor, and each step advances every replicate by one
+encounter with array operations.
+'''
+
+import numpy as np
+import pandas as pd
+from config import Config
+from distributions import sample_reliabilities, EXPECTED_RELIABILITY, payoff_threshold
+from sampling import draw_encounters
+from strategies import parse_mix, assign_strategies, decide, strategy_summary
+
+
+def spawn_seeds(seed, num_replicates: int) -> list:
+    '''
+    derive one independent integer seed per replicate from a single root seed
+    '''
+    return np.random.SeedSequence(seed).generate_state(num_replicates, np.uint64).tolist()
+
+
+class BatchGame:
+    '''
+    R replicate games advanced in lockstep.
+
+    Attributes
+    ----------
+    seeds : list
+        per-replicate seeds; replicate r draws only from np.random.default_rng(seeds[r])
+    opinions : np.ndarray
+        (R, N, N) tensor, opinions[r, i, j] is agent i's opinion of agent j in replicate r
+    reliabilities : np.ndarray
+        (R, N) true reliability scores
+    strategy_codes : np.ndarray
+        (R, N) strategy codes of the agents, see strategies.py
+    active_ids, passive_ids, passive_opinion, accepted, result, total_payout : np.ndarray
+        (R, num_interactions) per-encounter records, filled in by run()
+
+    Methods
+    -------
+    run()
+        play num_interactions encounters in every replicate, returns the (R, T) total payout trajectories
+    payoffs()
+        returns (R, N) per-agent payoffs
+    strategy_payoffs()
+        returns the payoffs of each strategy in each replicate
+    replicate_dataframe(r)
+        returns replicate r's encounter table, with the same columns as simulation.Game.df
+    '''
+
+    def __init__(self, seeds: list, num_agents=100, r_dist='uniform', num_interactions=100, p_g=2, p_b=-2,
+                 alpha_direct=0.1, alpha_indirect=0.1, strategies='learn_trust', block_size=1024):
+        self.seeds = list(seeds)
+        self.num_replicates = len(self.seeds)
+        self.num_agents = num_agents
+        self.r_dist = r_dist
+        self.num_interactions = num_interactions
+        self.p_g = p_g
+        self.p_b = p_b
+        self.alpha_direct = alpha_direct
+        self.alpha_indirect = alpha_indirect
+        self.mix = parse_mix(strategies) # population mix of decision strategies, the same in every replicate
+        self.block_size = block_size  # encounters drawn per replicate at a time
+        self.rngs = [np.random.default_rng(seed) for seed in self.seeds]
+        shape = (self.num_replicates, num_interactions)
+        self.active_ids = np.empty(shape, dtype=np.int32)
+        self.passive_ids = np.empty(shape, dtype=np.int32)
+        self.passive_opinion = np.empty(shape)
+        self.accepted = np.empty(shape, dtype=bool)
+        self.result = np.empty(shape, dtype=bool)
+        self.total_payout = np.empty(shape, dtype=np.result_type(p_g, p_b))
+
+    def initialize_agents(self):
+        R, N = self.num_replicates, self.num_agents
+        self.reliabilities = np.stack([sample_reliabilities(rng, self.r_dist, N) for rng in self.rngs])
+        self.strategy_codes = np.stack([assign_strategies(self.mix, N, rng) for rng in self.rngs])
+        self.opinions = np.full((R, N, N), EXPECTED_RELIABILITY[self.r_dist])
+        self.payoff_threshold = payoff_threshold(self.r_dist, self.p_g, self.p_b)
+
+    def draw_block(self, size: int):
+        '''
+        draw the next size encounters of every replicate: a distinct (active, passive)
+        pair and a uniform for the encounter outcome, exactly as simulation.Game draws them
+        (see sampling.draw_encounters), so the draws do not depend on block_size.
+        returns:
+            active, passive, uniforms: arrays of shape (R, size)
+        '''
+        draws = [draw_encounters(rng, self.num_agents, size) for rng in self.rngs]
+        active, passive, uniforms = (np.stack(column) for column in zip(*draws))
+        return active, passive, uniforms
+
+    def step(self, active, passive, uniforms, total_payout):
+        '''
+        play one encounter in every replicate
+        args:
+            active, passive, uniforms: (R,) arrays of this step's draws
+            total_payout: (R,) running payout, updated in place
+        returns:
+            opinion, accepted, success: (R,) arrays
+        '''
+        reps = np.arange(self.num_replicates)
+        opinions = self.opinions
+        opinion = opinions[reps, active, passive]
+        passive_reliability = self.reliabilities[reps, passive]
+        accepted = decide(self.strategy_codes[reps, active], opinion, passive_reliability, self.p_g, self.p_b, self.payoff_threshold)
+        success = accepted & (uniforms < passive_reliability)
+        total_payout += np.where(accepted, np.where(success, self.p_g, self.p_b), 0)
+
+        # direct update of the active agent's opinion of the passive agent
+        updated = (1 - self.alpha_direct) * opinion + self.alpha_direct * success
+        opinions[reps, active, passive] = np.where(accepted, updated, opinion)
+
+        # indirect update: after a good encounter, blend the passive agent's row into the active agent's row,
+        # leaving the active agent's own column and the passive agent's column untouched
+        good = np.flatnonzero(success)
+        if good.size:
+            a, p = active[good], passive[good]
+            rows = opinions[good, a]
+            blended = (1 - self.alpha_indirect) * rows
+            blended += self.alpha_indirect * opinions[good, p]
+            k = np.arange(good.size)
+            blended[k, a] = rows[k, a]
+            blended[k, p] = rows[k, p]
+            opinions[good, a] = blended
+        return opinion, accepted, success
+
+    def run(self) -> np.ndarray:
+        self.initialize_agents()
+        total_payout = np.zeros(self.num_replicates, dtype=self.total_payout.dtype)
+        for start in range(0, self.num_interactions, self.block_size):
+            size = min(self.block_size, self.num_interactions - start)
+            active, passive, uniforms = self.draw_block(size)
+            for s in range(size):
+                t = start + s
+                opinion, accepted, success = self.step(active[:, s], passive[:, s], uniforms[:, s], total_payout)
+                self.active_ids[:, t] = active[:, s]
+                self.passive_ids[:, t] = passive[:, s]
+                self.passive_opinion[:, t] = opinion
+                self.accepted[:, t] = accepted
+                self.result[:, t] = success
+                self.total_payout[:, t] = total_payout
+        return self.total_payout
+
+    def payoffs(self) -> np.ndarray:
+        '''
+        returns (R, N) per-agent payoffs, aggregated with one np.bincount over all replicates
+        '''
+        R, N = self.num_replicates, self.num_agents
+        payout = np.where(self.result, self.p_g, self.p_b) * self.accepted
+        offsets = (np.arange(R) * N)[:, None]
+        payoffs = np.bincount((self.active_ids + offsets).ravel(), weights=payout.ravel(), minlength=R * N)
+        payoffs += np.bincount((self.passive_ids + offsets).ravel(), weights=payout.ravel(), minlength=R * N)
+        return payoffs.reshape(R, N).astype(self.total_payout.dtype)
+
+    def strategy_payoffs(self) -> pd.DataFrame:
+        '''
+        returns the per-strategy payoff summary (see strategies.strategy_summary) of every replicate, one row per
+        replicate and strategy
+        '''
+        payoffs = self.payoffs()
+        summaries = [strategy_summary(self.strategy_codes[r], payoffs[r]) for r in range(self.num_replicates)]
+        return pd.concat(summaries, keys=range(self.num_replicates), names=['replicate']).reset_index(level=0).reset_index(drop=True)
+
+    def replicate_dataframe(self, r: int) -> pd.DataFrame:
+        reliabilities = self.reliabilities[r]
+        return pd.DataFrame({
+            'active_id': self.active_ids[r],
+            'passive_id': self.passive_ids[r],
+            'active_reliability': reliabilities[self.active_ids[r]],
+            'passive_reliability': reliabilities[self.passive_ids[r]],
+            'passive_opinion': self.passive_opinion[r],
+            'accepted': self.accepted[r],
+            'result': self.result[r],
+            'total_payout': self.total_payout[r]
+        })
+
+
+def main():
+    seeds = spawn_seeds(None, Config.num_replicates)
+    game = BatchGame(seeds, num_agents=Config.num_agents, r_dist=Config.r_dist,
+                     num_interactions=Config.num_encounters, p_g=Config.p_g, p_b=Config.p_b,
+                     alpha_direct=Config.alpha_direct, alpha_indirect=Config.alpha_indirect, strategies=Config.strategies)
+    trajectories = game.run()
+    print("Replicate seeds: ")
+    print(seeds)
+    print("Final total payout per replicate: ")
+    print(trajectories[:, -1].tolist())
+    print("Mean final total payout:")
+    print(trajectories[:, -1].mean())
+
+
+if __name__ == "__main__":
+    main()
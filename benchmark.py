@@ -0,0 +1,502 @@
+'''
+This Python library benchmarks the simulations, so performance changes can be
+measured and compared between commits.
+
+Every case of a grid (game, number of agents, run length, reliability
+distribution, topology) runs a seeded Game in a fresh worker process, and
+records its setup and run time, throughput in encounters/s and the worker's
+peak resident memory. A separate micro-benchmark times
+LearnTrustAgent.handle_encounter and splits one encounter into its phases:
+sampling, decision, opinion update and logging.
+
+Results are written as JSON. compare() matches the cases of two result files
+and flags throughput drops and memory growth beyond a tolerance. The scaling
+report times the concurrent mode of simulation.Game (see concurrency.py) at
+several thread counts and reports its speedup over the serial loop. The
+precision report plays the same seeded game with each opinion storage precision
+(see trust_matrix.py) and reports how far its decisions and payoffs move from
+float64, next to the memory of the store and the throughput. The startup report
+times short games from a cold interpreter, as a sweep launches them, and the cost
+of recording a run description as the descriptions index grows:
+
+    python benchmark.py [--quick] [results.json]
+    python benchmark.py compare baseline.json results.json
+    python benchmark.py scaling [--quick] [results.json]
+    python benchmark.py precision [--quick] [results.json]
+    python benchmark.py startup [--quick] [results.json]
+'''
+
+import contextlib
+import itertools
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import numpy as np
+from config import Config
+
+FORMAT_VERSION = 1
+GAMES = ('simulation', 'simulation_failures')
+# parameters that identify a case, in the order they are expanded
+CASE_PARAMS = ['game', 'num_agents', 'num_interactions', 'r_dist', 'topology']
+# a dense store holds num_agents ** 2 opinions, so larger games are only benchmarked on a contact graph
+MAX_DENSE_AGENTS = 10000
+
+
+def expand_cases(grid: dict) -> list:
+    '''
+    turn a benchmark grid into a list of cases, in a fixed order
+    args:
+        grid: dict mapping each of CASE_PARAMS to the list of values to benchmark
+    returns:
+        list of dicts, one value per parameter. dense cases (topology None) with more than
+        MAX_DENSE_AGENTS agents are left out
+    '''
+    cases = []
+    for values in itertools.product(*(grid[name] for name in CASE_PARAMS)):
+        case = dict(zip(CASE_PARAMS, values))
+        if case['game'] not in GAMES:
+            raise ValueError(f'unknown game: {case["game"]}, expected one of {GAMES}')
+        if case['topology'] is None and case['num_agents'] > MAX_DENSE_AGENTS:
+            continue
+        cases.append(case)
+    return cases
+
+
+def case_key(case: dict) -> str:
+    return '_'.join(f'{name}={case[name]}' for name in CASE_PARAMS)
+
+
+def peak_rss_mb() -> float:
+    '''
+    returns the peak resident memory of this process so far, in MB
+    '''
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / 2 ** 20 if sys.platform == 'darwin' else peak / 2 ** 10
+
+
+def run_case(case: dict, seed: int = 0) -> dict:
+    '''
+    time one Game. runs in a fresh worker process, so the peak memory is the case's own
+    returns:
+        the case with its timings: setup_seconds (agents and stores), run_seconds (the encounters),
+        encounters, encounters_per_sec and peak_rss_mb. for simulation_failures, encounters counts
+        the accepted attempts of all trials
+    '''
+    if case['game'] == 'simulation':
+        from simulation import Game
+    else:
+        from simulation_failures import Game
+    with tempfile.TemporaryDirectory() as log_dir, open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        kwargs = {'agent_log_dir': os.path.join(log_dir, 'agents')} if case['game'] == 'simulation' else {}
+        start = time.perf_counter()
+        game = Game(num_agents=case['num_agents'], num_interactions=case['num_interactions'], r_dist=case['r_dist'],
+                    topology=case['topology'], seed=seed, log_sink='null', log_echo=False, log_dir=log_dir, **kwargs)
+        game.initialize_agents()
+        setup_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        game.play()
+        run_seconds = time.perf_counter() - start
+    if case['game'] == 'simulation':
+        encounters = game.num_interactions
+    else:
+        encounters = int(game.all_attempt_counts.sum())
+    return dict(case, seed=seed, setup_seconds=setup_seconds, run_seconds=run_seconds, encounters=encounters,
+                encounters_per_sec=encounters / run_seconds if run_seconds else float('inf'), peak_rss_mb=peak_rss_mb())
+
+
+def time_encounters(num_agents: int, num_encounters: int, r_dist: str = 'uniform', seed: int = 0) -> dict:
+    '''
+    micro-benchmark of LearnTrustAgent.handle_encounter over a game's agents, first as one call and then
+    split into the phases of an encounter, each timed on its own
+    returns:
+        dict with handle_encounter_per_sec and the seconds spent per phase: sampling (drawing the pair and
+        outcome), decision (reading the opinion and deciding), update (direct and indirect opinion updates)
+        and logging (recording the encounter and writing it to a text log)
+    '''
+    from simulation import Game
+    from log_sinks import TextSink
+    from recorder import EncounterRecorder
+    with tempfile.TemporaryDirectory() as log_dir, open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        game = Game(num_agents=num_agents, num_interactions=num_encounters, r_dist=r_dist, seed=seed, log_sink='null',
+                    log_echo=False, log_dir=log_dir, agent_log_dir=os.path.join(log_dir, 'agents'))
+        game.initialize_agents()
+        agents, sampler = game.agents, game.sampler
+        draws = [sampler.next() for _ in range(num_encounters)]
+
+        start = time.perf_counter()
+        for active_id, passive_id, reliability_sample in draws:
+            passive_agent = agents[passive_id]
+            agents[active_id].handle_encounter(passive_id, passive_agent.reliability, passive_agent.registers, game.p_g, game.p_b,
+                                               reliability_sample)
+        handle_seconds = time.perf_counter() - start
+
+        # the same encounters again, phase by phase
+        phases = dict.fromkeys(['sampling', 'decision', 'update', 'logging'], 0.0)
+        recorder = EncounterRecorder(num_encounters)
+        log = TextSink(os.path.join(log_dir, 'log.txt'))
+        clock = time.perf_counter
+        for i in range(num_encounters):
+            t0 = clock()
+            active_id, passive_id, reliability_sample = sampler.next()
+            t1 = clock()
+            active_agent, passive_agent = agents[active_id], agents[passive_id]
+            opinion = active_agent.get_opinion(passive_id)
+            accepted = active_agent.decide(opinion, game.p_g, game.p_b, passive_agent.reliability)
+            success = accepted and reliability_sample < passive_agent.reliability
+            t2 = clock()
+            if accepted:
+                active_agent.update_direct(passive_id, success)
+                if success:
+                    active_agent.adopt_opinions(passive_id, passive_agent.registers)
+            t3 = clock()
+            recorder.append(active_id, passive_id, active_agent.reliability, passive_agent.reliability, opinion, accepted, success, 0)
+            log.write((i, active_id, passive_id, active_agent.reliability, passive_agent.reliability, opinion, accepted, success, 0))
+            t4 = clock()
+            phases['sampling'] += t1 - t0
+            phases['decision'] += t2 - t1
+            phases['update'] += t3 - t2
+            phases['logging'] += t4 - t3
+        log.close()
+    return {'num_agents': num_agents, 'num_encounters': num_encounters, 'r_dist': r_dist,
+            'handle_encounter_per_sec': num_encounters / handle_seconds, 'phase_seconds': phases}
+
+
+def environment() -> dict:
+    '''
+    returns the commit and software versions a result was measured on
+    '''
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    from concurrency import gil_enabled
+    return {'commit': commit, 'python': platform.python_version(), 'numpy': np.__version__,
+            'platform': platform.platform(), 'cpu_count': os.cpu_count(), 'gil_enabled': gil_enabled()}
+
+
+def thread_scaling(num_agents: int, num_encounters: int, thread_counts: list, r_dist: str = 'uniform', seed: int = 0) -> list:
+    '''
+    time simulation.Game at each thread count; 1 thread is the serial encounter loop. metric snapshots are off,
+    so batches are only cut at thread_batch_size
+    returns:
+        list of dicts, one per thread count, with run_seconds, encounters_per_sec, speedup and efficiency
+        (speedup per thread) over the first thread count, normally the serial loop, and whether the final opinions
+        and payout match that run
+    '''
+    from simulation import Game
+    rows = []
+    with tempfile.TemporaryDirectory() as log_dir, open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        for num_threads in thread_counts:
+            game = Game(num_agents=num_agents, num_interactions=num_encounters, r_dist=r_dist, seed=seed, log_sink='null',
+                        log_echo=False, metrics_every=0, keep_history=False, num_threads=num_threads, log_dir=log_dir,
+                        agent_log_dir=os.path.join(log_dir, 'agents'))
+            game.initialize_agents()
+            start = time.perf_counter()
+            game.play()
+            run_seconds = time.perf_counter() - start
+            if not rows:
+                serial_seconds, serial_opinions, serial_payout = run_seconds, game.trust.get_state(), game.total_payout
+            rows.append({'num_agents': num_agents, 'num_encounters': num_encounters, 'num_threads': num_threads,
+                         'run_seconds': run_seconds, 'encounters_per_sec': num_encounters / run_seconds,
+                         'speedup': serial_seconds / run_seconds, 'efficiency': serial_seconds / run_seconds / num_threads,
+                         'matches_serial': bool(game.total_payout == serial_payout and
+                                                np.array_equal(game.trust.get_state(), serial_opinions))})
+    return rows
+
+
+def run_scaling(grid: dict, seed: int = 0) -> dict:
+    '''
+    run thread_scaling for every game size of a grid with 'num_agents', 'num_encounters' and 'num_threads' lists
+    returns:
+        results dict with 'environment' and 'scaling' rows
+    '''
+    results = {'version': FORMAT_VERSION, 'environment': environment(), 'scaling': []}
+    thread_counts = sorted(set([1] + list(grid['num_threads'])))
+    for num_agents, num_encounters in itertools.product(grid['num_agents'], grid['num_encounters']):
+        rows = thread_scaling(num_agents, num_encounters, thread_counts, seed=seed)
+        results['scaling'].extend(rows)
+        print(f'{num_agents} agents, {num_encounters} encounters:')
+        for row in rows:
+            print(f'  {row["num_threads"]:>3} threads: {row["encounters_per_sec"]:>9.0f} encounters/s, speedup {row["speedup"]:.2f}x, '
+                  f'efficiency {row["efficiency"]:.0%}{"" if row["matches_serial"] else ", MISMATCH with the serial run"}')
+    env = results['environment']
+    print(f'{env["cpu_count"]} CPUs, GIL {"enabled" if env["gil_enabled"] else "disabled"}')
+    return results
+
+
+def precision_effects(num_agents: int, num_encounters: int, precisions: list, topology=None, r_dist: str = 'uniform',
+                      seed: int = 0) -> list:
+    '''
+    play simulation.Game with each opinion storage precision on the same seed, so every precision sees the same
+    encounters, and compare it with float64
+    returns:
+        list of dicts, one per precision, with store_bytes, encounters_per_sec, acceptance_rate and total_payout, and
+        versus float64: decision_mismatch_rate (fraction of encounters decided differently), first_mismatch (first
+        encounter decided differently, None if none), payout_change (relative change of the total payout),
+        agent_payoff_mae (mean absolute change of an agent's payoff) and opinion_mae (mean absolute change of an
+        opinion at the end of the game)
+    '''
+    from simulation import Game
+    rows = []
+    with tempfile.TemporaryDirectory() as log_dir, open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        for precision in ['float64'] + [precision for precision in precisions if precision != 'float64']:
+            game = Game(num_agents=num_agents, num_interactions=num_encounters, r_dist=r_dist, topology=topology, seed=seed,
+                        precision=precision, log_sink='null', log_echo=False, metrics_every=0, log_dir=log_dir,
+                        agent_log_dir=os.path.join(log_dir, 'agents'))
+            game.initialize_agents()
+            start = time.perf_counter()
+            game.play()
+            run_seconds = time.perf_counter() - start
+            accepted = game.encounter_history.column('accepted').copy()
+            payoffs, opinions = game.metrics.payoffs.copy(), game.trust.off_diagonal()
+            if not rows:
+                exact_accepted, exact_payoffs, exact_opinions, exact_payout = accepted, payoffs, opinions, game.total_payout
+            mismatches = np.flatnonzero(accepted != exact_accepted)
+            rows.append({'num_agents': num_agents, 'num_encounters': num_encounters, 'topology': topology, 'precision': precision,
+                         'store_bytes': game.trust.nbytes, 'encounters_per_sec': num_encounters / run_seconds,
+                         'acceptance_rate': float(accepted.mean()), 'total_payout': float(game.total_payout),
+                         'decision_mismatch_rate': len(mismatches) / num_encounters,
+                         'first_mismatch': int(mismatches[0]) if len(mismatches) else None,
+                         'payout_change': (game.total_payout - exact_payout) / abs(exact_payout) if exact_payout else 0.0,
+                         'agent_payoff_mae': float(np.abs(payoffs - exact_payoffs).mean()),
+                         'opinion_mae': float(np.abs(opinions - exact_opinions).mean()) if len(opinions) else 0.0})
+    return rows
+
+
+def run_precision(grid: dict, seed: int = 0) -> dict:
+    '''
+    run precision_effects for every game of a grid with 'num_agents', 'num_encounters', 'topology' and 'precision' lists
+    returns:
+        results dict with 'environment' and 'precision' rows
+    '''
+    results = {'version': FORMAT_VERSION, 'environment': environment(), 'precision': []}
+    for num_agents, num_encounters, topology in itertools.product(grid['num_agents'], grid['num_encounters'], grid['topology']):
+        rows = precision_effects(num_agents, num_encounters, grid['precision'], topology, seed=seed)
+        results['precision'].extend(rows)
+        print(f'{num_agents} agents, {num_encounters} encounters, topology {topology}:')
+        for row in rows:
+            first = row['first_mismatch']
+            print(f'  {row["precision"]:>7}: {row["store_bytes"] / 2 ** 20:>8.2f} MB, {row["encounters_per_sec"]:>8.0f} encounters/s, '
+                  f'acceptance {row["acceptance_rate"]:.3f}, {row["decision_mismatch_rate"]:.2%} decisions changed'
+                  f'{"" if first is None else f" (first at {first})"}, payout {row["total_payout"]:.0f} ({row["payout_change"]:+.2%}), '
+                  f'opinion MAE {row["opinion_mae"]:.2e}')
+    return results
+
+
+# run in a fresh interpreter by cold_start: times the import of simulation.py and one short game, and prints them as JSON
+STARTUP_SCRIPT = '''
+import importlib, json, sys, time
+start = time.perf_counter()
+Game = importlib.import_module(sys.argv[1]).Game
+imported = time.perf_counter()
+game = Game(**json.loads(sys.argv[2]))
+game.initialize_agents()
+initialized = time.perf_counter()
+game.play()
+end = time.perf_counter()
+print(json.dumps({'import_seconds': imported - start, 'setup_seconds': initialized - imported, 'run_seconds': end - initialized,
+                  'pandas_loaded': 'pandas' in sys.modules}))
+'''
+
+
+def cold_start(num_runs: int, run_format: str, num_agents: int, num_encounters: int, seed: int = 0, game: str = 'simulation') -> dict:
+    '''
+    run num_runs short runs of a game ('simulation' or 'simulation_failures', where num_encounters counts trials) one
+    after the other, each in a fresh interpreter and with its own run_no in one log directory, as a sweep would
+    returns:
+        dict with the mean process_seconds (interpreter start to exit), import_seconds, setup_seconds and run_seconds
+        per run, the fastest process_seconds, and whether any run imported pandas
+    '''
+    root = os.path.dirname(os.path.abspath(__file__))
+    timings = []
+    with tempfile.TemporaryDirectory() as log_dir:
+        for run_no in range(num_runs):
+            kwargs = {'run_no': run_no, 'num_agents': num_agents, 'num_interactions': num_encounters, 'seed': seed + run_no,
+                      'run_format': run_format, 'log_sink': 'null', 'log_echo': False, 'log_dir': log_dir}
+            if game == 'simulation':
+                kwargs.update(metrics_every=0, agent_log_dir=os.path.join(log_dir, 'agents'))
+            start = time.perf_counter()
+            completed = subprocess.run([sys.executable, '-c', STARTUP_SCRIPT, game, json.dumps(kwargs)], cwd=root, capture_output=True,
+                                       text=True, check=True)
+            process_seconds = time.perf_counter() - start
+            timings.append(dict(json.loads(completed.stdout.strip().splitlines()[-1]), process_seconds=process_seconds))
+    row = {'game': game, 'run_format': run_format, 'num_runs': num_runs, 'num_agents': num_agents, 'num_encounters': num_encounters}
+    for name in ('process_seconds', 'import_seconds', 'setup_seconds', 'run_seconds'):
+        row[name] = float(np.mean([timing[name] for timing in timings]))
+    row['min_process_seconds'] = min(timing['process_seconds'] for timing in timings)
+    row['pandas_loaded'] = any(timing['pandas_loaded'] for timing in timings)
+    return row
+
+
+def description_costs(num_descriptions: int, num_records: int = 20) -> dict:
+    '''
+    time recording a run description into an index that already holds num_descriptions runs, and exporting all of
+    them to the descriptions CSV, which is what every run used to pay
+    returns:
+        dict with the mean record_seconds and export_seconds
+    '''
+    from descriptions import record_game_description, export_game_descriptions
+    with tempfile.TemporaryDirectory() as log_dir:
+        path = os.path.join(log_dir, 'game_descriptions.csv')
+        description = {'num_agents': 100, 'r_dist': 'uniform', 'agent_type': 'learn_trust', 'num_interactions': 1000, 'p_g': 2,
+                       'p_b': -2, 'alpha_direct': 0.1, 'alpha_indirect': 0.1, 'seed': 2 ** 62, 'pairing': 'uniform',
+                       'topology': None, 'precision': 'float64'}
+        for run_no in range(num_descriptions):
+            record_game_description(path, dict(description, run_no=run_no))
+        start = time.perf_counter()
+        for run_no in range(num_descriptions, num_descriptions + num_records):
+            record_game_description(path, dict(description, run_no=run_no))
+        record_seconds = (time.perf_counter() - start) / num_records
+        start = time.perf_counter()
+        export_game_descriptions(path)
+        export_seconds = time.perf_counter() - start
+    return {'num_descriptions': num_descriptions, 'record_seconds': record_seconds, 'export_seconds': export_seconds}
+
+
+def run_startup(grid: dict, seed: int = 0) -> dict:
+    '''
+    run cold_start for every game and run format of a grid ('game', 'run_format', 'num_runs', 'num_agents', 'num_encounters'),
+    and description_costs for every index size of its 'num_descriptions'
+    returns:
+        results dict with 'environment', 'startup' and 'descriptions' rows
+    '''
+    results = {'version': FORMAT_VERSION, 'environment': environment(), 'startup': [], 'descriptions': []}
+    for game, run_format in itertools.product(grid['game'], grid['run_format']):
+        row = cold_start(grid['num_runs'], run_format, grid['num_agents'], grid['num_encounters'], seed=seed, game=game)
+        results['startup'].append(row)
+        print(f'{game}, {run_format:>4} tables: {row["process_seconds"] * 1e3:.0f} ms per run (fastest {row["min_process_seconds"] * 1e3:.0f} ms): '
+              f'import {row["import_seconds"] * 1e3:.0f} ms, setup {row["setup_seconds"] * 1e3:.1f} ms, '
+              f'run {row["run_seconds"] * 1e3:.1f} ms, pandas {"loaded" if row["pandas_loaded"] else "not loaded"}')
+    for num_descriptions in grid['num_descriptions']:
+        row = description_costs(num_descriptions)
+        results['descriptions'].append(row)
+        print(f'{num_descriptions} runs recorded: {row["record_seconds"] * 1e3:.2f} ms to record one more, '
+              f'{row["export_seconds"] * 1e3:.1f} ms to export the CSV')
+    return results
+
+
+def run_benchmarks(grid: dict, encounter_grid: dict, seed: int = 0) -> dict:
+    '''
+    run every case of a grid, one fresh worker process per case, and the handle_encounter micro-benchmarks
+    args:
+        grid: dict mapping each of CASE_PARAMS to a list of values, see expand_cases
+        encounter_grid: dict with lists of 'num_agents' and 'num_encounters' for time_encounters
+        seed: seed of every game
+    returns:
+        results dict with 'environment', 'cases' and 'encounters', as written by write_results
+    '''
+    cases = expand_cases(grid)
+    results = {'version': FORMAT_VERSION, 'environment': environment(), 'cases': [], 'encounters': []}
+    # cases run one at a time, so they do not compete for cores or memory bandwidth
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn'), max_tasks_per_child=1) as executor:
+        for done, case in enumerate(cases, 1):
+            row = executor.submit(run_case, case, seed).result()
+            results['cases'].append(row)
+            print(f'[{done}/{len(cases)}] {case_key(case)}: {row["encounters_per_sec"]:.0f} encounters/s, '
+                  f'{row["peak_rss_mb"]:.0f} MB peak')
+    for num_agents, num_encounters in itertools.product(encounter_grid['num_agents'], encounter_grid['num_encounters']):
+        row = time_encounters(num_agents, num_encounters, seed=seed)
+        results['encounters'].append(row)
+        phases = ', '.join(f'{name} {seconds / num_encounters * 1e6:.1f} us' for name, seconds in row['phase_seconds'].items())
+        print(f'handle_encounter, {num_agents} agents: {row["handle_encounter_per_sec"]:.0f}/s ({phases} per encounter)')
+    return results
+
+
+def write_results(path: str, results: dict):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(results, f, indent=1)
+    os.replace(tmp_path, path)
+
+
+def load_results(path: str) -> dict:
+    with open(path) as f:
+        return json.load(f)
+
+
+def compare(baseline: dict, current: dict, tolerance: float = 0.1) -> list:
+    '''
+    compare two benchmark results case by case
+    args:
+        baseline, current: results dicts, e.g. from load_results
+        tolerance: relative throughput drop or memory growth that counts as a regression
+    returns:
+        list of regressions, each a dict with the case key, the metric, both values and the relative change
+    '''
+    regressions = []
+    baseline_cases = {case_key(case): case for case in baseline['cases']}
+    for case in current['cases']:
+        key = case_key(case)
+        if key not in baseline_cases:
+            continue
+        for metric, higher_is_better in (('encounters_per_sec', True), ('peak_rss_mb', False)):
+            before, after = baseline_cases[key][metric], case[metric]
+            change = (after - before) / before if before else 0.0
+            if (higher_is_better and change < -tolerance) or (not higher_is_better and change > tolerance):
+                regressions.append({'case': key, 'metric': metric, 'baseline': before, 'current': after, 'change': change})
+    baseline_encounters = {row['num_agents']: row for row in baseline.get('encounters', [])}
+    for row in current.get('encounters', []):
+        before_row = baseline_encounters.get(row['num_agents'])
+        if before_row is None:
+            continue
+        before, after = before_row['handle_encounter_per_sec'], row['handle_encounter_per_sec']
+        change = (after - before) / before
+        if change < -tolerance:
+            regressions.append({'case': f'handle_encounter_num_agents={row["num_agents"]}', 'metric': 'handle_encounter_per_sec',
+                                'baseline': before, 'current': after, 'change': change})
+    return regressions
+
+
+def main():
+    args = sys.argv[1:]
+    if args and args[0] == 'compare':
+        if len(args) != 3:
+            print("Arg format: python benchmark.py compare [baseline results] [new results]")
+            return
+        regressions = compare(load_results(args[1]), load_results(args[2]), Config.bench_tolerance)
+        for regression in regressions:
+            print(f'REGRESSION {regression["case"]} {regression["metric"]}: {regression["baseline"]:.4g} -> '
+                  f'{regression["current"]:.4g} ({regression["change"]:+.1%})')
+        print(f'{len(regressions)} regressions beyond {Config.bench_tolerance:.0%}')
+        sys.exit(1 if regressions else 0)
+    quick = '--quick' in args
+    args = [arg for arg in args if arg != '--quick']
+    seed = Config.seed if Config.seed is not None else 0
+    if args and args[0] == 'scaling':
+        path = args[1] if len(args) > 1 else os.path.join(Config.bench_dir, f'scaling_{int(time.time())}.json')
+        results = run_scaling(Config.bench_quick_scaling_grid if quick else Config.bench_scaling_grid, seed=seed)
+        write_results(path, results)
+        print(f'results written to {path}')
+        return
+    if args and args[0] == 'startup':
+        path = args[1] if len(args) > 1 else os.path.join(Config.bench_dir, f'startup_{int(time.time())}.json')
+        results = run_startup(Config.bench_quick_startup_grid if quick else Config.bench_startup_grid, seed=seed)
+        write_results(path, results)
+        print(f'results written to {path}')
+        return
+    if args and args[0] == 'precision':
+        path = args[1] if len(args) > 1 else os.path.join(Config.bench_dir, f'precision_{int(time.time())}.json')
+        results = run_precision(Config.bench_quick_precision_grid if quick else Config.bench_precision_grid, seed=seed)
+        write_results(path, results)
+        print(f'results written to {path}')
+        return
+    grid = Config.bench_quick_grid if quick else Config.bench_grid
+    encounter_grid = Config.bench_quick_encounter_grid if quick else Config.bench_encounter_grid
+    path = args[0] if args else os.path.join(Config.bench_dir, f'results_{int(time.time())}.json')
+    results = run_benchmarks(grid, encounter_grid, seed=seed)
+    write_results(path, results)
+    print(f'results written to {path}')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+'''
+This Python library saves and restores checkpoints of long-running games
+(simulation.py and simulation_failures.py), so a run that dies partway
+through can be resumed and finishes exactly as if it had never stopped.
+
+A checkpoint is one uncompressed .npz file: the game's arrays (reliabilities,
+opinions, the current block of pre-drawn random numbers, the encounter
+history so far, running metrics) plus a JSON 'meta' entry with the scalars
+(game parameters, random generator state, total payout, next encounter,
+log file positions). The game copies its state on the hot path; serializing
+and writing it happens in a background thread, into a temporary file that
+then atomically replaces the previous checkpoint.
+
+Resume a run with `python checkpoint.py <checkpoint.npz>` or resume(path).
+'''
+
+import importlib
+import json
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+FORMAT_VERSION = 1
+
+
+def to_json(value):
+    # numpy scalars in game state, e.g. payouts, are stored as plain python numbers
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f'{type(value).__name__} is not JSON serializable')
+
+
+def save_checkpoint(path: str, arrays: dict, meta: dict):
+    '''
+    write a checkpoint atomically: readers see either the previous checkpoint or this one, never a partial file
+    args:
+        path: checkpoint file (.npz)
+        arrays: dict mapping name to a numpy array
+        meta: JSON-serializable scalars
+    '''
+    meta = dict(meta, version=FORMAT_VERSION)
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'wb') as f:
+        np.savez(f, meta=np.array(json.dumps(meta, default=to_json)), **arrays)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def load_checkpoint(path: str):
+    '''
+    returns (arrays, meta) of a checkpoint written by save_checkpoint
+    '''
+    with np.load(path, allow_pickle=False) as f:
+        arrays = {name: f[name] for name in f.files if name != 'meta'}
+        meta = json.loads(str(f['meta']))
+    return arrays, meta
+
+
+class CheckpointWriter:
+    '''
+    Writes checkpoints in a background thread, one at a time and in order.
+
+    Methods
+    -------
+    submit(path, arrays, meta)
+        queue a checkpoint. the arrays must already be copies the game no longer mutates
+    close()
+        wait for the last checkpoint to be written
+    '''
+
+    def __init__(self):
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.pending = None
+
+    def submit(self, path: str, arrays: dict, meta: dict):
+        # at most one checkpoint is in flight: this bounds the memory held by copies and surfaces write errors.
+        # the game only waits here if writing a checkpoint takes longer than playing up to the next one
+        if self.pending is not None:
+            self.pending.result()
+        self.pending = self.executor.submit(save_checkpoint, path, arrays, meta)
+
+    def close(self):
+        if self.pending is not None:
+            self.pending.result()
+            self.pending = None
+        self.executor.shutdown()
+
+
+def rng_state(rng: np.random.Generator) -> dict:
+    return rng.bit_generator.state
+
+
+def set_rng_state(rng: np.random.Generator, state: dict):
+    rng.bit_generator.state = state
+
+
+def resume(path: str, **kwargs):
+    '''
+    resume the game a checkpoint was taken from and run it to the end
+    args:
+        path: checkpoint file
+        kwargs: other Game arguments, e.g. checkpoint_every
+    returns:
+        the Game, after it has been run
+    '''
+    _, meta = load_checkpoint(path)
+    module = importlib.import_module(meta['game'])
+    return module.resume(path, **kwargs)
+
+
+def main():
+    if len(sys.argv) != 2:
+        print("Arg format: python checkpoint.py [checkpoint file]")
+        return
+    game = resume(sys.argv[1])
+    print("Resumed run finished. Total payout:")
+    print(game.total_payout)
+
+
+if __name__ == "__main__":
+    main()
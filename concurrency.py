@@ -0,0 +1,121 @@
+'''
+This Python library runs the encounters of a game (simulation.py) on a thread
+pool, against the game's shared opinion store.
+
+A batch of sampled encounters is partitioned into conflict-free waves: no agent
+appears twice in a wave, and an encounter is placed in the first wave after
+every earlier encounter of its two agents. The encounters of a wave read and
+write disjoint rows of the store, so they can run in any order, or at the same
+time, and a batch played wave by wave ends in exactly the state of the same
+batch played one encounter at a time. Rows are also guarded by striped locks,
+so the store stays consistent if conflicting encounters are ever run together.
+
+Threads only speed up the opinion updates where they run in parallel: NumPy
+releases the GIL inside the row blends of large games, and a free-threaded
+Python runs the whole encounter in parallel.
+'''
+
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+
+def conflict_free_waves(active, passive, num_agents: int) -> list:
+    '''
+    partition a batch of encounters into waves in which no agent appears twice
+    args:
+        active, passive: agents of each encounter of the batch, in the order they were sampled
+        num_agents: number of agents in the game
+    returns:
+        list of arrays of encounter indices, one per wave, each in sampled order. playing the waves
+        one after the other is equivalent to playing the batch in sampled order
+    '''
+    last = [0] * num_agents # per agent, 1 + the wave of its latest encounter so far
+    levels = []
+    for a, p in zip(np.asarray(active).tolist(), np.asarray(passive).tolist()):
+        level = max(last[a], last[p])
+        levels.append(level)
+        last[a] = last[p] = level + 1
+    levels = np.array(levels, dtype=np.intp)
+    order = np.argsort(levels, kind='stable')
+    return np.split(order, np.flatnonzero(np.diff(levels[order])) + 1) if len(order) else []
+
+
+def gil_enabled() -> bool:
+    is_gil_enabled = getattr(sys, '_is_gil_enabled', None)
+    return is_gil_enabled() if is_gil_enabled is not None else True
+
+
+class RowLocks:
+    '''
+    Lock striping over the rows of a trust store: row i is guarded by lock i % num_stripes.
+
+    Methods
+    -------
+    acquire(i, j)
+        lock the stripes of rows i and j, in stripe order so two threads cannot deadlock
+    release(stripes)
+        unlock the stripes returned by acquire
+    '''
+
+    def __init__(self, num_rows: int, num_stripes: int = 64):
+        self.num_stripes = max(min(num_stripes, num_rows), 1)
+        self.locks = [threading.Lock() for _ in range(self.num_stripes)]
+
+    def acquire(self, i: int, j: int) -> tuple:
+        first, second = sorted((i % self.num_stripes, j % self.num_stripes))
+        self.locks[first].acquire()
+        if second != first:
+            self.locks[second].acquire()
+        return first, second
+
+    def release(self, stripes: tuple):
+        first, second = stripes
+        if second != first:
+            self.locks[second].release()
+        self.locks[first].release()
+
+
+class EncounterPool:
+    '''
+    Thread pool that plays the encounters of a wave.
+
+    Attributes
+    ----------
+    num_threads : int
+        number of worker threads
+    locks : RowLocks
+        striped locks over the rows of the store
+    min_parallel : int
+        waves with fewer encounters are played on the calling thread, where the hand-off would cost more than it saves
+
+    Methods
+    -------
+    run(play, wave)
+        call play(k) for every encounter index k of the wave, split into one contiguous chunk per thread
+    close()
+        shut the threads down
+    '''
+
+    def __init__(self, num_threads: int, num_rows: int, num_stripes: int = 64, min_parallel: int = 32):
+        self.num_threads = num_threads
+        self.locks = RowLocks(num_rows, num_stripes)
+        self.min_parallel = max(min_parallel, num_threads)
+        self.executor = ThreadPoolExecutor(max_workers=num_threads, thread_name_prefix='encounters')
+
+    @staticmethod
+    def run_chunk(play, chunk):
+        for k in chunk.tolist():
+            play(k)
+
+    def run(self, play, wave: np.ndarray):
+        if len(wave) < self.min_parallel:
+            self.run_chunk(play, wave)
+            return
+        futures = [self.executor.submit(self.run_chunk, play, chunk) for chunk in np.array_split(wave, self.num_threads)]
+        for future in futures:
+            future.result() # re-raises a worker's exception
+
+    def close(self):
+        self.executor.shutdown()
@@ -8,6 +8,85 @@ class Config:
   p_b = -2
   alpha_direct = 0.1
   alpha_indirect = 0.1
+  seed = None # seed of the game's random generator. None draws a fresh one; it is recorded in game_descriptions.csv either way
+  pairing = 'uniform' # who meets whom: 'uniform', 'local:<radius>' (agents on a ring meet neighbours within radius), 'weighted' (agents meet in proportion to pairing_weights) or 'graph' (neighbours in topology; implied by a topology), see sampling.py
+  pairing_weights = None # 'weighted' pairing: one non-negative weight per agent, e.g. a list of num_agents activity levels or degrees; at least two must be positive
+  topology = None # contact graph: None (all-to-all) or 'regular:<degree>', 'small_world:<degree>:<rewire_prob>', 'scale_free:<edges_per_agent>'
+  strategies = 'learn_trust' # agents' decision strategies: one of learn_trust, play_always, play_never, know_reliability, or a mix such as 'learn_trust:0.8,play_never:0.2'
+  log_sink = 'text' # 'null', 'text', 'binary' or 'sampled'
+  log_every = 1 # keep every k-th encounter in the log
+  log_echo = True # also print logged encounters to stdout
+  log_buffer_size = 1000 # encounters buffered before they are formatted and written
+  run_format = 'csv' # output tables as 'csv', memory-mappable 'npy' tables (see runfile.py) or 'both'
+  metrics_every = 100 # take a snapshot of the running metrics every k encounters (0: only at the end)
+  keep_history = True # keep every encounter in memory and in the encounter CSV; False keeps only the running metrics
+  record_attempts = False # simulation_failures.py: record every attempt (encounter log and CSV) instead of only the attempt counts
+  propagation = 'eager' # 'eager' applies indirect opinion updates at once; 'lazy' defers them until the opinions are read (dense games only)
+  precision = 'float64' # storage of the opinions: 'float64', 'float32', 'float16', or 'uint16'/'uint8' fixed-point with stochastic rounding (eager only)
+  num_threads = 1 # simulation.py: play batches of encounters as conflict-free waves on this many threads (see concurrency.py); 1: one at a time
+  thread_batch_size = 1024 # simulation.py: encounters sampled and scheduled together when num_threads > 1
+  # convergence-based run length (see convergence.py), used by both games and by sweep.py. None plays every encounter. otherwise,
+  # 'action' 'stop' ends a game once its opinion error, acceptance rate and payoff have settled and 'thin' only logs every
+  # thin_every-th record from then on. the tolerances bound the change of the opinion error and acceptance rate between the two
+  # compared blocks of at least num_windows windows, and the payoff slope per window. no convergence is declared before encounter
+  # (or trial) start. simulation_failures.py uses windows of every trials; simulation.py its metrics snapshots
+  convergence = None # e.g. {'action': 'stop', 'num_windows': 10, 'opinion_tol': 0.002, 'acceptance_tol': 0.02, 'payoff_slope_tol': 0.005, 'start': 0, 'thin_every': 100, 'every': 25}
+  num_shards = 2 # distributed.py: number of local worker processes the agents' opinions are partitioned over
+  shard_workers = None # distributed.py: list of 'host:port' of running workers (python distributed.py worker <port> [host]); None starts num_shards local workers
+  shard_token = None # distributed.py: shared secret the coordinator sends to shard_workers, which refuse coordinators without it; required for a worker listening beyond localhost. sent unencrypted: keep workers on a trusted network
+  shard_batch_size = 4096 # distributed.py: encounters sampled and scheduled into conflict-free waves at a time
+  shard_compress_level = 1 # distributed.py: zlib level of the messages between coordinator and workers; 0: uncompressed
+  profile_every = 0 # time the phases of 1 in k encounters (simulation.py) or trials (simulation_failures.py), see profiling.py; 0: off
+  checkpoint_every = 0 # save a resumable checkpoint every k encounters (simulation.py) or trials (simulation_failures.py); 0: never
+  rate_dist = 'constant' # event_simulation.py: 'constant' (every agent starts 1 encounter per unit time) or 'exponential' rates
+  gossip_latency = 0.5 # event_simulation.py: mean delay before a partner's opinions are adopted after a good encounter
+  latency_dist = 'exponential' # event_simulation.py: 'constant' or 'exponential' gossip latencies
+  tick = 0.1 # event_simulation.py: length of a scheduler tick; the encounters started in a tick are played as one batch
+  num_replicates = 100 # independent games run together by batch.py
+  sweep_grid = { # Game arguments swept over by sweep.py, every combination is one cell
+    'r_dist': ['uniform', 'normal', 'bernoulli', 'skewed'],
+    'alpha_direct': [0.05, 0.1, 0.2],
+    'alpha_indirect': [0.05, 0.1, 0.2],
+  }
+  sweep_replicates = 1 # independently seeded runs per cell
+  sweep_seed = 0 # root seed that every cell's seed is derived from
+  sweep_dir = 'sweeps/default' # per-cell results, logs and summary.csv
+  bench_grid = { # cases timed by benchmark.py, every combination is one case
+    'game': ['simulation', 'simulation_failures'],
+    'num_agents': [100, 1000, 10000, 100000], # dense games above 10000 agents are skipped, they need a topology
+    'num_interactions': [1000, 10000],
+    'r_dist': ['uniform', 'skewed'],
+    'topology': [None, 'regular:8'],
+  }
+  bench_encounter_grid = {'num_agents': [100, 1000, 10000], 'num_encounters': [20000]} # handle_encounter micro-benchmarks
+  bench_quick_grid = { # benchmark.py --quick
+    'game': ['simulation', 'simulation_failures'],
+    'num_agents': [100, 1000],
+    'num_interactions': [1000],
+    'r_dist': ['uniform'],
+    'topology': [None],
+  }
+  bench_quick_encounter_grid = {'num_agents': [100], 'num_encounters': [5000]}
+  bench_scaling_grid = {'num_agents': [1000, 4000], 'num_encounters': [20000], 'num_threads': [1, 2, 4, 8]} # benchmark.py scaling
+  bench_quick_scaling_grid = {'num_agents': [300], 'num_encounters': [3000], 'num_threads': [1, 2]}
+  bench_precision_grid = { # benchmark.py precision: every precision is compared with float64 on the same games
+    'num_agents': [100, 1000],
+    'num_encounters': [50000],
+    'topology': [None, 'small_world:8:0.1'],
+    'precision': ['float64', 'float32', 'float16', 'uint16', 'uint8']
+  }
+  bench_quick_precision_grid = {'num_agents': [100], 'num_encounters': [5000], 'topology': [None], 'precision': ['float32', 'float16', 'uint8']}
+  bench_startup_grid = { # benchmark.py startup: short games from a cold interpreter, and description index sizes
+    'game': ['simulation', 'simulation_failures'],
+    'run_format': ['npy', 'csv'],
+    'num_runs': 30,
+    'num_agents': 20,
+    'num_encounters': 200,
+    'num_descriptions': [100, 10000]
+  }
+  bench_quick_startup_grid = {'game': ['simulation', 'simulation_failures'], 'run_format': ['npy', 'csv'], 'num_runs': 5, 'num_agents': 20, 'num_encounters': 200, 'num_descriptions': [100]}
+  bench_dir = 'benchmarks' # benchmark results, one JSON file per run
+  bench_tolerance = 0.1 # relative throughput drop or memory growth reported as a regression by benchmark.py compare
 
 class TestConfig:
   run_no = 0
@@ -17,4 +96,34 @@ class TestConfig:
   p_g = 2
   p_b = -2
   alpha_direct = 0.1
-  alpha_indirect = 0.1
\ No newline at end of file
+  alpha_indirect = 0.1
+  seed = 0
+  pairing = 'uniform'
+  pairing_weights = None
+  topology = None
+  strategies = 'learn_trust'
+  log_sink = 'null'
+  log_every = 1
+  log_echo = False
+  log_buffer_size = 1000
+  run_format = 'csv'
+  metrics_every = 100
+  keep_history = True
+  record_attempts = False
+  checkpoint_every = 0
+  profile_every = 0
+  propagation = 'eager'
+  precision = 'float64'
+  num_threads = 1
+  thread_batch_size = 1024
+  convergence = None
+  num_shards = 2
+  shard_workers = None
+  shard_token = None
+  shard_batch_size = 4096
+  shard_compress_level = 1
+  rate_dist = 'constant'
+  gossip_latency = 0.5
+  latency_dist = 'exponential'
+  tick = 0.1
+  num_replicates = 10
@@ -0,0 +1,228 @@
+'''
+This Python library detects when a game has reached its steady state, so a long
+run can stop, or log less, once further encounters no longer change its results.
+
+At the end of every window (metrics_every encounters in simulation.py,
+every trials in simulation_failures.py) the game reports the mean
+absolute error of its opinions versus the true reliabilities, and the number of
+encounters decided and accepted and the payout of the window. The latest windows
+are compared as two blocks of k windows each, and the game has converged once,
+from the older block to the newer one:
+* the opinion error changed by at most opinion_tol,
+* the acceptance rate changed by at most acceptance_tol,
+* and the least-squares slope of the payout per decided encounter over all
+  2k windows is at most payoff_slope_tol per window.
+
+k is a quarter of the windows so far, and at least num_windows: comparing blocks
+rather than single windows keeps the sampling noise of short windows from
+stopping a game early, and blocks that grow with the game measure the slow drift
+of a long game over a matching stretch of it, not only over its last few windows.
+The monitor keeps running sums over the windows, so a block mean or the slope is
+a difference of two sums and every check costs the same, however long the game.
+
+A game is given its convergence settings as one argument (see make_monitor):
+None, a dict of ConvergenceMonitor arguments such as Config.convergence, or a
+ConvergenceMonitor whose settings are copied. get_state and checkpoints store
+the dict returned by settings().
+'''
+
+import numpy as np
+
+# 'off': play every encounter; 'stop': end the game once it has converged; 'thin': keep playing, logging fewer encounters
+CONVERGENCE_ACTIONS = ('off', 'stop', 'thin')
+
+
+class ConvergenceMonitor:
+    '''
+    Online convergence test over the windows of a game.
+
+    Attributes
+    ----------
+    action : str
+        one of CONVERGENCE_ACTIONS, what the game does once it has converged
+    num_windows : int
+        smallest number of windows in each of the two blocks that are compared
+    opinion_tol, acceptance_tol, payoff_slope_tol : float
+        tolerances of the three tests, see above
+    start : int
+        no convergence is declared before this step (encounter or trial)
+    thin_every : int
+        with action 'thin', only every k-th encounter is logged once the game has converged
+    every : int
+        trials per window in simulation_failures.py (simulation.py's windows are its metrics snapshots)
+    windows : list
+        one dict per window: step, opinion_error, decided, accepted, payout and the test statistics
+    sums : dict
+        running sums of the windows' opinion errors, counts, payouts and payout rates, so every check is O(1)
+    converged_at : int
+        step at which the game converged, or None
+    reason : str
+        the test statistics that met their tolerances, or None
+
+    Methods
+    -------
+    check(step, opinion_error, decided, accepted, payout)
+        add a window; returns True at the window where the game converges
+    settings()
+        returns the constructor arguments, as a JSON-safe dict
+    '''
+
+    def __init__(self, action: str = 'stop', num_windows: int = 10, opinion_tol: float = 0.002, acceptance_tol: float = 0.02,
+                 payoff_slope_tol: float = 0.005, start: int = 0, thin_every: int = 100, every: int = 25):
+        if action not in CONVERGENCE_ACTIONS:
+            raise ValueError(f'unknown convergence action: {action}, expected one of {CONVERGENCE_ACTIONS}')
+        if every < 1:
+            raise ValueError(f'a convergence window needs at least one trial, got every={every}')
+        self.action = action
+        self.num_windows = num_windows
+        self.opinion_tol = opinion_tol
+        self.acceptance_tol = acceptance_tol
+        self.payoff_slope_tol = payoff_slope_tol
+        self.start = start
+        self.thin_every = thin_every
+        self.every = every
+        self.windows = []
+        self.sums = None # running sums over the windows, see add_sums
+        self.reset_sums()
+        self.converged_at = None
+        self.reason = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.action != 'off'
+
+    @property
+    def converged(self) -> bool:
+        return self.converged_at is not None
+
+    def statistics(self) -> dict:
+        '''
+        returns the test statistics over the last 2k windows, or None if there are fewer than 2 * num_windows.
+        every statistic is a difference of running sums, so a check costs the same however many windows came before
+        '''
+        n = len(self.windows)
+        k = max(self.num_windows, n // 4)
+        if n < 2 * k:
+            return None
+        older, newer, end = n - 2 * k, n - k, n
+        sums = self.sums
+
+        def total(name, lo, hi):
+            return sums[name][hi] - sums[name][lo]
+
+        older_decided, newer_decided = total('decided', older, newer), total('decided', newer, end)
+        newer_accepted = total('accepted', newer, end)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            older_rate = np.float64(total('accepted', older, newer)) / older_decided
+            newer_rate = np.float64(newer_accepted) / newer_decided
+        if total('empty', older, end):
+            payoff_slope = np.nan # a window without decided encounters has no payout rate
+        else:
+            # x = i - center over the windows i of both blocks: sum(x * (rate - mean rate)) = sum(i * rate) - center * sum(rate)
+            center = older + (2 * k - 1) / 2
+            payoff_slope = ((total('index_rate', older, end) - center * total('rate', older, end))
+                            / (2 * k * ((2 * k) ** 2 - 1) / 12))
+        return {
+            'opinion_change': (total('opinion_error', newer, end) - total('opinion_error', older, newer)) / k,
+            'acceptance_change': float(newer_rate - older_rate),
+            'payoff_slope': float(payoff_slope),
+            'opinion_error': total('opinion_error', newer, end) / k,
+            'acceptance_rate': float(newer_rate) if newer_decided else np.nan,
+            'payout_rate': total('payout', newer, end) / newer_decided if newer_decided else np.nan
+        }
+
+    def add_sums(self, window: dict):
+        '''
+        extend the running sums (one entry per window, after a leading 0) with a window
+        '''
+        i = len(self.sums['rate']) - 1
+        rate = window['payout'] / window['decided'] if window['decided'] else 0.0
+        for name, value in (('opinion_error', window['opinion_error']), ('decided', window['decided']),
+                            ('accepted', window['accepted']), ('payout', window['payout']), ('rate', rate),
+                            ('index_rate', i * rate), ('empty', 0 if window['decided'] else 1)):
+            column = self.sums[name]
+            column.append(column[-1] + value)
+
+    def reset_sums(self):
+        self.sums = {name: [0] for name in ('opinion_error', 'decided', 'accepted', 'payout', 'rate', 'index_rate', 'empty')}
+        for window in self.windows:
+            self.add_sums(window)
+
+    def check(self, step: int, opinion_error: float, decided: int, accepted: int, payout) -> bool:
+        '''
+        add the window that ends at step
+        args:
+            step: encounters (or trials) played so far
+            opinion_error: mean absolute opinion error at the end of the window
+            decided, accepted: encounters decided and accepted in the window
+            payout: payout of the window
+        returns:
+            True if the game converged at this window
+        '''
+        window = {'step': int(step), 'opinion_error': float(opinion_error), 'decided': int(decided), 'accepted': int(accepted),
+                  'payout': float(payout)}
+        self.windows.append(window)
+        self.add_sums(window)
+        statistics = self.statistics()
+        if statistics is None:
+            return False
+        for name in ('opinion_change', 'acceptance_change', 'payoff_slope'):
+            window[name] = statistics[name]
+        if self.converged or step < self.start:
+            return False
+        if (abs(statistics['opinion_change']) <= self.opinion_tol and abs(statistics['acceptance_change']) <= self.acceptance_tol
+                and abs(statistics['payoff_slope']) <= self.payoff_slope_tol):
+            self.converged_at = int(step)
+            self.reason = (f"opinion error changed by {statistics['opinion_change']:+.2e} (tolerance {self.opinion_tol:g}), "
+                           f"acceptance rate by {statistics['acceptance_change']:+.2e} (tolerance {self.acceptance_tol:g}), "
+                           f"payoff slope {statistics['payoff_slope']:+.2e} per window (tolerance {self.payoff_slope_tol:g})")
+            return True
+        return False
+
+    def summary(self) -> dict:
+        '''
+        returns when and why the game converged, and the opinion error, acceptance rate and payout per decided
+        encounter over the newer block of windows: the steady state if the game converged
+        '''
+        statistics = self.statistics() or {}
+        return {'converged_at': self.converged_at, 'reason': self.reason,
+                'steady_opinion_error': statistics.get('opinion_error', np.nan),
+                'steady_acceptance_rate': statistics.get('acceptance_rate', np.nan),
+                'steady_payout_rate': statistics.get('payout_rate', np.nan)}
+
+    def columns(self) -> dict:
+        '''
+        returns the windows as a dict mapping column name to an array, for run tables
+        '''
+        names = ['step', 'opinion_error', 'decided', 'accepted', 'payout', 'opinion_change', 'acceptance_change', 'payoff_slope']
+        columns = {name: np.array([window.get(name, np.nan) for window in self.windows]) for name in names}
+        columns['converged'] = columns['step'] >= self.converged_at if self.converged else np.zeros(len(self.windows), dtype=bool)
+        return columns
+
+    def settings(self) -> dict:
+        return {'action': self.action, 'num_windows': self.num_windows, 'opinion_tol': self.opinion_tol,
+                'acceptance_tol': self.acceptance_tol, 'payoff_slope_tol': self.payoff_slope_tol, 'start': self.start,
+                'thin_every': self.thin_every, 'every': self.every}
+
+    def get_state(self) -> dict:
+        return {'windows': list(self.windows), 'converged_at': self.converged_at, 'reason': self.reason}
+
+    def set_state(self, state: dict):
+        self.windows = list(state['windows'])
+        self.reset_sums()
+        self.converged_at = state['converged_at']
+        self.reason = state['reason']
+
+
+def make_monitor(convergence=None) -> ConvergenceMonitor:
+    '''
+    build a game's convergence monitor
+    args:
+        convergence: None (play every encounter), a dict of ConvergenceMonitor arguments, or a ConvergenceMonitor,
+            whose settings are copied so games never share windows
+    '''
+    if convergence is None:
+        return ConvergenceMonitor('off')
+    if isinstance(convergence, ConvergenceMonitor):
+        convergence = convergence.settings()
+    return ConvergenceMonitor(**convergence)
@@ -0,0 +1,167 @@
+'''
+This Python library records game descriptions (one per run_no). The games are
+given the path of a game_descriptions.csv file; their descriptions are appended
+as single JSON records to an index next to it, game_descriptions.jsonl, under an
+exclusive file lock, so recording a run costs the same however many runs came
+before it, and games running in parallel processes cannot lose each other's
+records. The latest record of a run_no replaces the earlier ones.
+
+The CSV table itself is only written when it is exported (export_game_descriptions,
+e.g. by Game.log_end_info), from the index and any rows of a CSV written before
+the index existed. Only reading the descriptions as a table imports pandas.
+'''
+
+import json
+import os
+from contextlib import contextmanager
+import numpy as np
+from runfile import json_safe
+
+try:
+    import fcntl
+except ImportError: # not available on Windows; fall back to unlocked updates
+    fcntl = None
+
+
+@contextmanager
+def locked(path: str):
+    '''
+    hold an exclusive lock on path + '.lock' for the duration of the with block
+    '''
+    with open(path + '.lock', 'a') as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def index_path(path: str) -> str:
+    '''
+    returns the append-only index that stands in for a descriptions CSV, e.g. logs/game_descriptions.csv -> logs/game_descriptions.jsonl
+    '''
+    return os.path.splitext(path)[0] + '.jsonl'
+
+
+def read_index(path: str) -> dict:
+    '''
+    returns a dict mapping run_no to its latest description in the index of the descriptions CSV at path
+    '''
+    descriptions = {}
+    if not os.path.exists(index_path(path)):
+        return descriptions
+    with open(index_path(path)) as f:
+        for line in f:
+            try:
+                description = json.loads(line)
+            except json.JSONDecodeError:
+                continue # a writer that was killed mid-record
+            descriptions[description['run_no']] = description
+    return descriptions
+
+
+def with_integer_seed(game_desc_df: 'pd.DataFrame') -> 'pd.DataFrame':
+    '''
+    store seeds as nullable integers: runs recorded before seeds were logged have none,
+    and a float column would silently round 63-bit seeds
+    '''
+    import pandas as pd
+    if 'seed' in game_desc_df:
+        game_desc_df['seed'] = game_desc_df['seed'].astype('Int64')
+    else:
+        game_desc_df['seed'] = pd.array([pd.NA] * len(game_desc_df), dtype='Int64')
+    return game_desc_df
+
+
+def read_game_descriptions(path: str) -> 'pd.DataFrame':
+    '''
+    returns every recorded description as a DataFrame, one row per run_no: the rows of the CSV at path, if there is
+    one, replaced or extended by the records of its index
+    '''
+    import pandas as pd
+    descriptions = read_index(path)
+    if not descriptions:
+        if not os.path.exists(path):
+            raise FileNotFoundError(f'no game descriptions recorded at {path}')
+        return with_integer_seed(pd.read_csv(path, dtype={'seed': 'Int64'}))
+    indexed = pd.DataFrame(list(descriptions.values()))
+    # built from the python ints, so 63-bit seeds are not rounded through a float column on the way
+    indexed['seed'] = pd.array([description.get('seed') for description in descriptions.values()], dtype='Int64')
+    if not os.path.exists(path):
+        return indexed
+    game_desc_df = pd.read_csv(path, dtype={'seed': 'Int64'})
+    game_desc_df = game_desc_df[~game_desc_df['run_no'].isin(list(descriptions))]
+    return with_integer_seed(pd.concat([game_desc_df, indexed], ignore_index=True))
+
+
+def record_game_description(path: str, row: dict):
+    '''
+    record the description of run row['run_no'], replacing any earlier one, by appending it to the index of path
+    args:
+        path: path of game_descriptions.csv
+        row: game description, must contain 'run_no'
+    '''
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    record = json.dumps(json_safe(row)) + '\n'
+    with locked(index_path(path)):
+        with open(index_path(path), 'a') as f:
+            f.write(record)
+
+
+def record_pairing_weights(path: str, run_no: int, weights) -> str:
+    '''
+    save the per-agent weights of a run with 'weighted' pairing next to the descriptions CSV at path
+    returns:
+        the file name, e.g. pairing_weights_3.npy, recorded as the run's pairing_weights so replays can load them
+    '''
+    name = f'pairing_weights_{run_no}.npy'
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    np.save(os.path.join(os.path.dirname(path), name), np.asarray(weights, dtype=np.float64))
+    return name
+
+
+def export_game_descriptions(path: str) -> 'pd.DataFrame':
+    '''
+    write every recorded description to the CSV at path, replacing it atomically
+    returns:
+        the descriptions written
+    '''
+    with locked(index_path(path)):
+        game_desc_df = read_game_descriptions(path)
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        game_desc_df.to_csv(tmp_path, index=False)
+        os.replace(tmp_path, path)
+    return game_desc_df
+
+
+def load_game_description(path: str, run_no: int) -> dict:
+    '''
+    returns the recorded description of run_no as a dict of python values
+    '''
+    description = read_index(path).get(run_no)
+    if description is None:
+        # recorded before the index existed: look it up in the CSV
+        import pandas as pd
+        if not os.path.exists(path):
+            raise KeyError(f'run {run_no} is not recorded in {path}')
+        game_desc_df = read_game_descriptions(path)
+        rows = game_desc_df[game_desc_df['run_no'] == run_no]
+        if rows.empty:
+            raise KeyError(f'run {run_no} is not recorded in {path}')
+        description = {name: None if pd.isna(value) else value.item() if isinstance(value, np.generic) else value
+                       for name, value in rows.iloc[-1].to_dict().items()}
+    if description.get('seed') is None:
+        raise ValueError(f'run {run_no} in {path} was recorded without a seed and cannot be replayed')
+    description['seed'] = int(description['seed'])
+    if description.get('pairing') is None:
+        description['pairing'] = 'uniform' # recorded before pairings other than uniform existed
+    if description.get('precision') is None:
+        description['precision'] = 'float64' # recorded before reduced-precision opinions existed
+    description.setdefault('topology', None) # all-to-all, or recorded before topologies existed
+    # the weights of a 'weighted' run are saved next to the descriptions (record_pairing_weights); runs recorded
+    # before that have none, and their replays need the weights passed in
+    weights = description.get('pairing_weights')
+    description['pairing_weights'] = np.load(os.path.join(os.path.dirname(path), weights)) if weights else None
+    return description
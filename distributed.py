@@ -0,0 +1,650 @@
+'''
+This Python library runs the payoff game (benchmarks 1 and 2) sharded over
+several worker processes, so the N x N opinions are spread over the memory of
+several processes or hosts. Workers talk to one coordinator over TCP; on a
+single machine they run as local processes on localhost.
+
+* Shards: worker s owns a contiguous block of agents and holds their rows of
+  opinions (the opinions they hold of everyone).
+* Coordinator: samples the encounters with the game's seeded generator, exactly
+  as simulation.Game does, schedules them as conflict-free waves (see
+  concurrency.py), and aggregates outcomes, payoffs, history and logs.
+* Waves: an encounter is played by the shard of its active agent. No agent
+  appears twice in a wave, so the encounters of a wave can be played in any
+  order, and every shard plays its part of a wave as one vectorized step.
+* Row exchange: a good encounter blends the passive agent's row into the
+  active agent's row. When the passive agent lives on another shard, its
+  owner exports the row in its reply for the wave before, and the coordinator
+  forwards it with the wave. Rows are exported for every cross-shard encounter
+  that can be accepted, because the outcome is only known once the active
+  shard has decided. This trades bandwidth for one round trip per wave.
+
+Workers only serve coordinators that know their shared token: the first
+message of every connection is a 'hello' carrying it, and a worker closes any
+connection whose token does not match. Local workers get a fresh random token
+from their Cluster. The protocol is not encrypted, and the token is sent in the
+clear, so remote workers belong on a trusted network (or behind an SSH tunnel).
+A worker started from the command line listens on localhost unless it is given
+a host, and only listens on another address with Config.shard_token set.
+
+Every message is one length-prefixed frame. The frame holds a JSON header and
+raw NumPy buffers, zlib-compressed above a small size. A wave sends one frame
+to every shard before any reply is read, so the shards work in parallel.
+Connections are opened once per Cluster, with TCP_NODELAY, and reused for
+every wave and for every game played on the cluster. The final opinions and
+payoffs are the same as simulation.Game with the same seed.
+
+    python distributed.py                  # a game on Config.num_shards local workers
+    python distributed.py worker 5555           # a worker on localhost, port 5555
+    python distributed.py worker 5555 0.0.0.0   # a worker for remote coordinators, with Config.shard_token set
+'''
+
+import hmac
+import ipaddress
+import json
+import multiprocessing
+import os
+import secrets
+import socket
+import struct
+import sys
+import traceback
+import zlib
+import numpy as np
+import pandas as pd
+from concurrency import conflict_free_waves
+from config import Config
+from descriptions import record_game_description, export_game_descriptions
+from distributions import sample_reliabilities, EXPECTED_RELIABILITY, payoff_threshold
+from log_sinks import make_sink
+from recorder import EncounterRecorder
+from runfile import save_run_table, RUN_FORMATS
+from sampling import EncounterSampler, make_pairs
+from strategies import parse_mix, mix_spec, assign_strategies, strategy_code, decide
+
+# frame prefix: header length, body length, whether the body is compressed
+FRAME = struct.Struct('!IQ?')
+# bodies smaller than this are sent uncompressed
+MIN_COMPRESS_BYTES = 1024
+# the hello that opens a connection: largest header a worker reads before the token is checked (its body is empty),
+# and seconds a worker waits for it
+MAX_HELLO_BYTES = 4096
+HANDSHAKE_TIMEOUT = 10.0
+
+
+def send_message(sock: socket.socket, header: dict, arrays: dict = None, compress_level: int = 1) -> tuple:
+    '''
+    send one frame
+    args:
+        sock: connected socket
+        header: JSON-serializable dict, e.g. {'op': 'wave'}
+        arrays: dict of NumPy arrays sent as raw buffers after the header
+        compress_level: zlib level of the body, 0 to send it as is
+    returns:
+        (bytes sent, bytes before compression)
+    '''
+    arrays = arrays or {}
+    header = dict(header, arrays=[[name, array.dtype.str, list(array.shape)] for name, array in arrays.items()])
+    body = b''.join(np.ascontiguousarray(array).tobytes() for array in arrays.values())
+    raw_size = len(body)
+    compressed = compress_level > 0 and raw_size >= MIN_COMPRESS_BYTES
+    if compressed:
+        body = zlib.compress(body, compress_level)
+    header_bytes = json.dumps(header).encode()
+    sock.sendall(b''.join((FRAME.pack(len(header_bytes), len(body), compressed), header_bytes, body)))
+    return FRAME.size + len(header_bytes) + len(body), FRAME.size + len(header_bytes) + raw_size
+
+
+def recv_exactly(sock: socket.socket, size: int) -> bytearray:
+    buffer = bytearray(size)
+    view = memoryview(buffer)
+    while view:
+        received = sock.recv_into(view)
+        if not received:
+            raise ConnectionError('connection closed in the middle of a message')
+        view = view[received:]
+    return buffer
+
+
+def recv_message(sock: socket.socket, max_header_size: int = None, max_body_size: int = None) -> tuple:
+    '''
+    receive one frame sent by send_message
+    args:
+        max_header_size, max_body_size: optional limits, checked before anything is allocated
+    returns:
+        header, arrays, bytes received, bytes after decompression
+    '''
+    header_size, body_size, compressed = FRAME.unpack(recv_exactly(sock, FRAME.size))
+    if (max_header_size is not None and header_size > max_header_size) or (max_body_size is not None and body_size > max_body_size):
+        raise ValueError(f'frame of {header_size} + {body_size} bytes is over the limit')
+    header = json.loads(recv_exactly(sock, header_size))
+    if not isinstance(header, dict):
+        raise ValueError('the frame header is not a JSON object')
+    body = recv_exactly(sock, body_size)
+    if compressed:
+        body = zlib.decompress(body)
+    arrays = {}
+    offset = 0
+    for name, dtype, shape in header.pop('arrays', []):
+        array = np.frombuffer(body, dtype=dtype, count=int(np.prod(shape)), offset=offset).reshape(shape)
+        arrays[name] = array
+        offset += array.nbytes
+    return header, arrays, FRAME.size + header_size + body_size, FRAME.size + header_size + len(body)
+
+
+class Shard:
+    '''
+    The rows of one block of agents, held by a worker.
+
+    Attributes
+    ----------
+    lo, hi : int
+        the shard owns agents lo, ..., hi - 1
+    opinions : np.ndarray
+        (hi - lo, num_agents) array, opinions[i - lo, j] is agent i's opinion of agent j
+
+    Methods
+    -------
+    play_wave(active, passive, uniforms, import_ids, import_rows)
+        play this shard's encounters of a wave, returns the passive opinions, acceptances and outcomes
+    handle(header, arrays)
+        run one request of the coordinator, returns the reply's header and arrays
+    '''
+
+    def __init__(self, header: dict, arrays: dict):
+        self.lo, self.hi = header['lo'], header['hi']
+        self.p_g, self.p_b = header['p_g'], header['p_b']
+        self.alpha_direct, self.alpha_indirect = header['alpha_direct'], header['alpha_indirect']
+        self.threshold = header['threshold']
+        self.reliabilities = arrays['reliabilities'].copy()
+        self.codes = arrays['strategy_codes'].copy()
+        self.opinions = np.full((self.hi - self.lo, len(self.reliabilities)), header['initial_opinion'])
+
+    def play_wave(self, active, passive, uniforms, import_ids, import_rows):
+        '''
+        the same decisions and updates as LearnTrustAgent.handle_encounter, for encounters in which no agent appears twice
+        args:
+            active, passive, uniforms: the encounters whose active agent is on this shard
+            import_ids, import_rows: the rows of the passive agents that live on other shards
+        returns:
+            opinions, accepted, success: arrays aligned with the encounters
+        '''
+        local = active - self.lo
+        opinions = self.opinions[local, passive]
+        passive_reliabilities = self.reliabilities[passive]
+        accepted = decide(self.codes[active], opinions, passive_reliabilities, self.p_g, self.p_b, self.threshold)
+        success = accepted & (uniforms < passive_reliabilities)
+        updated = np.flatnonzero(accepted)
+        self.opinions[local[updated], passive[updated]] = ((1 - self.alpha_direct) * opinions[updated]
+                                                           + self.alpha_direct * success[updated])
+        good = np.flatnonzero(success)
+        if good.size:
+            a, p = active[good], passive[good]
+            sources = np.empty((good.size, self.opinions.shape[1]))
+            is_local = (p >= self.lo) & (p < self.hi)
+            sources[is_local] = self.opinions[p[is_local] - self.lo]
+            if not is_local.all():
+                sources[~is_local] = import_rows[np.searchsorted(import_ids, p[~is_local])]
+            rows = self.opinions[local[good]]
+            k = np.arange(good.size)
+            own, excluded = rows[k, a], rows[k, p]
+            rows *= 1 - self.alpha_indirect
+            rows += self.alpha_indirect * sources
+            rows[k, a] = own
+            rows[k, p] = excluded
+            self.opinions[local[good]] = rows
+        return opinions, accepted, success
+
+    def row_errors(self) -> np.ndarray:
+        errors = np.abs(self.opinions - self.reliabilities[None, :])
+        errors[np.arange(self.hi - self.lo), np.arange(self.lo, self.hi)] = 0
+        return errors.sum(axis=1)
+
+    def handle(self, header: dict, arrays: dict) -> tuple:
+        op = header['op']
+        if op == 'wave':
+            opinions, accepted, success = self.play_wave(arrays['active'], arrays['passive'], arrays['uniforms'],
+                                                         arrays['import_ids'], arrays['import_rows'])
+            # rows for the next wave, exported after this wave's updates
+            export_ids = arrays['export_ids']
+            return {'op': 'done'}, {'opinions': opinions, 'accepted': accepted, 'success': success,
+                                    'export_rows': self.opinions[export_ids - self.lo]}
+        if op == 'export':
+            return {'op': 'done'}, {'export_rows': self.opinions[arrays['export_ids'] - self.lo]}
+        if op == 'row_errors':
+            return {'op': 'done'}, {'row_errors': self.row_errors()}
+        if op == 'opinions':
+            return {'op': 'done'}, {'opinions': self.opinions}
+        raise ValueError(f'unknown request: {op}')
+
+
+def token_matches(header: dict, token: str) -> bool:
+    '''
+    whether a coordinator's first message is a 'hello' with the worker's token (None: any coordinator is served)
+    '''
+    if header.get('op') != 'hello':
+        return False
+    if token is None:
+        return True
+    sent = header.get('token')
+    return isinstance(sent, str) and hmac.compare_digest(sent.encode(), token.encode())
+
+
+def serve_connection(sock: socket.socket, token: str = None):
+    '''
+    answer one coordinator's requests until it closes the connection. the first message must be a 'hello' with
+    the worker's token, or the connection is closed. the hello must arrive within HANDSHAKE_TIMEOUT seconds, in a frame
+    of at most MAX_HELLO_BYTES with an empty body, so an unauthenticated peer can neither stall the worker nor make it
+    allocate or parse more than that. an 'init' request starts a new shard, so one connection can serve several games
+    '''
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    sock.settimeout(HANDSHAKE_TIMEOUT)
+    try:
+        header, _, _, _ = recv_message(sock, max_header_size=MAX_HELLO_BYTES, max_body_size=0)
+        if not token_matches(header, token):
+            send_message(sock, {'op': 'error', 'message': 'the coordinator did not send the worker\'s token'})
+            return
+        send_message(sock, {'op': 'done'})
+    except (OSError, ValueError, MemoryError, zlib.error):
+        # a closed or silent connection (socket.timeout is an OSError), or a malformed frame (JSONDecodeError is a ValueError)
+        return
+    sock.settimeout(None)
+    shard = None
+    compress_level = 1
+    while True:
+        try:
+            header, arrays, _, _ = recv_message(sock)
+        except ConnectionError:
+            return
+        if header['op'] == 'close':
+            return
+        try:
+            if header['op'] == 'init':
+                shard = Shard(header, arrays)
+                compress_level = header['compress_level']
+                reply = ({'op': 'done'}, {})
+            elif shard is None:
+                raise ValueError('the shard is not initialized')
+            else:
+                reply = shard.handle(header, arrays)
+        except Exception:
+            reply = ({'op': 'error', 'message': traceback.format_exc()}, {})
+        send_message(sock, *reply, compress_level=compress_level)
+
+
+def is_loopback(host: str) -> bool:
+    if host == 'localhost':
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+def serve(port: int = 0, host: str = '127.0.0.1', once: bool = False, ready=None, token: str = None):
+    '''
+    run a worker: accept coordinators one at a time and serve each until it disconnects
+    args:
+        port, host: address to listen on; port 0 picks a free port
+        once: stop after the first coordinator
+        ready: optional multiprocessing connection the chosen port is sent to
+        token: shared secret coordinators must send first; None serves any coordinator, and is only allowed on localhost
+    '''
+    if token is None and not is_loopback(host):
+        raise ValueError(f'a worker listening on {host} needs a token (Config.shard_token)')
+    with socket.create_server((host, port)) as server:
+        if ready is not None:
+            ready.send(server.getsockname()[1])
+            ready.close()
+        while True:
+            sock, _ = server.accept()
+            with sock:
+                serve_connection(sock, token)
+            if once:
+                return
+
+
+class Cluster:
+    '''
+    Persistent connections from a coordinator to its workers.
+
+    Attributes
+    ----------
+    addresses : list
+        (host, port) of each worker
+    stats : dict
+        messages, bytes sent and received on the wire, and the same messages' bytes uncompressed (payload_bytes)
+
+    Methods
+    -------
+    request(messages)
+        send one message to every worker, then read every reply
+    close()
+        close the connections and stop the local workers
+    '''
+
+    def __init__(self, workers=None, num_shards: int = 2, compress_level: int = 1, token: str = None):
+        '''
+        args:
+            workers: list of 'host:port' of running workers (python distributed.py worker <port>); None starts
+                num_shards workers as local processes listening on localhost
+            num_shards: number of local workers, if workers is None
+            compress_level: zlib level of the coordinator's messages (and, through init, of the workers'), 0 for none
+            token: shared secret of the workers (Config.shard_token); local workers get a fresh random one if None
+        '''
+        self.compress_level = compress_level
+        self.processes = []
+        if workers is None:
+            token = token or secrets.token_hex(16)
+            context = multiprocessing.get_context('spawn')
+            self.addresses = []
+            for _ in range(num_shards):
+                receiver, sender = context.Pipe(duplex=False)
+                process = context.Process(target=serve, kwargs={'once': True, 'ready': sender, 'token': token}, daemon=True)
+                process.start()
+                self.processes.append(process)
+                self.addresses.append(('127.0.0.1', receiver.recv()))
+        else:
+            self.addresses = [(host, int(port)) for host, port in (worker.rsplit(':', 1) for worker in workers)]
+        self.sockets = []
+        for address in self.addresses:
+            sock = socket.create_connection(address)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self.sockets.append(sock)
+        self.stats = {'messages': 0, 'bytes_sent': 0, 'bytes_received': 0, 'payload_bytes': 0}
+        try:
+            self.request([({'op': 'hello', 'token': token}, {}) for _ in self.sockets])
+        except (RuntimeError, ConnectionError) as error:
+            self.close()
+            raise PermissionError(f'a worker refused the coordinator: {error}') from error
+        self.stats = {'messages': 0, 'bytes_sent': 0, 'bytes_received': 0, 'payload_bytes': 0} # only the games' messages
+
+    def __len__(self):
+        return len(self.sockets)
+
+    def request(self, messages: list) -> list:
+        '''
+        args:
+            messages: one (header, arrays) per worker
+        returns:
+            one reply arrays dict per worker
+        '''
+        for sock, (header, arrays) in zip(self.sockets, messages):
+            sent, payload = send_message(sock, header, arrays, self.compress_level)
+            self.stats['bytes_sent'] += sent
+            self.stats['payload_bytes'] += payload
+        replies = []
+        for s, sock in enumerate(self.sockets):
+            header, arrays, received, payload = recv_message(sock)
+            self.stats['bytes_received'] += received
+            self.stats['payload_bytes'] += payload
+            if header['op'] == 'error':
+                raise RuntimeError(f'worker {s} failed:\n{header["message"]}')
+            replies.append(arrays)
+        self.stats['messages'] += 2 * len(messages)
+        return replies
+
+    def close(self):
+        for sock in self.sockets:
+            try:
+                send_message(sock, {'op': 'close'})
+            except OSError:
+                pass
+            sock.close()
+        self.sockets = []
+        for process in self.processes:
+            process.join(timeout=5)
+        self.processes = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class ShardedGame:
+    '''
+    simulation.Game with the agents' opinions partitioned over the workers of a Cluster.
+
+    Attributes
+    ----------
+    bounds : np.ndarray
+        shard s owns agents bounds[s], ..., bounds[s + 1] - 1
+    encounter_history : EncounterRecorder
+        every encounter, with the same columns as simulation.Game
+    stats : dict
+        waves, rows exported between shards and rows used by good encounters, plus the cluster's message stats
+
+    Methods
+    -------
+    run()
+        play the game, returns the encounter history
+    opinions()
+        gather the whole opinion matrix from the shards, for small games
+    log_end_info(encounter_history)
+        write and print the per-agent payoffs
+    '''
+
+    def __init__(self, run_no=0, num_agents=100, r_dist='uniform', num_interactions=100, p_g=2, p_b=-2, alpha_direct=0.1,
+                 alpha_indirect=0.1, seed=None, pairing='uniform', pairing_weights=None, strategies='learn_trust',
+                 cluster=None, num_shards=2, batch_size=4096, compress_level=1,
+                 log_sink='text', log_every=1, log_echo=True, log_buffer_size=1000, run_format='csv',
+                 log_dir='logs_sharded', agent_log_dir='karly_logs_sharded'):
+        self.run_no = run_no
+        # the same generator and draws as simulation.Game, so a seed gives the same game
+        if seed is None:
+            seed = int(np.random.SeedSequence().generate_state(1, np.uint64)[0] >> 1)
+        self.seed = seed
+        self.rng = np.random.default_rng(seed)
+        self.pairing = pairing
+        self.sampler = EncounterSampler(self.rng, num_agents, pairs=make_pairs(pairing, num_agents, pairing_weights))
+        self.num_agents = num_agents
+        self.r_dist = r_dist
+        self.mix = parse_mix(strategies)
+        self.num_interactions = num_interactions
+        self.p_g = p_g
+        self.p_b = p_b
+        self.alpha_direct = alpha_direct
+        self.alpha_indirect = alpha_indirect
+        # a cluster passed in is reused and left open; otherwise the game starts num_shards local workers and stops them when done
+        self.cluster = cluster
+        self.num_shards = len(cluster) if cluster is not None else num_shards
+        self.compress_level = compress_level
+        self.bounds = np.arange(self.num_shards + 1) * num_agents // self.num_shards
+        self.owner = np.repeat(np.arange(self.num_shards), np.diff(self.bounds))
+        self.batch_size = batch_size # encounters sampled and scheduled into waves at a time
+        self.total_payout = 0
+        self.encounter_history = EncounterRecorder(num_interactions, payout_dtype=np.result_type(p_g, p_b))
+        self.stats = {'waves': 0, 'rows_exported': 0, 'rows_used': 0}
+        self.row_errors = None
+        self.log_dir = log_dir
+        if run_format not in RUN_FORMATS:
+            raise ValueError(f'unknown run format: {run_format}, expected one of {RUN_FORMATS}')
+        self.run_format = run_format
+        os.makedirs(os.path.dirname(f'{log_dir}/game{self.run_no}/'), exist_ok=True)
+        os.makedirs(agent_log_dir, exist_ok=True)
+        self.log = make_sink(log_sink, f'{log_dir}/game{self.run_no}/game_log_{self.run_no}.txt',
+                             every=log_every, echo=log_echo, buffer_size=log_buffer_size)
+        self.df = None
+        self.df2 = None
+        self.csv_path = f'{log_dir}/game{self.run_no}/game_log_{self.run_no}.csv'
+        self.csv_path2 = f'{agent_log_dir}/game_log_{self.run_no}.csv'
+
+    def describe(self) -> dict:
+        return {
+            'run_no': self.run_no,
+            'num_agents': self.num_agents,
+            'r_dist': self.r_dist,
+            'agent_type': mix_spec(self.mix),
+            'num_interactions': self.num_interactions,
+            'p_g': self.p_g,
+            'p_b': self.p_b,
+            'alpha_direct': self.alpha_direct,
+            'alpha_indirect': self.alpha_indirect,
+            'seed': self.seed,
+            'pairing': self.pairing,
+            'topology': None,
+            'num_shards': self.num_shards
+        }
+
+    def initialize_agents(self):
+        self.description = self.describe()
+        record_game_description(f'{self.log_dir}/game_descriptions.csv', self.description)
+        self.reliabilities = sample_reliabilities(self.rng, self.r_dist, self.num_agents)
+        self.r_arr = self.reliabilities.tolist()
+        self.strategy_codes = assign_strategies(self.mix, self.num_agents, self.rng)
+        if self.cluster is None:
+            self.cluster = Cluster(num_shards=self.num_shards, compress_level=self.compress_level)
+            self.owns_cluster = True
+        else:
+            self.owns_cluster = False
+        header = {'op': 'init', 'p_g': self.p_g, 'p_b': self.p_b, 'alpha_direct': self.alpha_direct,
+                  'alpha_indirect': self.alpha_indirect, 'threshold': payoff_threshold(self.r_dist, self.p_g, self.p_b),
+                  'initial_opinion': EXPECTED_RELIABILITY[self.r_dist], 'compress_level': self.cluster.compress_level}
+        arrays = {'reliabilities': self.reliabilities, 'strategy_codes': self.strategy_codes}
+        self.cluster.request([(dict(header, lo=int(self.bounds[s]), hi=int(self.bounds[s + 1])), arrays)
+                              for s in range(self.num_shards)])
+
+    def waves(self):
+        '''
+        yields the game's encounters as conflict-free waves: (encounter numbers, active, passive, uniforms)
+        '''
+        for start in range(0, self.num_interactions, self.batch_size):
+            draws = [self.sampler.next() for _ in range(min(self.batch_size, self.num_interactions - start))]
+            active, passive, uniforms = (np.array(column) for column in zip(*draws))
+            for wave in conflict_free_waves(active, passive, self.num_agents):
+                yield start + wave, active[wave], passive[wave], uniforms[wave]
+
+    def exports(self, wave) -> list:
+        '''
+        returns, per shard, the sorted ids of its agents whose rows another shard needs to play the wave: the passive
+        agents of cross-shard encounters whose active agent can accept
+        '''
+        if wave is None:
+            return [np.empty(0, dtype=np.intp)] * self.num_shards
+        _, active, passive, _ = wave
+        needed = (self.owner[active] != self.owner[passive]) & (self.strategy_codes[active] != strategy_code('play_never'))
+        rows = np.sort(passive[needed])
+        return [rows[(rows >= self.bounds[s]) & (rows < self.bounds[s + 1])] for s in range(self.num_shards)]
+
+    def run(self):
+        self.initialize_agents()
+        try:
+            self.play()
+        finally:
+            if self.owns_cluster:
+                self.cluster.close()
+        return self.encounter_history
+
+    def play(self):
+        T = self.num_interactions
+        opinions, accepted, success = np.empty(T), np.zeros(T, dtype=bool), np.zeros(T, dtype=bool)
+        active_ids, passive_ids = np.empty(T, dtype=np.intp), np.empty(T, dtype=np.intp)
+        waves = self.waves()
+        wave = next(waves, None)
+        # rows for the first wave; the rows of every later wave come with the replies to the wave before
+        export_ids = self.exports(wave)
+        replies = self.cluster.request([({'op': 'export'}, {'export_ids': ids}) for ids in export_ids])
+        while wave is not None:
+            next_wave = next(waves, None)
+            numbers, active, passive, uniforms = wave
+            # route the exported rows to the shards of the active agents that need them
+            import_ids = np.concatenate(export_ids)
+            import_rows = np.concatenate([reply['export_rows'] for reply in replies]).reshape(len(import_ids), self.num_agents)
+            order = np.argsort(import_ids)
+            import_ids, import_rows = import_ids[order], import_rows[order]
+            partner_of = dict(zip(passive.tolist(), active.tolist()))
+            import_shard = self.owner[[partner_of[p] for p in import_ids.tolist()]] if len(import_ids) else import_ids
+            active_shard = self.owner[active]
+            export_ids = self.exports(next_wave)
+            messages = []
+            for s in range(self.num_shards):
+                mine = active_shard == s
+                imported = import_shard == s
+                messages.append(({'op': 'wave'}, {'active': active[mine], 'passive': passive[mine], 'uniforms': uniforms[mine],
+                                                  'import_ids': import_ids[imported], 'import_rows': import_rows[imported],
+                                                  'export_ids': export_ids[s]}))
+            replies = self.cluster.request(messages)
+            for s, reply in enumerate(replies):
+                positions = numbers[active_shard == s]
+                opinions[positions] = reply['opinions']
+                accepted[positions] = reply['accepted']
+                success[positions] = reply['success']
+            active_ids[numbers], passive_ids[numbers] = active, passive
+            self.stats['waves'] += 1
+            self.stats['rows_exported'] += len(import_ids)
+            self.stats['rows_used'] += int(np.count_nonzero(success[numbers] & (active_shard != self.owner[passive])))
+            wave = next_wave
+        self.row_errors = np.concatenate(
+            [reply['row_errors'] for reply in self.cluster.request([({'op': 'row_errors'}, {})] * self.num_shards)])
+        self.stats.update(self.cluster.stats)
+        self.record(active_ids, passive_ids, opinions, accepted, success)
+        return self.encounter_history
+
+    def record(self, active_ids, passive_ids, opinions, accepted, success):
+        '''
+        fill the encounter history and log, in encounter order, from the outcomes gathered from the shards
+        '''
+        payouts = np.where(accepted, np.where(success, self.p_g, self.p_b), 0).astype(self.encounter_history.dtypes['total_payout'])
+        total_payout = np.cumsum(payouts)
+        self.total_payout = total_payout[-1].item() if len(total_payout) else 0
+        self.encounter_history.restore({
+            'active_id': active_ids, 'passive_id': passive_ids,
+            'active_reliability': self.reliabilities[active_ids], 'passive_reliability': self.reliabilities[passive_ids],
+            'passive_opinion': opinions, 'accepted': accepted, 'result': success, 'total_payout': total_payout
+        })
+        for i in range(self.num_interactions):
+            if self.log.accepts(i):
+                self.log.write((i, int(active_ids[i]), int(passive_ids[i]), self.r_arr[active_ids[i]], self.r_arr[passive_ids[i]],
+                                float(opinions[i]), bool(accepted[i]), bool(success[i]), total_payout[i].item()))
+        self.log.close()
+        self.df = self.encounter_history.to_dataframe()
+        save_run_table(self.df, self.csv_path, self.run_format, self.description)
+
+    def opinions(self) -> np.ndarray:
+        '''
+        returns the (num_agents, num_agents) opinions gathered from the shards; needs a cluster that is still open
+        '''
+        return np.concatenate([reply['opinions'] for reply in self.cluster.request([({'op': 'opinions'}, {})] * self.num_shards)])
+
+    def log_end_info(self, encounter_history):
+        export_game_descriptions(f'{self.log_dir}/game_descriptions.csv')
+        payoffs = encounter_history.payoffs(self.num_agents, self.p_g, self.p_b)
+        self.df2 = pd.DataFrame({
+            'agent_id': np.arange(self.num_agents),
+            'reliability': self.reliabilities,
+            'shard': self.owner,
+            'total_payoff': payoffs,
+            'opinion_mae': self.row_errors / (self.num_agents - 1)
+        })
+        save_run_table(self.df2, self.csv_path2, self.run_format, self.description)
+        print("Total payoff:")
+        print(payoffs.sum())
+        print(f"{self.stats['waves']} waves on {self.num_shards} shards, {self.stats['rows_exported']} rows exchanged "
+              f"({self.stats['rows_used']} used), {self.stats['bytes_sent'] + self.stats['bytes_received']} bytes on the wire "
+              f"for {self.stats['payload_bytes']} bytes of messages")
+
+
+def main():
+    args = sys.argv[1:]
+    if args and args[0] == 'worker':
+        if len(args) not in (2, 3):
+            print("Arg format: python distributed.py worker [port] [host, default 127.0.0.1; others need Config.shard_token]")
+            return
+        serve(int(args[1]), args[2] if len(args) == 3 else '127.0.0.1', token=Config.shard_token)
+        return
+    game = ShardedGame(run_no=Config.run_no, num_agents=Config.num_agents, r_dist=Config.r_dist,
+                       num_interactions=Config.num_encounters, p_g=Config.p_g, p_b=Config.p_b,
+                       alpha_direct=Config.alpha_direct, alpha_indirect=Config.alpha_indirect, seed=Config.seed,
+                       pairing=Config.pairing, pairing_weights=Config.pairing_weights, strategies=Config.strategies,
+                       cluster=Cluster(Config.shard_workers, compress_level=Config.shard_compress_level, token=Config.shard_token) if Config.shard_workers else None,
+                       num_shards=Config.num_shards, batch_size=Config.shard_batch_size, compress_level=Config.shard_compress_level,
+                       log_sink=Config.log_sink, log_every=Config.log_every, log_echo=Config.log_echo,
+                       log_buffer_size=Config.log_buffer_size, run_format=Config.run_format)
+    game.run()
+    game.log_end_info(game.encounter_history)
+
+
+if __name__ == "__main__":
+    main()
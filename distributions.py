@@ -0,0 +1,43 @@
+'''
+This Python library samples agents' true reliability scores for the supported
+reliability distributions ('uniform', 'normal', 'bernoulli', 'skewed').
+'''
+
+import numpy as np
+
+# expected reliability an agent assumes for everyone else before any encounter
+EXPECTED_RELIABILITY = {
+    'uniform': 0.5,
+    'normal': 0.5,
+    'bernoulli': 0.5,
+    'skewed': 0.25,
+}
+
+
+def sample_reliabilities(rng: np.random.Generator, r_dist: str, num_agents: int) -> np.ndarray:
+    '''
+    draw num_agents reliability scores in one call
+    args:
+        rng: random generator to draw from
+        r_dist: name of the reliability distribution
+        num_agents: number of scores to draw
+    returns:
+        array of reliability scores in [0, 1]
+    '''
+    if r_dist == 'uniform':
+        return rng.uniform(0, 1, num_agents)
+    elif r_dist == 'normal':
+        return np.clip(rng.normal(0.5, 0.25, num_agents), 0, 1)
+    elif r_dist == 'bernoulli':
+        return rng.integers(0, 2, num_agents).astype(np.float64)
+    elif r_dist == 'skewed':
+        return rng.beta(2, 6, num_agents)
+    raise ValueError(f'unknown reliability distribution: {r_dist}')
+
+
+def payoff_threshold(r_dist: str, p_g: float, p_b: float) -> float:
+    '''
+    acceptance threshold (tau_i) of an agent that expects the reliability of r_dist
+    '''
+    exp_r = EXPECTED_RELIABILITY[r_dist]
+    return p_g * exp_r + p_b * (1 - exp_r) - 0.0005
@@ -0,0 +1,362 @@
+'''
+This Python library is an event-driven, asynchronous version of the payoff
+game (benchmarks 1 and 2). Agents start encounters at their own rates, many
+encounters are in flight at once, and the opinions an agent adopts after a
+good encounter (its gossip) only arrive after a configurable latency.
+
+Events live in one priority queue ordered by (time, kind, sequence number), so
+ties are broken deterministically and a run is reproducible from its seed.
+Time advances in scheduler ticks of fixed length. Each tick:
+1. gossip that arrived before the end of the tick is adopted, in arrival order
+2. the encounters started during the tick are drawn as one batch (partners,
+   outcome uniforms, the agents' next start times and gossip latencies),
+   decided with strategies.decide if the batch is large enough to gain from it,
+   and played in start order with LearnTrustAgent.handle_encounter, with the
+   indirect update deferred until the gossip arrives
+
+With zero latency and ticks short enough to hold one encounter each, this is
+the same process as simulation.Game.
+'''
+
+import heapq
+import os
+import time
+from agent import LearnTrustAgent
+import numpy as np
+import pandas as pd
+from trust_matrix import TrustMatrix, SparseTrustMatrix
+from recorder import EncounterRecorder
+from descriptions import record_game_description, record_pairing_weights, load_game_description, export_game_descriptions
+from distributions import sample_reliabilities, EXPECTED_RELIABILITY, payoff_threshold
+from sampling import GraphPairs, make_pairs
+from topology import make_topology
+from runfile import save_run_table, RUN_FORMATS
+from metrics import OnlineMetrics
+from log_sinks import make_sink
+from strategies import parse_mix, mix_spec, assign_strategies, strategy_name, decide, decision_runs, MIN_BATCH_DECISIONS
+from config import Config
+
+# event kinds; at equal times gossip is delivered before a new encounter starts
+GOSSIP = 0
+ENCOUNTER = 1
+
+
+class Game:
+    def __init__(self, run_no=0, num_agents=100, r_dist='uniform', num_interactions=100, p_g=2, p_b=-2, alpha_direct=0.1, alpha_indirect=0.1,
+                 seed=None, pairing='uniform', pairing_weights=None, topology=None, strategies='learn_trust',
+                 rate_dist='constant', gossip_latency=0.0, latency_dist='constant', tick=0.1,
+                 log_sink='text', log_every=1, log_echo=True, log_buffer_size=1000, run_format='csv', metrics_every=100,
+                 log_dir='logs_async', agent_log_dir='karly_logs_async'):
+        self.run_no = run_no
+        # every random draw of the game comes from its own generator, so a run is reproducible from its seed
+        if seed is None:
+            seed = int(np.random.SeedSequence().generate_state(1, np.uint64)[0] >> 1)
+        self.seed = seed
+        self.rng = np.random.default_rng(seed)
+        # contact graph: None for all-to-all, or a Topology or spec such as 'regular:8' (see topology.py)
+        if isinstance(topology, str):
+            topology = make_topology(topology, num_agents, self.rng)
+        self.topology = topology
+        if topology is not None:
+            if pairing not in ('uniform', 'graph'):
+                raise ValueError(f"a game with a topology only supports 'graph' pairing, got {pairing}")
+            pairing = 'graph'
+        # who meets whom: 'uniform', 'local:<radius>', 'weighted' (with pairing_weights) or 'graph', see sampling.py
+        self.pairing = pairing
+        self.pairing_weights = pairing_weights
+        self.pairs = make_pairs(pairing, num_agents, pairing_weights, topology)
+        self.num_agents = num_agents  # total number of agents involved in the simulation
+        self.r_dist = r_dist
+        self.mix = parse_mix(strategies) # population mix of decision strategies, see strategies.py
+        self.strategy_codes = None
+        self.threshold = None # payoff threshold of every agent, set with the agents
+        self.agents = [None for i in range(num_agents)]
+        # all agents' opinions live in one N x N matrix, or along the graph's edges if there is a topology
+        self.trust = TrustMatrix(num_agents) if topology is None else SparseTrustMatrix(topology)
+        # storage of each agent's true reliability score
+        self.r_arr = [0 for i in range(num_agents)]
+        self.reliabilities = None # r_arr as an array, for batched decisions
+        self.num_interactions = num_interactions
+        self.p_g = p_g  # good encounter payoff
+        self.p_b = p_b  # bad encounter payoff
+        self.alpha_direct = alpha_direct
+        self.alpha_indirect = alpha_indirect
+        self.rate_dist = rate_dist  # 'constant': every agent starts 1 encounter per unit time on average; 'exponential': rates ~ Exp(1)
+        self.gossip_latency = gossip_latency  # (mean) delay between a good encounter and the adoption of the partner's opinions
+        self.latency_dist = latency_dist  # 'constant' or 'exponential'
+        self.tick = tick  # length of a scheduler tick, in the same time units as the rates
+        self.total_payout = 0  # total payoff accumulated
+        self.encounter_history = EncounterRecorder(num_interactions, payout_dtype=np.result_type(p_g, p_b))
+        self.metrics_every = metrics_every  # snapshot the running metrics every k encounters (see metrics.py)
+        self.metrics = None
+        self.start_times = np.empty(num_interactions)  # time at which each recorded encounter started
+        self.events = []  # heap of (time, kind, sequence number, agent id, payload)
+        self.num_events = 0  # sequence numbers, for deterministic tie-breaking
+        self.gossip_in_flight = 0  # gossip scheduled but not yet delivered
+        # run statistics, filled in by run()
+        self.num_ticks = 0
+        self.max_gossip_in_flight = 0
+        self.wall_time = 0.0
+        self.encounters_per_second = 0.0
+        self.log_dir = log_dir
+        if run_format not in RUN_FORMATS:
+            raise ValueError(f'unknown run format: {run_format}, expected one of {RUN_FORMATS}')
+        self.run_format = run_format # output tables as 'csv', binary 'npy' tables (see runfile.py) or 'both'
+        os.makedirs(os.path.dirname(f'{log_dir}/game{self.run_no}/'), exist_ok=True)
+        os.makedirs(agent_log_dir, exist_ok=True)
+        self.log = make_sink(log_sink, f'{log_dir}/game{self.run_no}/game_log_{self.run_no}.txt',
+                             every=log_every, echo=log_echo, buffer_size=log_buffer_size)
+        self.df = None
+        self.df2 = None
+        self.csv_path = f'{log_dir}/game{self.run_no}/game_log_{self.run_no}.csv'
+        self.csv_path2 = f'{agent_log_dir}/game_log_{self.run_no}.csv'
+        self.csv_path_metrics = f'{log_dir}/game{self.run_no}/game_metrics_{self.run_no}.csv'
+
+    def initialize_agents(self):
+        game_desc_df_row = {
+            'run_no': self.run_no,
+            'num_agents': self.num_agents,
+            'r_dist': self.r_dist,
+            'agent_type': mix_spec(self.mix),
+            'num_interactions': self.num_interactions,
+            'p_g': self.p_g,
+            'p_b': self.p_b,
+            'alpha_direct': self.alpha_direct,
+            'alpha_indirect': self.alpha_indirect,
+            'seed': self.seed,
+            'pairing': self.pairing,
+            'topology': self.topology.spec if self.topology is not None else None,
+            'rate_dist': self.rate_dist,
+            'gossip_latency': self.gossip_latency,
+            'latency_dist': self.latency_dist,
+            'tick': self.tick
+        }
+        if self.pairing_weights is not None:
+            game_desc_df_row['pairing_weights'] = record_pairing_weights(f'{self.log_dir}/game_descriptions.csv', self.run_no, self.pairing_weights)
+        record_game_description(f'{self.log_dir}/game_descriptions.csv', game_desc_df_row)
+        self.description = game_desc_df_row # stored in the header of binary run tables
+        self.r_arr = sample_reliabilities(self.rng, self.r_dist, self.num_agents).tolist()
+        self.strategy_codes = assign_strategies(self.mix, self.num_agents, self.rng)
+        exp_r = EXPECTED_RELIABILITY[self.r_dist]
+        threshold = payoff_threshold(self.r_dist, self.p_g, self.p_b)
+        self.threshold = threshold
+        self.reliabilities = np.array(self.r_arr)
+        for i in range(self.num_agents):
+            self.agents[i] = LearnTrustAgent(
+                i, self.r_arr[i], self.alpha_direct, self.alpha_indirect, exp_r, threshold,
+                registers=self.trust.registers(i), rng=self.rng, num_agents=self.num_agents,
+                strategy=strategy_name(self.strategy_codes[i]))
+        self.metrics = OnlineMetrics(self.trust, self.r_arr, every=self.metrics_every, payout_dtype=np.result_type(self.p_g, self.p_b))
+
+        if self.rate_dist == 'constant':
+            self.rates = np.ones(self.num_agents)
+        elif self.rate_dist == 'exponential':
+            self.rates = self.rng.standard_exponential(self.num_agents)
+        else:
+            raise ValueError(f'unknown rate distribution: {self.rate_dist}')
+        if isinstance(self.pairs, GraphPairs):
+            self.rates[self.pairs.degrees == 0] = 0 # agents without neighbours never start an encounter
+        # every agent with a positive rate schedules its first encounter
+        first_starts = self.rng.standard_exponential(self.num_agents)
+        for i in np.flatnonzero(self.rates).tolist():
+            self.schedule(first_starts[i] / self.rates[i], ENCOUNTER, i)
+
+    def schedule(self, event_time: float, kind: int, agent_id: int, payload=None):
+        heapq.heappush(self.events, (event_time, kind, self.num_events, agent_id, payload))
+        self.num_events += 1
+        if kind == GOSSIP:
+            self.gossip_in_flight += 1
+
+    def latencies(self, size: int) -> np.ndarray:
+        if self.latency_dist == 'constant':
+            return np.full(size, float(self.gossip_latency))
+        if self.latency_dist == 'exponential':
+            return self.rng.standard_exponential(size) * self.gossip_latency
+        raise ValueError(f'unknown latency distribution: {self.latency_dist}')
+
+    def run_tick(self, tick_end: float):
+        '''
+        deliver the gossip and play the encounters of one scheduler tick
+        args:
+            tick_end: events scheduled before this time belong to the tick
+        '''
+        remaining = self.num_interactions - len(self.encounter_history)
+        started = []
+        events = self.events
+        while events and events[0][0] < tick_end:
+            event = heapq.heappop(events)
+            event_time, kind, _, agent_id, payload = event
+            if kind == GOSSIP:
+                passive_id, passive_registers = payload
+                self.agents[agent_id].adopt_opinions(passive_id, passive_registers)
+                self.metrics.row_changed(agent_id)
+                self.gossip_in_flight -= 1
+            elif len(started) < remaining:
+                started.append((event_time, agent_id))
+            else:
+                heapq.heappush(events, event) # the game ends before this encounter starts
+                break
+        if not started:
+            return
+
+        # draw the whole batch at once: partner, outcome and next start time of every started encounter
+        start_times = np.array([event_time for event_time, _ in started])
+        active_ids = np.array([agent_id for _, agent_id in started])
+        draws = self.rng.random((len(started), 2))
+        passive_ids = self.pairs.partners(self.rng, active_ids, draws[:, 0])
+        next_starts = start_times + self.rng.standard_exponential(len(started)) / self.rates[active_ids]
+        latencies = self.latencies(len(started)).tolist()
+        # gossip is only adopted at the start of a tick, so an encounter of the tick only changes its active agent's opinion
+        # of its partner: a run of encounters without a repeated pair can be decided with one strategies.decide call.
+        # a run shorter than MIN_BATCH_DECISIONS, e.g. in a tick of a small game, is decided by the agents one at a time
+        run_ends = decision_runs(active_ids * self.num_agents + passive_ids) if len(started) >= MIN_BATCH_DECISIONS else None
+        run_end = 0
+        run_accepted = None
+
+        for k, (start_time, active_id, passive_id, reliability_sample) in enumerate(
+                zip(start_times.tolist(), active_ids.tolist(), passive_ids.tolist(), draws[:, 1].tolist())):
+            if run_ends is not None and k == run_end:
+                run_start, run_end = k, int(run_ends[k])
+                run_accepted = None
+                if run_end - run_start >= MIN_BATCH_DECISIONS:
+                    active, passive = active_ids[run_start:run_end], passive_ids[run_start:run_end]
+                    opinions = self.trust.get_opinions(active, passive)
+                    run_accepted = decide(self.strategy_codes[active], opinions, self.reliabilities[passive],
+                                          self.p_g, self.p_b, self.threshold).tolist()
+                    opinions = opinions.tolist()
+            active_agent = self.agents[active_id]
+            passive_agent = self.agents[passive_id]
+            if run_accepted is None:
+                active_agent_opinion = active_agent.get_opinion(passive_id)
+                decision = None
+            else:
+                active_agent_opinion = opinions[k - run_start]
+                decision = run_accepted[k - run_start]
+            accepted, success = active_agent.handle_encounter(
+                passive_id,
+                passive_agent.get_reliability(),
+                passive_agent.get_registers(),
+                self.p_g,
+                self.p_b,
+                reliability_sample,
+                defer_indirect=True,
+                accepted=decision
+            )
+            payout = 0
+            if accepted and success:
+                payout = self.p_g
+                # the passive agent's opinions as they are now reach the active agent after the latency
+                self.schedule(start_time + latencies[k], GOSSIP, active_id, (passive_id, passive_agent.get_registers().snapshot()))
+            elif accepted and not success:
+                payout = self.p_b
+            if accepted:
+                self.metrics.opinion_changed(active_id, passive_id, active_agent_opinion)
+            self.total_payout += payout
+            self.metrics.record(active_id, passive_id, accepted, success, payout)
+            i = len(self.encounter_history)
+            self.start_times[i] = start_time
+            self.encounter_history.append(
+                active_id,
+                passive_id,
+                active_agent.get_reliability(),
+                passive_agent.get_reliability(),
+                active_agent_opinion,
+                accepted,
+                success,
+                self.total_payout
+            )
+            if self.log.accepts(i):
+                self.log.write((i, active_id, passive_id, active_agent.get_reliability(), passive_agent.get_reliability(),
+                                active_agent_opinion, accepted, success, self.total_payout))
+        for next_start, active_id in zip(next_starts.tolist(), active_ids.tolist()):
+            self.schedule(next_start, ENCOUNTER, active_id)
+
+    def run(self):
+        self.initialize_agents()
+        wall_start = time.perf_counter()
+        while len(self.encounter_history) < self.num_interactions and self.events:
+            # skip empty ticks: jump straight to the tick holding the next event
+            tick_end = (np.floor(self.events[0][0] / self.tick) + 1) * self.tick
+            self.run_tick(tick_end)
+            self.num_ticks += 1
+            self.max_gossip_in_flight = max(self.max_gossip_in_flight, self.gossip_in_flight)
+        # deliver the gossip still in flight, so the final opinions include every good encounter
+        while self.events:
+            _, kind, _, agent_id, payload = heapq.heappop(self.events)
+            if kind == GOSSIP:
+                self.agents[agent_id].adopt_opinions(*payload)
+                self.metrics.row_changed(agent_id)
+                self.gossip_in_flight -= 1
+        self.wall_time = time.perf_counter() - wall_start
+        self.encounters_per_second = len(self.encounter_history) / self.wall_time if self.wall_time > 0 else float('inf')
+        self.log.close()
+        self.metrics.finish()
+        save_run_table(self.metrics.snapshots_dataframe(), self.csv_path_metrics, self.run_format, self.description)
+        self.df = self.encounter_history.to_dataframe()
+        self.df.insert(0, 'start_time', self.start_times[:len(self.encounter_history)])
+        save_run_table(self.df, self.csv_path, self.run_format, self.description)
+        return self.encounter_history
+
+    def log_end_info(self, encounter_history):
+        export_game_descriptions(f'{self.log_dir}/game_descriptions.csv')
+        payoffs = self.metrics.payoffs
+        acceptance_rate, success_rate, opinion_mae = self.metrics.agent_rates()
+        self.df2 = pd.DataFrame({
+            'agent_id': np.arange(self.num_agents),
+            'reliability': [agent.get_reliability() for agent in self.agents],
+            'strategy': [agent.strategy for agent in self.agents],
+            'rate': self.rates,
+            'total_payoff': payoffs,
+            'acceptance_rate': acceptance_rate,
+            'success_rate': success_rate,
+            'opinion_mae': opinion_mae
+        })
+        save_run_table(self.df2, self.csv_path2, self.run_format, self.description)
+
+        print("Total payoff:")
+        print(payoffs.sum())
+        print(f"Throughput: {self.encounters_per_second:.0f} encounters/s "
+              f"({len(encounter_history)} encounters in {self.num_ticks} ticks, {self.wall_time:.3f} s)")
+        print(f"Mean encounters per tick: {len(encounter_history) / max(self.num_ticks, 1):.1f}, "
+              f"max gossip in flight: {self.max_gossip_in_flight}")
+
+
+def replay(run_no, descriptions_path='logs_async/game_descriptions.csv', **kwargs):
+    '''
+    regenerate a logged run from its recorded description and seed
+    args:
+        run_no: run number of the logged game
+        descriptions_path: game_descriptions.csv the run was recorded in
+        kwargs: other Game arguments, e.g. log_dir and log_sink, so the replay does not overwrite the original logs.
+            a run with 'weighted' pairing is replayed with its recorded weights, unless pairing_weights is given
+    returns:
+        the Game, after it has been run
+    '''
+    description = load_game_description(descriptions_path, run_no)
+    pairing_weights = kwargs.pop('pairing_weights', description['pairing_weights'])
+    if description['pairing'] == 'weighted' and pairing_weights is None:
+        raise ValueError(f'run {run_no} was recorded without its pairing weights; pass them to replay as pairing_weights')
+    game = Game(run_no=run_no, num_agents=description['num_agents'], r_dist=description['r_dist'],
+                num_interactions=description['num_interactions'], p_g=description['p_g'], p_b=description['p_b'],
+                alpha_direct=description['alpha_direct'], alpha_indirect=description['alpha_indirect'],
+                seed=description['seed'], pairing=description['pairing'], pairing_weights=pairing_weights, topology=description['topology'],
+                strategies=description['agent_type'], rate_dist=description['rate_dist'], gossip_latency=description['gossip_latency'],
+                latency_dist=description['latency_dist'], tick=description['tick'], **kwargs)
+    game.run()
+    return game
+
+
+def main():
+    game = Game(run_no=Config.run_no, num_agents=Config.num_agents, r_dist=Config.r_dist,
+                num_interactions=Config.num_encounters, p_g=Config.p_g, p_b=Config.p_b,
+                alpha_direct=Config.alpha_direct, alpha_indirect=Config.alpha_indirect, seed=Config.seed, pairing=Config.pairing,
+                pairing_weights=Config.pairing_weights, topology=Config.topology, strategies=Config.strategies, rate_dist=Config.rate_dist, gossip_latency=Config.gossip_latency,
+                latency_dist=Config.latency_dist, tick=Config.tick,
+                log_sink=Config.log_sink, log_every=Config.log_every, log_echo=Config.log_echo,
+                log_buffer_size=Config.log_buffer_size, run_format=Config.run_format, metrics_every=Config.metrics_every)
+    game.run()
+    game.log_end_info(game.encounter_history)
+
+
+if __name__ == "__main__":
+    main()
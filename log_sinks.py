@@ -0,0 +1,233 @@
+'''
+This Python library provides the sinks a Game writes its per-encounter log to.
+A record is a plain tuple of raw values; it is only formatted when a sink
+actually consumes it, so a game with logging turned off does no string
+formatting on the hot path.
+
+Sinks:
+* NullSink: drops everything
+* TextSink: buffers raw records and formats/writes them in batches, optionally echoing to stdout
+* BinarySink: buffers records in a NumPy structured array and appends it to a file with tofile()
+* SampledSink: wraps another sink and only passes on every k-th record
+
+tell() flushes a sink and returns its file position; a sink opened with that
+position as its offset continues the file from there, which is how a resumed
+game (see checkpoint.py) picks up its logs.
+'''
+
+import sys
+import numpy as np
+from recorder import ENCOUNTER_COLUMNS
+
+# binary layouts of the two record types
+ENCOUNTER_LOG_DTYPE = np.dtype([('encounter', np.int64)] + list(ENCOUNTER_COLUMNS.items()))
+FAILURE_LOG_DTYPE = np.dtype([('trial', np.int64), ('passive_id', np.int32), ('num_attempts', np.int64), ('penalty', np.float64)])
+
+
+def format_encounter(record) -> str:
+    '''
+    record: (i, active_id, passive_id, active_reliability, passive_reliability, opinion, accepted, result, total_payout)
+    '''
+    i, active_id, passive_id, active_reliability, passive_reliability, opinion, accepted, result, total_payout = record
+    return f"""ENCOUNTER {i}.
+Active ID: {active_id}
+Passive ID: {passive_id}
+Active agent reliability: {active_reliability}
+Passive agent reliability: {passive_reliability}
+Passive agent's opinion of active agent: {opinion}
+Encounter accepted: {accepted}
+Encounter result: {result}
+Total payout: {total_payout}
+
+###########################
+"""
+
+
+def format_failure(record) -> str:
+    '''
+    record: (trial, passive_id, num_attempts, penalty)
+    '''
+    trial, passive_id, num_attempts, penalty = record
+    return f'Run {trial}: Passive agent {passive_id} took {num_attempts} attempts to get a successful encounter. Penalty this agent incurred: {penalty}\n'
+
+
+def open_at(path: str, offset: int = None, binary: bool = False):
+    '''
+    open a log file for writing: a new, empty file, or an existing one truncated to offset and positioned there
+    '''
+    if offset is None:
+        return open(path, 'wb' if binary else 'w')
+    file = open(path, 'rb+' if binary else 'r+')
+    file.seek(offset)
+    file.truncate()
+    return file
+
+
+class NullSink:
+    '''
+    Sink that accepts nothing. Callers check accepts() before building a record,
+    so with this sink the hot path does no logging work at all.
+    '''
+
+    def accepts(self, i: int) -> bool:
+        return False
+
+    def write(self, record):
+        pass
+
+    def flush(self):
+        pass
+
+    def tell(self) -> int:
+        return 0
+
+    def close(self):
+        pass
+
+
+class TextSink:
+    '''
+    Sink that formats records as text. Raw records are buffered and only
+    formatted when the buffer is flushed.
+
+    Attributes
+    ----------
+    path : str
+        text file the records are written to, or None to only echo
+    formatter : function
+        turns a record tuple into a string
+    buffer_size : int
+        number of records held before formatting and writing them
+    echo : bool
+        whether to also print formatted records to stdout
+    offset : int
+        if given, continue an existing file from this position (from tell()) rather than starting a new one
+    '''
+
+    def __init__(self, path: str, formatter=format_encounter, buffer_size: int = 1000, echo: bool = False, offset: int = None):
+        self.path = path
+        self.file = open_at(path, offset, binary=False) if path is not None else None
+        self.formatter = formatter
+        self.buffer_size = buffer_size
+        self.echo = echo
+        self.buffer = []
+
+    def accepts(self, i: int) -> bool:
+        return True
+
+    def write(self, record):
+        self.buffer.append(record)
+        if len(self.buffer) >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        if not self.buffer:
+            return
+        formatted = [self.formatter(record) for record in self.buffer]
+        self.buffer = []
+        if self.file is not None:
+            self.file.writelines(formatted)
+            self.file.flush()
+        if self.echo:
+            sys.stdout.write(''.join(text + '\n' for text in formatted))
+
+    def tell(self) -> int:
+        self.flush()
+        return self.file.tell() if self.file is not None else 0
+
+    def close(self):
+        self.flush()
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+class BinarySink:
+    '''
+    Sink that writes fixed-width binary records. Records are copied into a
+    preallocated structured array and appended to the file in one tofile() call
+    per buffer. Read the file back with np.fromfile(path, dtype=sink.dtype).
+    '''
+
+    def __init__(self, path: str, dtype=ENCOUNTER_LOG_DTYPE, buffer_size: int = 4096, offset: int = None):
+        self.path = path
+        self.dtype = np.dtype(dtype)
+        self.file = open_at(path, offset, binary=True)
+        self.buffer = np.empty(buffer_size, dtype=self.dtype)
+        self.size = 0
+
+    def accepts(self, i: int) -> bool:
+        return True
+
+    def write(self, record):
+        self.buffer[self.size] = record
+        self.size += 1
+        if self.size == len(self.buffer):
+            self.flush()
+
+    def flush(self):
+        if self.size:
+            self.buffer[:self.size].tofile(self.file)
+            self.file.flush()
+            self.size = 0
+
+    def tell(self) -> int:
+        self.flush()
+        return self.file.tell()
+
+    def close(self):
+        self.flush()
+        if not self.file.closed:
+            self.file.close()
+
+
+class SampledSink:
+    '''
+    Sink that forwards only every k-th record (by record index) to another sink
+    '''
+
+    def __init__(self, sink, every: int):
+        self.sink = sink
+        self.every = every
+
+    def accepts(self, i: int) -> bool:
+        return i % self.every == 0 and self.sink.accepts(i)
+
+    def write(self, record):
+        self.sink.write(record)
+
+    def flush(self):
+        self.sink.flush()
+
+    def tell(self) -> int:
+        return self.sink.tell()
+
+    def close(self):
+        self.sink.close()
+
+
+def make_sink(kind: str, path: str, every: int = 1, echo: bool = False, buffer_size: int = 1000,
+              formatter=format_encounter, dtype=ENCOUNTER_LOG_DTYPE, offset: int = None):
+    '''
+    build a sink from its Config description
+    args:
+        kind: 'null', 'text', 'binary' or 'sampled' (text, every k-th record)
+        path: path of the text log; binary sinks write to the same path with a .bin suffix
+        every: keep every k-th record. values above 1 sample any kind of sink
+        echo: whether text sinks also print records to stdout
+        buffer_size: number of records buffered before a write
+        formatter: text formatter for the record type
+        dtype: binary layout for the record type
+        offset: continue an existing log from this position (see tell()) instead of starting a new one
+    '''
+    if kind == 'null':
+        return NullSink()
+    if kind in ('text', 'sampled'):
+        sink = TextSink(path, formatter, buffer_size, echo, offset)
+    elif kind == 'binary':
+        sink = BinarySink(path.rsplit('.', 1)[0] + '.bin', dtype, buffer_size, offset)
+    else:
+        raise ValueError(f'unknown log sink: {kind}')
+    if every > 1:
+        sink = SampledSink(sink, every)
+    return sink
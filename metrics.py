@@ -0,0 +1,181 @@
+'''
+This Python library keeps running metrics of a game while it is played, so
+per-agent payoffs, acceptance and success rates and the opinion error never
+have to be rebuilt from the encounter history afterwards.
+
+Encounter counts and payoffs are updated in O(1) per encounter. The opinion
+error is kept as one summed absolute error per agent: a direct update adjusts
+it by the change in one opinion, and a row changed by an indirect update is
+recomputed the next time the error is read, so a row updated many times
+between snapshots (or kept pending by a LazyTrustMatrix) is read once. Every k encounters
+a snapshot of the cumulative and windowed metrics is taken, so the
+trajectory of a long run can be plotted without keeping its history.
+'''
+
+import numpy as np
+
+SNAPSHOT_COLUMNS = ['encounter', 'total_payout', 'acceptance_rate', 'success_rate', 'window_encounters', 'window_accepted',
+                    'window_payout', 'window_acceptance_rate', 'window_success_rate', 'opinion_mae']
+
+
+class OnlineMetrics:
+    '''
+    Running aggregates of one game.
+
+    Attributes
+    ----------
+    payoffs : np.ndarray
+        per-agent payoff; both agents of an accepted encounter receive its payout
+    proposals, accepted, successes : np.ndarray
+        per-agent number of encounters decided, accepted and good, counted for the deciding agent
+    row_errors : np.ndarray
+        per-agent summed absolute error of its opinions versus the true reliabilities
+    snapshots : list
+        list of dicts, one every `every` encounters
+
+    Methods
+    -------
+    record(decider_id, other_id, accepted, success, payout)
+        count one encounter
+    opinion_changed(i, j, old_opinion)
+        account for a direct update of agent i's opinion of agent j
+    row_changed(i)
+        account for an update of (potentially) all of agent i's opinions
+    refresh()
+        recompute the errors of the rows changed since the last refresh
+    opinion_mae()
+        returns the current mean absolute opinion error
+    snapshot()
+        record the current metrics in snapshots
+    '''
+
+    def __init__(self, trust, reliabilities, every: int = 100, payout_dtype=np.float64):
+        self.trust = trust
+        self.reliabilities = np.asarray(reliabilities, dtype=np.float64)
+        self.every = every # take a snapshot every k encounters; 0 disables snapshots
+        num_agents = trust.num_agents
+        self.payoffs = np.zeros(num_agents, dtype=payout_dtype)
+        self.proposals = np.zeros(num_agents, dtype=np.int64)
+        self.accepted = np.zeros(num_agents, dtype=np.int64)
+        self.successes = np.zeros(num_agents, dtype=np.int64)
+        self.row_errors = trust.row_errors(self.reliabilities)
+        self.stale_rows = set() # rows whose error must be recomputed before it is read
+        self.num_encounters = 0
+        self.num_accepted = 0
+        self.num_successes = 0
+        self.total_payout = 0
+        # counts since the last snapshot
+        self.window_encounters = 0
+        self.window_accepted = 0
+        self.window_successes = 0
+        self.window_payout = 0
+        self.snapshots = []
+
+    def record(self, decider_id: int, other_id: int, accepted: bool, success: bool, payout):
+        '''
+        count one encounter
+        args:
+            decider_id: agent that decided whether to accept the encounter
+            other_id: the other agent
+            accepted, success: outcome of the encounter
+            payout: payout of the encounter to each agent, 0 if it was rejected
+        '''
+        self.num_encounters += 1
+        self.window_encounters += 1
+        self.proposals[decider_id] += 1
+        if accepted:
+            self.num_accepted += 1
+            self.window_accepted += 1
+            self.accepted[decider_id] += 1
+            self.payoffs[decider_id] += payout
+            self.payoffs[other_id] += payout
+            self.total_payout += payout
+            self.window_payout += payout
+            if success:
+                self.num_successes += 1
+                self.window_successes += 1
+                self.successes[decider_id] += 1
+        if self.every and self.num_encounters % self.every == 0:
+            self.snapshot()
+
+    def opinion_changed(self, i: int, j: int, old_opinion: float):
+        reliability = self.reliabilities[j]
+        self.row_errors[i] += abs(self.trust.get_opinion(i, j) - reliability) - abs(old_opinion - reliability)
+
+    def row_changed(self, i: int):
+        self.stale_rows.add(i)
+
+    def refresh(self):
+        for i in self.stale_rows:
+            self.row_errors[i] = self.trust.row_error(i, self.reliabilities)
+        self.stale_rows.clear()
+
+    def opinion_mae(self) -> float:
+        self.refresh()
+        num_opinions = self.trust.num_opinions
+        return float(self.row_errors.sum() / num_opinions) if num_opinions else 0.0
+
+    def snapshot(self) -> dict:
+        snapshot = {
+            'encounter': self.num_encounters,
+            'total_payout': self.total_payout,
+            'acceptance_rate': self.num_accepted / self.num_encounters if self.num_encounters else np.nan,
+            'success_rate': self.num_successes / self.num_accepted if self.num_accepted else np.nan,
+            'window_encounters': self.window_encounters,
+            'window_accepted': self.window_accepted,
+            'window_payout': self.window_payout,
+            'window_acceptance_rate': self.window_accepted / self.window_encounters if self.window_encounters else np.nan,
+            'window_success_rate': self.window_successes / self.window_accepted if self.window_accepted else np.nan,
+            'opinion_mae': self.opinion_mae()
+        }
+        self.snapshots.append(snapshot)
+        self.window_encounters = self.window_accepted = self.window_successes = 0
+        self.window_payout = 0
+        return snapshot
+
+    def finish(self):
+        '''
+        take a last snapshot if encounters were played since the previous one
+        '''
+        if self.window_encounters:
+            self.snapshot()
+
+    def snapshot_columns(self) -> dict:
+        '''
+        returns the snapshots as a dict mapping each of SNAPSHOT_COLUMNS to an array, for run tables
+        '''
+        return {name: np.array([snapshot[name] for snapshot in self.snapshots]) for name in SNAPSHOT_COLUMNS}
+
+    def snapshots_dataframe(self) -> 'pd.DataFrame':
+        import pandas as pd
+        return pd.DataFrame(self.snapshots, columns=SNAPSHOT_COLUMNS)
+
+    def get_state(self):
+        '''
+        returns (arrays, scalars) describing the metrics, for checkpoints
+        '''
+        self.refresh()
+        arrays = {name: getattr(self, name).copy() for name in ('payoffs', 'proposals', 'accepted', 'successes', 'row_errors')}
+        scalars = {name: getattr(self, name) for name in ('num_encounters', 'num_accepted', 'num_successes', 'total_payout', 'window_encounters',
+                                                          'window_accepted', 'window_successes', 'window_payout')}
+        scalars['snapshots'] = list(self.snapshots)
+        return arrays, scalars
+
+    def set_state(self, arrays: dict, scalars: dict):
+        for name, array in arrays.items():
+            getattr(self, name)[:] = array
+        for name, value in scalars.items():
+            setattr(self, name, value)
+
+    def agent_rates(self):
+        '''
+        returns per-agent acceptance rates, success rates (of accepted encounters) and mean opinion errors.
+        agents that never decided (or never accepted) get NaN rates
+        '''
+        self.refresh()
+        with np.errstate(invalid='ignore', divide='ignore'):
+            acceptance_rate = np.where(self.proposals > 0, self.accepted / self.proposals, np.nan)
+            success_rate = np.where(self.accepted > 0, self.successes / self.accepted, np.nan)
+            row_sizes = self.trust.row_sizes()
+            opinion_mae = np.where(row_sizes > 0, self.row_errors / row_sizes, np.nan)
+        return acceptance_rate, success_rate, opinion_mae
@@ -0,0 +1,139 @@
+'''
+This Python library is the opt-in instrumentation of the encounter loop: per-phase
+timers and counters for Game.run_encounter (simulation.py), the trials of
+simulation_failures.py and LearnTrustAgent.handle_encounter.
+
+Only one in every `sample_every` encounters (or trials) is timed, which keeps
+the overhead to a few percent; counters, such as the number of indirect updates
+and of register entries they touch, are exact. Phases are named by their path,
+e.g. 'encounter;handle_encounter;decision', and can be exported as a summary
+table, as a Chrome trace (chrome://tracing, Perfetto, speedscope) or as folded
+stacks for flamegraph.pl.
+'''
+
+import json
+import time
+from collections import defaultdict
+import numpy as np
+
+
+class Profiler:
+    '''
+    Sampled per-phase timers and exact counters.
+
+    Attributes
+    ----------
+    sample_every : int
+        time one in every k encounters (or trials)
+    timing : bool
+        whether the current encounter is being timed
+    agent_scope : str
+        path the phases of LearnTrustAgent.handle_encounter are recorded under
+    seconds, calls : dict
+        per phase path, the summed time of its timed calls and their number
+    counters : dict
+        exact counts, e.g. 'indirect_updates' and 'register_entries'
+    events : list
+        (path, start_ns, end_ns) of timed phases, at most max_events, for the trace export
+
+    Methods
+    -------
+    start(i)
+        decide whether encounter (or trial) i is timed
+    add(path, start_ns, end_ns)
+        record one timed phase
+    add_agent_phase(name, start_ns, end_ns)
+        record one timed phase of handle_encounter, under agent_scope
+    count(name, n)
+        add n to a counter
+    summary()
+        returns a DataFrame with one row per phase
+    write_chrome_trace(path)
+        write the timed phases as a Chrome trace
+    write_folded(path)
+        write the timed phases as folded stacks
+    '''
+
+    clock = staticmethod(time.perf_counter_ns)
+
+    def __init__(self, sample_every: int = 100, max_events: int = 100000, agent_scope: str = 'encounter;handle_encounter'):
+        self.sample_every = max(int(sample_every), 1)
+        self.max_events = max_events
+        self.agent_scope = agent_scope
+        self.timing = False
+        self.seconds = defaultdict(float)
+        self.calls = defaultdict(int)
+        self.counters = defaultdict(int)
+        self.events = []
+
+    def start(self, i: int) -> bool:
+        self.timing = i % self.sample_every == 0
+        return self.timing
+
+    def add(self, path: str, start_ns: int, end_ns: int):
+        self.seconds[path] += (end_ns - start_ns) * 1e-9
+        self.calls[path] += 1
+        if len(self.events) < self.max_events:
+            self.events.append((path, start_ns, end_ns))
+
+    def add_agent_phase(self, name: str, start_ns: int, end_ns: int):
+        self.add(f'{self.agent_scope};{name}', start_ns, end_ns)
+
+    def count(self, name: str, n: int = 1):
+        self.counters[name] += n
+
+    def self_seconds(self) -> dict:
+        '''
+        returns per phase path the time spent in the phase itself, excluding its child phases
+        '''
+        own = dict(self.seconds)
+        for path, seconds in self.seconds.items():
+            parent = path.rpartition(';')[0]
+            if parent in own:
+                own[parent] -= seconds
+        return own
+
+    def summary(self) -> 'pd.DataFrame':
+        '''
+        returns one row per phase: the number of timed calls, their mean and total time, the time estimated
+        for all (timed and untimed) calls, and the share of the phase's root (e.g. the whole encounter)
+        '''
+        import pandas as pd
+        paths = sorted(self.seconds)
+        seconds = np.array([self.seconds[path] for path in paths])
+        calls = np.array([self.calls[path] for path in paths])
+        roots = np.array([self.seconds.get(path.split(';')[0], np.nan) for path in paths])
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return pd.DataFrame({
+                'phase': paths,
+                'timed_calls': calls,
+                'timed_seconds': seconds,
+                'mean_us': seconds / calls * 1e6,
+                'estimated_seconds': seconds * self.sample_every,
+                'share': seconds / roots
+            })
+
+    def counters_dict(self) -> dict:
+        return {name: int(count) for name, count in self.counters.items()}
+
+    def write_chrome_trace(self, path: str):
+        '''
+        write the timed phases in the Chrome trace event format, nested by time
+        '''
+        origin = min((start for _, start, _ in self.events), default=0)
+        events = [{'name': phase.rpartition(';')[2], 'cat': 'phase', 'ph': 'X', 'ts': (start - origin) / 1000,
+                   'dur': (end - start) / 1000, 'pid': 0, 'tid': 0, 'args': {'path': phase}}
+                  for phase, start, end in self.events]
+        events.append({'name': 'counters', 'ph': 'C', 'ts': 0, 'pid': 0, 'tid': 0, 'args': self.counters_dict()})
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ns',
+                       'otherData': {'sample_every': self.sample_every}}, f)
+
+    def write_folded(self, path: str):
+        '''
+        write folded stacks ('encounter;handle_encounter;decision <microseconds>'), one line per phase,
+        weighted by the phase's own time
+        '''
+        with open(path, 'w') as f:
+            for phase, seconds in sorted(self.self_seconds().items()):
+                f.write(f'{phase} {max(int(round(seconds * 1e6)), 0)}\n')
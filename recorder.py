@@ -0,0 +1,125 @@
+'''
+This Python library records encounters into preallocated, typed NumPy columns.
+Columns grow geometrically, so appending an encounter is amortized O(1), and
+the table is only turned into a DataFrame or CSV once, at the end of a run.
+'''
+
+import numpy as np
+
+# column name -> dtype. total_payout's dtype is chosen per game from p_g and p_b
+ENCOUNTER_COLUMNS = {
+    'active_id': np.int32,
+    'passive_id': np.int32,
+    'active_reliability': np.float64,
+    'passive_reliability': np.float64,
+    'passive_opinion': np.float64,
+    'accepted': np.bool_,
+    'result': np.bool_,
+    'total_payout': np.float64,
+}
+
+
+class EncounterRecorder:
+    '''
+    Columnar encounter history.
+
+    Attributes
+    ----------
+    capacity : int
+        number of rows currently allocated
+    columns : dict
+        dict mapping column name to its (over-allocated) NumPy array
+
+    Methods
+    -------
+    append(active_id, passive_id, active_reliability, passive_reliability, passive_opinion, accepted, result, total_payout)
+        record one encounter
+    restore(columns)
+        replace the history with previously recorded columns
+    column(name)
+        returns the filled part of a column
+    payoffs(num_agents, p_g, p_b)
+        returns per-agent payoffs, aggregated with np.bincount
+    to_dataframe()
+        returns the history as a pandas DataFrame
+    to_csv(path)
+        writes the history to a CSV file with the same layout as Game.df
+    '''
+
+    def __init__(self, capacity: int = 1024, payout_dtype=np.float64):
+        self.capacity = max(int(capacity), 1)
+        self.dtypes = dict(ENCOUNTER_COLUMNS, total_payout=payout_dtype)
+        self.columns = {name: np.empty(self.capacity, dtype=dtype) for name, dtype in self.dtypes.items()}
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def __iter__(self):
+        '''
+        yields each encounter as a dict, like the old list-of-dicts encounter history
+        '''
+        names = list(self.dtypes)
+        for values in zip(*(self.column(name).tolist() for name in names)):
+            yield dict(zip(names, values))
+
+    def _grow(self):
+        self.capacity *= 2
+        for name, array in self.columns.items():
+            grown = np.empty(self.capacity, dtype=array.dtype)
+            grown[:self.size] = array[:self.size]
+            self.columns[name] = grown
+
+    def append(self, active_id, passive_id, active_reliability, passive_reliability, passive_opinion, accepted, result, total_payout):
+        if self.size == self.capacity:
+            self._grow()
+        i = self.size
+        columns = self.columns
+        columns['active_id'][i] = active_id
+        columns['passive_id'][i] = passive_id
+        columns['active_reliability'][i] = active_reliability
+        columns['passive_reliability'][i] = passive_reliability
+        columns['passive_opinion'][i] = passive_opinion
+        columns['accepted'][i] = accepted
+        columns['result'][i] = result
+        columns['total_payout'][i] = total_payout
+        self.size = i + 1
+
+    def restore(self, columns: dict):
+        '''
+        replace the history with the given filled columns, e.g. from a checkpoint
+        '''
+        size = len(columns['active_id'])
+        while self.capacity < size:
+            self.capacity *= 2
+        self.columns = {name: np.empty(self.capacity, dtype=dtype) for name, dtype in self.dtypes.items()}
+        for name in self.dtypes:
+            self.columns[name][:size] = columns[name]
+        self.size = size
+
+    def column(self, name: str) -> np.ndarray:
+        return self.columns[name][:self.size]
+
+    def payoffs(self, num_agents: int, p_g: float, p_b: float) -> np.ndarray:
+        '''
+        returns an array of each agent's total payoff. both agents in an accepted
+        encounter receive p_g if it was good and p_b if it was bad; rejected
+        encounters pay nothing.
+        '''
+        payout = np.where(self.column('result'), p_g, p_b) * self.column('accepted')
+        payoffs = np.bincount(self.column('active_id'), weights=payout, minlength=num_agents)
+        payoffs += np.bincount(self.column('passive_id'), weights=payout, minlength=num_agents)
+        return payoffs.astype(self.dtypes['total_payout'])
+
+    def to_columns(self) -> dict:
+        '''
+        returns a dict mapping column name to its filled part, for run tables
+        '''
+        return {name: self.column(name) for name in self.dtypes}
+
+    def to_dataframe(self) -> 'pd.DataFrame':
+        import pandas as pd
+        return pd.DataFrame(self.to_columns())
+
+    def to_csv(self, path: str):
+        self.to_dataframe().to_csv(path)
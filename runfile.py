@@ -0,0 +1,247 @@
+'''
+This Python library stores run tables (encounter histories, per-agent payoffs,
+failure counts) in a compact columnar binary format, in place of CSV.
+
+A table is a directory holding one fixed-width .npy file per column and a
+small header.json with the number of rows, the column dtypes and the Game
+parameters (including the seed) of the run it came from:
+
+    logs/game0/game_log_0/
+        header.json
+        active_id.npy
+        passive_id.npy
+        ...
+
+load_table memory-maps the columns, so analysis reads only the pages it
+touches and never parses text. convert_csv and convert_logs turn existing CSV
+logs into tables. Writing a table only needs NumPy; pandas is imported when a
+table is written as CSV or read into a DataFrame.
+'''
+
+import json
+import os
+import re
+import shutil
+import sys
+from collections.abc import Mapping
+import numpy as np
+
+FORMAT_VERSION = 1
+RUN_FORMATS = ('csv', 'npy', 'both')
+
+
+def table_path(csv_path: str) -> str:
+    '''
+    returns the table directory that stands in for a CSV path, e.g. logs/game0/game_log_0.csv -> logs/game0/game_log_0
+    '''
+    return os.path.splitext(csv_path)[0]
+
+
+def json_safe(params: dict) -> dict:
+    '''
+    returns params with numpy scalars and missing values turned into plain JSON values
+    '''
+    pd = sys.modules.get('pandas') # pd.NA can only be among the values if pandas is loaded
+    safe = {}
+    for name, value in params.items():
+        if isinstance(value, np.generic):
+            value = value.item()
+        if (isinstance(value, float) and np.isnan(value)) or (pd is not None and value is pd.NA):
+            value = None
+        safe[name] = value
+    return safe
+
+
+def write_table(path: str, columns: dict, params: dict = None):
+    '''
+    write a table directory, replacing any earlier table at path
+    args:
+        path: table directory
+        columns: dict mapping column name to a 1-D array; all columns must have the same length
+        params: Game parameters of the run, stored in the header
+    '''
+    arrays = {}
+    for name, values in columns.items():
+        array = np.asarray(values)
+        # text columns become fixed-width unicode, so they can be memory-mapped like the rest
+        arrays[name] = array.astype(str) if array.dtype == object else array
+    lengths = {len(array) for array in arrays.values()}
+    if len(lengths) > 1:
+        raise ValueError(f'columns of {path} have different lengths: {sorted(lengths)}')
+    header = {
+        'version': FORMAT_VERSION,
+        'num_rows': lengths.pop() if lengths else 0,
+        'columns': {name: array.dtype.str for name, array in arrays.items()},
+        'params': json_safe(params or {})
+    }
+    # write into a scratch directory and move it into place, so readers never see a half-written table
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+    for name, array in arrays.items():
+        np.save(os.path.join(tmp_path, f'{name}.npy'), array, allow_pickle=False)
+    with open(os.path.join(tmp_path, 'header.json'), 'w') as f:
+        json.dump(header, f, indent=1)
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    os.replace(tmp_path, path)
+
+
+def save_run_table(table, csv_path: str, run_format: str = 'csv', params: dict = None):
+    '''
+    save a Game's output table as CSV, as a binary table at table_path(csv_path), or both
+    args:
+        table: DataFrame, or dict mapping column name to a 1-D array. a dict saved as 'npy' never imports pandas
+        csv_path: path of the CSV log
+        run_format: 'csv', 'npy' or 'both'
+        params: Game parameters, stored in the binary table's header
+    '''
+    if run_format not in RUN_FORMATS:
+        raise ValueError(f'unknown run format: {run_format}, expected one of {RUN_FORMATS}')
+    if run_format in ('csv', 'both'):
+        if isinstance(table, dict):
+            import pandas as pd
+            pd.DataFrame(table).to_csv(csv_path)
+        else:
+            table.to_csv(csv_path)
+    if run_format in ('npy', 'both'):
+        columns = table if isinstance(table, dict) else {str(name): table[name].to_numpy() for name in table.columns}
+        write_table(table_path(csv_path), columns, params)
+
+
+class RunTable(Mapping):
+    '''
+    Read-only, column-oriented view of a table directory. Maps column name to a
+    memory-mapped array.
+
+    Attributes
+    ----------
+    path : str
+        table directory
+    header : dict
+        contents of header.json
+    params : dict
+        Game parameters of the run, e.g. params['seed']
+    num_rows : int
+        number of rows of every column
+
+    Methods
+    -------
+    to_dataframe(columns)
+        returns (some of) the columns as a pandas DataFrame, copying them into memory
+    '''
+
+    def __init__(self, path: str, mmap: bool = True):
+        self.path = path
+        with open(os.path.join(path, 'header.json')) as f:
+            self.header = json.load(f)
+        self.params = self.header['params']
+        self.num_rows = self.header['num_rows']
+        mmap_mode = 'r' if mmap else None
+        self.columns = {name: np.load(os.path.join(path, f'{name}.npy'), mmap_mode=mmap_mode, allow_pickle=False)
+                        for name in self.header['columns']}
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    def __iter__(self):
+        return iter(self.columns)
+
+    def __len__(self):
+        return len(self.columns)
+
+    def __repr__(self):
+        return f'RunTable({self.path!r}, rows={self.num_rows}, columns={list(self.columns)})'
+
+    def to_dataframe(self, columns=None) -> 'pd.DataFrame':
+        import pandas as pd
+        names = list(self.columns) if columns is None else columns
+        return pd.DataFrame({name: np.array(self.columns[name]) for name in names})
+
+
+def load_table(path: str, mmap: bool = True) -> RunTable:
+    '''
+    open a table directory (or the table standing in for a CSV path)
+    args:
+        path: table directory, or the path of the CSV it replaces
+        mmap: memory-map the columns (zero-copy) rather than read them into memory
+    '''
+    if path.endswith('.csv'):
+        path = table_path(path)
+    return RunTable(path, mmap=mmap)
+
+
+def load_binary_log(path: str, dtype) -> np.memmap:
+    '''
+    memory-map a log written by log_sinks.BinarySink, e.g. with dtype=log_sinks.ENCOUNTER_LOG_DTYPE
+    '''
+    if os.path.getsize(path) == 0:
+        return np.empty(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode='r')
+
+
+def convert_csv(csv_path: str, path: str = None, params: dict = None) -> str:
+    '''
+    convert a CSV log written by a Game (with its index as the first column) into a table
+    args:
+        csv_path: CSV log
+        path: table directory, defaults to table_path(csv_path)
+        params: Game parameters to store in the header
+    returns:
+        the table directory
+    '''
+    import pandas as pd
+    df = pd.read_csv(csv_path, index_col=0)
+    path = path or table_path(csv_path)
+    write_table(path, {str(name): df[name].to_numpy() for name in df.columns}, params)
+    return path
+
+
+def run_params(descriptions: 'pd.DataFrame', run_no: int) -> dict:
+    '''
+    returns the recorded description of run_no, or an empty dict if it was not recorded
+    '''
+    if descriptions is None or 'run_no' not in descriptions:
+        return {}
+    rows = descriptions[descriptions['run_no'] == run_no]
+    if rows.empty:
+        return {}
+    return {name: value for name, value in rows.iloc[-1].to_dict().items() if not str(name).startswith('Unnamed')}
+
+
+def convert_logs(root: str, descriptions_path: str = None) -> list:
+    '''
+    convert every CSV log under root into a table next to it. logs named ..._<run_no>.csv get
+    the run's recorded description as their header parameters
+    args:
+        root: log directory, e.g. 'logs'
+        descriptions_path: game_descriptions.csv to take parameters from, defaults to root/game_descriptions.csv
+    returns:
+        list of the table directories written
+    '''
+    descriptions_path = descriptions_path or os.path.join(root, 'game_descriptions.csv')
+    from descriptions import read_game_descriptions
+    try:
+        descriptions = read_game_descriptions(descriptions_path)
+    except FileNotFoundError:
+        descriptions = None
+    written = []
+    for directory, _, names in sorted(os.walk(root)):
+        for name in sorted(names):
+            if not name.endswith('.csv') or name == 'game_descriptions.csv':
+                continue
+            match = re.search(r'_(\d+)\.csv$', name)
+            params = run_params(descriptions, int(match.group(1))) if match else {}
+            written.append(convert_csv(os.path.join(directory, name), params=params))
+    return written
+
+
+def main():
+    for root, descriptions_path in [('logs', None), ('logs_failures', None), ('karly_logs', 'logs/game_descriptions.csv')]:
+        if os.path.isdir(root):
+            written = convert_logs(root, descriptions_path)
+            print(f'{root}: converted {len(written)} CSV logs')
+
+
+if __name__ == "__main__":
+    main()
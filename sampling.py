@@ -0,0 +1,357 @@
+'''
+This Python library draws the random numbers that drive encounters. Draws are
+taken from a game's own numpy.random.Generator in large blocks, and every
+sample costs O(1), so pair sampling stays cheap for populations of 10^5-10^6
+agents.
+
+Who meets whom is decided by a pair distribution:
+* UniformPairs: any two distinct agents, uniformly
+* LocalPairs: agents sit on a ring and only meet agents within a fixed radius
+* WeightedPairs: agents take part in proportion to a weight (e.g. their degree),
+  sampled with a Walker/Vose alias table
+* GraphPairs: agents only meet their neighbours in a contact graph (see topology.py)
+
+For UniformPairs, LocalPairs and GraphPairs every encounter consumes a fixed number of
+doubles, so the sequence of encounters only depends on the seed, not on the
+block size. WeightedPairs redraws collisions, so it is reproducible for a given
+seed and block size.
+'''
+
+import numpy as np
+
+
+class AliasTable:
+    '''
+    Walker/Vose alias table: O(N) to build, O(1) per sample from a discrete distribution.
+    A single uniform u picks a column (from its integer part times N) and flips the
+    column's biased coin (with its fractional part).
+
+    Attributes
+    ----------
+    prob : np.ndarray
+        probability of keeping column i rather than taking its alias
+    alias : np.ndarray
+        alternative outcome of column i
+    '''
+
+    def __init__(self, weights):
+        weights = np.asarray(weights, dtype=np.float64)
+        n = len(weights)
+        if n == 0 or np.any(weights < 0) or weights.sum() <= 0:
+            raise ValueError('alias table weights must be non-negative and not all zero')
+        self.num_outcomes = n
+        prob = weights * (n / weights.sum())
+        alias = np.arange(n)
+        small = np.flatnonzero(prob < 1)
+        large = np.flatnonzero(prob >= 1)
+        # pair up small and large columns in vectorized rounds: each small column is topped up by a large one
+        while small.size and large.size:
+            k = min(small.size, large.size)
+            s, l = small[:k], large[:k]
+            alias[s] = l
+            prob[l] -= 1 - prob[s]
+            now_small = prob[l] < 1
+            small = np.concatenate([small[k:], l[now_small]])
+            large = np.concatenate([large[k:], l[~now_small]])
+        # leftovers are only off from 1 by rounding error
+        prob[small] = 1
+        prob[large] = 1
+        self.prob = prob
+        self.alias = alias
+
+    def sample(self, u: np.ndarray) -> np.ndarray:
+        '''
+        map an array of uniforms in [0, 1) to outcomes
+        '''
+        x = u * self.num_outcomes
+        column = x.astype(np.intp)
+        return np.where(x - column < self.prob[column], column, self.alias[column])
+
+    def sample_one(self, u: float) -> int:
+        x = u * self.num_outcomes
+        column = int(x)
+        return column if x - column < self.prob[column] else int(self.alias[column])
+
+
+class UniformPairs:
+    '''
+    Every agent is equally likely to be chosen, and so is every partner.
+    '''
+
+    def __init__(self, num_agents: int):
+        self.num_agents = num_agents
+        self.spec = 'uniform'
+
+    def draw(self, rng: np.random.Generator, size: int):
+        '''
+        draw size encounters: a distinct (active, passive) pair and a uniform that decides the outcome.
+        each encounter consumes three doubles.
+        returns:
+            active, passive, uniforms: arrays of length size
+        '''
+        draws = rng.random((size, 3))
+        active = (draws[:, 0] * self.num_agents).astype(np.intp)
+        # draw from the N - 1 other agents and skip over the active agent
+        passive = (draws[:, 1] * (self.num_agents - 1)).astype(np.intp)
+        passive += passive >= active
+        return active, passive, draws[:, 2]
+
+    def partners(self, rng: np.random.Generator, agent_ids: np.ndarray, u: np.ndarray) -> np.ndarray:
+        '''
+        map one uniform per agent to a partner other than the agent itself
+        '''
+        partners = (u * (self.num_agents - 1)).astype(np.intp)
+        return partners + (partners >= agent_ids)
+
+    def partner(self, rng: np.random.Generator, agent_id: int, u: float) -> int:
+        partner_id = int(u * (self.num_agents - 1))
+        return partner_id + (partner_id >= agent_id)
+
+
+class LocalPairs:
+    '''
+    Agents sit on a ring and only meet agents at most radius positions away.
+    '''
+
+    def __init__(self, num_agents: int, radius: int):
+        if not 1 <= radius <= (num_agents - 1) // 2:
+            raise ValueError(f'radius must be between 1 and {(num_agents - 1) // 2} for {num_agents} agents')
+        self.num_agents = num_agents
+        self.radius = radius
+        self.spec = f'local:{radius}'
+
+    def offsets(self, u):
+        # 2 * radius equally likely offsets in [-radius, -1] and [1, radius]
+        k = (u * (2 * self.radius)).astype(np.intp)
+        return k - self.radius + (k >= self.radius)
+
+    def draw(self, rng: np.random.Generator, size: int):
+        draws = rng.random((size, 3))
+        active = (draws[:, 0] * self.num_agents).astype(np.intp)
+        passive = (active + self.offsets(draws[:, 1])) % self.num_agents
+        return active, passive, draws[:, 2]
+
+    def partners(self, rng: np.random.Generator, agent_ids: np.ndarray, u: np.ndarray) -> np.ndarray:
+        return (agent_ids + self.offsets(u)) % self.num_agents
+
+    def partner(self, rng: np.random.Generator, agent_id: int, u: float) -> int:
+        k = int(u * (2 * self.radius))
+        return (agent_id + k - self.radius + (k >= self.radius)) % self.num_agents
+
+
+class WeightedPairs:
+    '''
+    Both agents of an encounter are drawn in proportion to their weight, e.g. their degree
+    in a contact graph. A partner equal to the first agent is redrawn.
+    '''
+
+    def __init__(self, weights):
+        self.table = AliasTable(weights)
+        self.num_agents = self.table.num_outcomes
+        if np.count_nonzero(np.asarray(weights)) < 2:
+            raise ValueError('at least two agents need a positive weight')
+        self.spec = 'weighted'
+
+    def redraw_collisions(self, rng: np.random.Generator, agent_ids: np.ndarray, partners: np.ndarray) -> np.ndarray:
+        collisions = np.flatnonzero(partners == agent_ids)
+        while collisions.size:
+            partners[collisions] = self.table.sample(rng.random(collisions.size))
+            collisions = collisions[partners[collisions] == agent_ids[collisions]]
+        return partners
+
+    def draw(self, rng: np.random.Generator, size: int):
+        draws = rng.random((size, 3))
+        active = self.table.sample(draws[:, 0])
+        passive = self.redraw_collisions(rng, active, self.table.sample(draws[:, 1]))
+        return active, passive, draws[:, 2]
+
+    def partners(self, rng: np.random.Generator, agent_ids: np.ndarray, u: np.ndarray) -> np.ndarray:
+        return self.redraw_collisions(rng, np.asarray(agent_ids), self.table.sample(u))
+
+    def partner(self, rng: np.random.Generator, agent_id: int, u: float) -> int:
+        partner_id = self.table.sample_one(u)
+        while partner_id == agent_id:
+            partner_id = self.table.sample_one(rng.random())
+        return partner_id
+
+
+class GraphPairs:
+    '''
+    The active agent is drawn uniformly among agents with at least one neighbour in a
+    contact graph, and its partner uniformly among its neighbours.
+    '''
+
+    def __init__(self, topology):
+        self.topology = topology
+        self.num_agents = topology.num_agents
+        self.degrees = topology.degrees()
+        self.connected = np.flatnonzero(self.degrees)
+        if self.connected.size == 0:
+            raise ValueError('graph pairing needs at least one edge')
+        self.spec = 'graph'
+
+    def partners(self, rng: np.random.Generator, agent_ids: np.ndarray, u: np.ndarray) -> np.ndarray:
+        agent_ids = np.asarray(agent_ids)
+        degrees = self.degrees[agent_ids]
+        if np.any(degrees == 0):
+            raise ValueError('an agent without neighbours has no partners')
+        return self.topology.indices[self.topology.indptr[agent_ids] + (u * degrees).astype(np.intp)].astype(np.intp)
+
+    def draw(self, rng: np.random.Generator, size: int):
+        draws = rng.random((size, 3))
+        active = self.connected[(draws[:, 0] * self.connected.size).astype(np.intp)]
+        return active, self.partners(rng, active, draws[:, 1]), draws[:, 2]
+
+    def partner(self, rng: np.random.Generator, agent_id: int, u: float) -> int:
+        degree = int(self.degrees[agent_id])
+        if degree == 0:
+            raise ValueError(f'agent {agent_id} has no neighbours to meet')
+        return int(self.topology.indices[self.topology.indptr[agent_id] + int(u * degree)])
+
+
+def make_pairs(spec: str, num_agents: int, weights=None, topology=None):
+    '''
+    build a pair distribution from its spec string
+    args:
+        spec: 'uniform', 'local:<radius>', 'weighted' or 'graph'
+        num_agents: number of agents
+        weights: per-agent weights, required for 'weighted'
+        topology: contact graph, required for 'graph'
+    '''
+    if spec is None or spec == 'uniform':
+        return UniformPairs(num_agents)
+    if spec.startswith('local:'):
+        return LocalPairs(num_agents, int(spec.split(':', 1)[1]))
+    if spec == 'weighted':
+        if weights is None:
+            raise ValueError("'weighted' pairing needs per-agent weights")
+        return WeightedPairs(weights)
+    if spec == 'graph':
+        if topology is None:
+            raise ValueError("'graph' pairing needs a topology")
+        return GraphPairs(topology)
+    raise ValueError(f'unknown pairing: {spec}')
+
+
+def draw_encounters(rng: np.random.Generator, num_agents: int, size: int):
+    '''
+    draw size uniformly paired encounters, see UniformPairs.draw
+    '''
+    return UniformPairs(num_agents).draw(rng, size)
+
+
+class EncounterSampler:
+    '''
+    Block-buffered stream of encounters for one game.
+
+    Methods
+    -------
+    next()
+        returns the next (active_id, passive_id, reliability_sample)
+    fill()
+        draw a new block if the current one is used up, so draws holds the encounters next() hands out
+    '''
+
+    def __init__(self, rng: np.random.Generator, num_agents: int, block_size: int = 4096, pairs=None):
+        self.rng = rng
+        self.num_agents = num_agents
+        self.block_size = block_size
+        self.pairs = pairs if pairs is not None else UniformPairs(num_agents)
+        self.draws = (np.empty(0, dtype=np.intp), np.empty(0, dtype=np.intp), np.empty(0))
+        self.block = []
+        self.position = 0
+
+    def set_block(self, active, passive, uniforms, position=0):
+        self.draws = (active, passive, uniforms)
+        # python scalars are much faster to hand out one at a time than numpy scalars
+        self.block = list(zip(active.tolist(), passive.tolist(), uniforms.tolist()))
+        self.position = position
+
+    def fill(self):
+        '''
+        draw a new block if the current one is used up
+        '''
+        if self.position == len(self.block):
+            self.set_block(*self.pairs.draw(self.rng, self.block_size))
+
+    def next(self):
+        if self.position == len(self.block):
+            self.set_block(*self.pairs.draw(self.rng, self.block_size))
+        encounter = self.block[self.position]
+        self.position += 1
+        return encounter
+
+    def get_state(self) -> dict:
+        '''
+        returns the current block of draws and the position in it, for checkpoints
+        '''
+        active, passive, uniforms = self.draws
+        return {'active': active.copy(), 'passive': passive.copy(), 'uniforms': uniforms.copy(), 'position': self.position}
+
+    def set_state(self, state: dict):
+        self.set_block(state['active'], state['passive'], state['uniforms'], int(state['position']))
+
+
+class PartnerSampler:
+    '''
+    Block-buffered stream of partners for a given agent, for the attempts-until-success
+    benchmark. Each draw consumes two doubles: one picks a partner according to the pair
+    distribution, one decides the outcome.
+
+    Methods
+    -------
+    next(agent_id)
+        returns (partner_id, reliability_sample), with partner_id != agent_id
+    peek(agent_id, max_size)
+        returns the next partners and reliability samples as arrays, without consuming them
+    advance(count)
+        consume count draws returned by peek
+    '''
+
+    def __init__(self, rng: np.random.Generator, num_agents: int, block_size: int = 4096, pairs=None):
+        self.rng = rng
+        self.num_agents = num_agents
+        self.block_size = block_size
+        self.pairs = pairs if pairs is not None else UniformPairs(num_agents)
+        self.draws = np.empty((0, 2))
+        self.block = []
+        self.position = 0
+
+    def refill(self):
+        self.draws = self.rng.random((self.block_size, 2))
+        self.block = self.draws.tolist()
+        self.position = 0
+
+    def next(self, agent_id: int):
+        if self.position == len(self.block):
+            self.refill()
+        u_partner, reliability_sample = self.block[self.position]
+        self.position += 1
+        return self.pairs.partner(self.rng, agent_id, u_partner), reliability_sample
+
+    def peek(self, agent_id: int, max_size: int):
+        '''
+        vectorized look-ahead for the attempts-until-success fast path: the draws next() would hand out
+        for agent_id, up to the end of the current block. only valid for pair distributions that map
+        one uniform to one partner without further draws (not WeightedPairs)
+        returns:
+            partners, reliability_samples: arrays of the same length, at most max_size
+        '''
+        if self.position == len(self.block):
+            self.refill()
+        draws = self.draws[self.position:self.position + max_size]
+        return self.pairs.partners(self.rng, agent_id, draws[:, 0]), draws[:, 1]
+
+    def advance(self, count: int):
+        self.position += count
+
+    def get_state(self) -> dict:
+        '''
+        returns the current block of draws and the position in it, for checkpoints
+        '''
+        return {'draws': self.draws.copy(), 'position': self.position}
+
+    def set_state(self, state: dict):
+        self.draws = state['draws']
+        self.block = self.draws.tolist()
+        self.position = int(state['position'])
@@ -3,22 +3,72 @@ This Python library is for experimentation for benchmarks 1 and 2:
 Individual and collective agent payoff over time.
 '''
 
-from agent import *
-import numpy as np
-import pandas as pd
 import os
-from config import Config 
+import numpy as np
+from agent import LearnTrustAgent
+from trust_matrix import make_trust_store
+from recorder import EncounterRecorder
+from descriptions import record_game_description, record_pairing_weights, load_game_description, export_game_descriptions
+from distributions import sample_reliabilities, EXPECTED_RELIABILITY, payoff_threshold
+from sampling import EncounterSampler, make_pairs
+from topology import Topology, make_topology
+from runfile import save_run_table, RUN_FORMATS
+from metrics import OnlineMetrics
+from profiling import Profiler
+from strategies import parse_mix, mix_spec, assign_strategies, strategy_name, strategy_summary, decide, MIN_BATCH_DECISIONS
+from concurrency import EncounterPool, conflict_free_waves
+from checkpoint import CheckpointWriter, load_checkpoint, rng_state, set_rng_state
+from log_sinks import make_sink, SampledSink
+from convergence import make_monitor
 
 
 class Game:
-    def __init__(self, run_no=0, num_agents=100, r_dist='uniform', num_interactions=100, p_g=2, p_b=-2, alpha_direct=0.1, alpha_indirect=0.1):
+    def __init__(self, run_no=0, num_agents=100, r_dist='uniform', num_interactions=100, p_g=2, p_b=-2, alpha_direct=0.1, alpha_indirect=0.1,
+                 seed=None, pairing='uniform', pairing_weights=None, topology=None, strategies='learn_trust',
+                 log_sink='text', log_every=1, log_echo=True, log_buffer_size=1000, run_format='csv',
+                 metrics_every=100, keep_history=True, checkpoint_every=0, checkpoint_path=None, profile_every=0, propagation='eager',
+                 precision='float64', num_threads=1, thread_batch_size=1024, convergence=None,
+                 log_dir='logs', agent_log_dir='karly_logs', log_offsets=None):
         self.run_no = run_no
+        # every random draw of the game comes from its own generator, so a run is reproducible from its seed
+        if seed is None:
+            seed = int(np.random.SeedSequence().generate_state(1, np.uint64)[0] >> 1)
+        self.seed = seed
+        self.rng = np.random.default_rng(seed)
+        # contact graph: None for all-to-all, or a Topology or spec such as 'regular:8', 'small_world:8:0.1' or
+        # 'scale_free:3' (see topology.py). with a graph, agents only hold opinions of and meet their neighbours
+        if isinstance(topology, str):
+            topology = make_topology(topology, num_agents, self.rng)
+        self.topology = topology
+        if topology is not None:
+            if pairing not in ('uniform', 'graph'):
+                raise ValueError(f"a game with a topology only supports 'graph' pairing, got {pairing}")
+            pairing = 'graph'
+        # who meets whom: 'uniform', 'local:<radius>', 'weighted' (with pairing_weights) or 'graph', see sampling.py
+        self.pairing = pairing
+        self.pairing_weights = pairing_weights
+        self.sampler = EncounterSampler(self.rng, num_agents, pairs=make_pairs(pairing, num_agents, pairing_weights, topology)) # pre-samples encounter pairs and outcome uniforms in blocks
         self.num_agents = num_agents  # total number of agents involved in the simulation
         self.acceptance_threshold = 0  # tau_i
         self.r_dist = r_dist
+        # population mix of decision strategies, e.g. 'learn_trust' or 'learn_trust:0.8,play_never:0.2' (see strategies.py),
+        # and each agent's strategy code, assigned with the reliabilities
+        self.mix = parse_mix(strategies)
+        self.strategy_codes = None
+        self.threshold = None # payoff threshold of every agent, set with the agents
         self.agents = [None for i in range(num_agents)]
+        # all agents' opinions live in one N x N matrix, or along the graph's edges if there is a topology;
+        # each agent's registers are a view over its part of the store. with propagation='lazy', indirect updates are
+        # recorded and only applied when the opinions are read (LazyTrustMatrix, see trust_matrix.py)
+        self.propagation = propagation
+        # storage of the opinions: 'float64', 'float32', 'float16', or 'uint16'/'uint8' fixed-point codes rounded stochastically
+        # (see trust_matrix.py). the rounding draws come from a generator of their own, so the game's other draws do not move
+        self.precision = precision
+        self.rounding_rng = np.random.default_rng(np.random.SeedSequence(seed).spawn(1)[0])
+        self.trust = make_trust_store(num_agents, topology, propagation, precision, self.rounding_rng)
         # storage of each agent's true reliability score
         self.r_arr = [0 for i in range(num_agents)]
+        self.reliabilities = None # r_arr as an array, for batched decisions
         self.num_interactions = num_interactions
         self.p_g = p_g  # good encounter payoff
         self.p_b = p_b  # bad encounter payoff
@@ -26,74 +76,141 @@ class Game:
         # decay constant. how much a player weighs incoming opinions from other player it had a "good" encounter with
         self.alpha_indirect = alpha_indirect
         self.total_payout = 0  # total payoff accumulated
-        # list of encounters, encoded as dictionaries with the following keys: ['active_id', 'passive_id', 'accepted', 'result']
-        self.encounter_history = []
+        # columnar record of encounters with the following columns: ['active_id', 'passive_id', 'active_reliability',
+        # 'passive_reliability', 'passive_opinion', 'accepted', 'result', 'total_payout']. iterating over it yields dicts
+        self.encounter_history = EncounterRecorder(num_interactions if keep_history else 1, payout_dtype=np.result_type(p_g, p_b))
+        # running per-agent and game-wide metrics, with a snapshot every metrics_every encounters (see metrics.py).
+        # with keep_history=False only the metrics are kept, so memory does not grow with the number of encounters
+        self.metrics_every = metrics_every
+        self.keep_history = keep_history
+        self.metrics = None
         # create new directory to store logs of each run of the game
-        os.makedirs(os.path.dirname(f'logs/game{self.run_no}/'), exist_ok=True)
-        os.makedirs(os.path.dirname(f'logs2/game{self.run_no}/'), exist_ok=True)
-        self.game_desc_df = pd.read_csv('logs/game_descriptions.csv')
-        self.log = open(
-            f'logs/game{self.run_no}/game_log_{self.run_no}.txt', 'w')
-        self.df = pd.DataFrame(columns=['active_id', 'passive_id', 'active_reliability',
-                               'passive_reliability', 'passive_opinion', 'accepted', 'result', 'total_payout'])
-        self.df2 = pd.DataFrame(columns=['agent_id', 'reliability', 'total_payoff'])
-        self.csv_path = f'logs/game{self.run_no}/game_log_{self.run_no}.csv' # analysis for payoffs over time
-        self.csv_path2 = f'karly_logs/game_log_{self.run_no}.csv' # analysis for payoffs to individual agents
+        self.log_dir = log_dir
+        if run_format not in RUN_FORMATS:
+            raise ValueError(f'unknown run format: {run_format}, expected one of {RUN_FORMATS}')
+        self.run_format = run_format # output tables as 'csv', binary 'npy' tables (see runfile.py) or 'both'
+        os.makedirs(os.path.dirname(f'{log_dir}/game{self.run_no}/'), exist_ok=True)
+        os.makedirs(agent_log_dir, exist_ok=True)
+        self.agent_log_dir = agent_log_dir
+        # encounter log. records are only formatted if the sink consumes them (see log_sinks.py).
+        # a resumed game continues its logs from the positions saved in the checkpoint (log_offsets)
+        self.log_config = {'log_sink': log_sink, 'log_every': log_every, 'log_echo': log_echo, 'log_buffer_size': log_buffer_size}
+        self.log = make_sink(log_sink, f'{log_dir}/game{self.run_no}/game_log_{self.run_no}.txt',
+                             every=log_every, echo=log_echo, buffer_size=log_buffer_size,
+                             offset=log_offsets['log'] if log_offsets else None)
+        # save the whole game state every checkpoint_every encounters (0: never), see checkpoint.py
+        self.checkpoint_every = checkpoint_every
+        self.checkpoint_path = checkpoint_path or f'{log_dir}/game{self.run_no}/checkpoint_{self.run_no}.npz'
+        self.checkpoint_writer = None
+        # opt-in per-phase timers and counters, timing one in every profile_every encounters (0: off), see profiling.py
+        self.profile_every = profile_every
+        self.profiler = Profiler(profile_every) if profile_every else None
+        # with num_threads > 1, encounters are sampled thread_batch_size at a time and each batch is played as conflict-free
+        # waves on a thread pool (see concurrency.py), with the same result as playing them one at a time. batches end at
+        # every metrics snapshot and checkpoint, so those see the same state as well
+        if num_threads > 1 and propagation != 'eager':
+            raise ValueError(f"num_threads > 1 needs propagation='eager', got {propagation}")
+        if num_threads > 1 and precision.startswith('uint'):
+            raise ValueError(f'num_threads > 1 needs a float precision, got {precision}: the order of the rounding draws would vary')
+        self.num_threads = num_threads
+        self.thread_batch_size = thread_batch_size
+        # adaptive run length: at every metrics snapshot, test whether the opinion error, the acceptance rate and the payoff
+        # slope have settled (see convergence.py; convergence is None, a dict of settings or a ConvergenceMonitor). once they
+        # have, action 'stop' ends the game and 'thin' keeps playing but only logs every thin_every-th encounter.
+        # stopped_at and stop_reason record the outcome
+        self.convergence = make_monitor(convergence)
+        if self.convergence.enabled and not metrics_every:
+            raise ValueError('convergence detection needs metrics snapshots, metrics_every > 0')
+        self.stopped_at = None # number of encounters played, once the game has run
+        self.stop_reason = None # 'converged' or 'num_interactions'
+        self.played = False # set once play() has written the game's tables
+        self.encounter_table = None # encounter table, built from encounter_history when df is first read
+        self.df2 = None # per-agent payoff table, built by log_end_info
+        self.csv_path = f'{log_dir}/game{self.run_no}/game_log_{self.run_no}.csv' # analysis for payoffs over time
+        self.csv_path2 = f'{agent_log_dir}/game_log_{self.run_no}.csv' # analysis for payoffs to individual agents
+        self.csv_path_metrics = f'{log_dir}/game{self.run_no}/game_metrics_{self.run_no}.csv' # metric snapshots over time
+        self.csv_path_profile = f'{log_dir}/game{self.run_no}/game_profile_{self.run_no}.csv' # per-phase timings, if profiled
+        self.csv_path_strategies = f'{log_dir}/game{self.run_no}/game_strategies_{self.run_no}.csv' # payoffs per strategy
+        self.csv_path_convergence = f'{log_dir}/game{self.run_no}/game_convergence_{self.run_no}.csv' # convergence tests, if enabled
 
-    def initialize_agents(self):
-        game_desc_df_row = {
+    @property
+    def df(self):
+        '''
+        encounter table, a DataFrame built from encounter_history on first access once the game has run (None before,
+        or with keep_history=False). runs that only export 'npy' run tables never import pandas
+        '''
+        if self.encounter_table is None and self.played and self.keep_history:
+            self.encounter_table = self.encounter_history.to_dataframe()
+        return self.encounter_table
+
+    def describe(self) -> dict:
+        return {
             'run_no': self.run_no,
             'num_agents': self.num_agents,
             'r_dist': self.r_dist,
-            'agent_type': 'learn_trust',
+            'agent_type': mix_spec(self.mix),
             'num_interactions': self.num_interactions,
             'p_g': self.p_g,
-            'p_b': self.p_b
+            'p_b': self.p_b,
+            'alpha_direct': self.alpha_direct,
+            'alpha_indirect': self.alpha_indirect,
+            'seed': self.seed,
+            'pairing': self.pairing,
+            'topology': self.topology.spec if self.topology is not None else None,
+            'precision': self.precision
         }
-        self.game_desc_df.loc[self.run_no] = game_desc_df_row
-        self.game_desc_df.to_csv('logs/game_descriptions.csv', index=False)
+
+    def initialize_agents(self):
+        game_desc_df_row = self.describe()
+        if self.pairing_weights is not None:
+            game_desc_df_row['pairing_weights'] = record_pairing_weights(f'{self.log_dir}/game_descriptions.csv', self.run_no, self.pairing_weights)
+        record_game_description(f'{self.log_dir}/game_descriptions.csv', game_desc_df_row)
+        self.description = game_desc_df_row # stored in the header of binary run tables
+        self.r_arr = sample_reliabilities(self.rng, self.r_dist, self.num_agents).tolist()
+        self.strategy_codes = assign_strategies(self.mix, self.num_agents, self.rng)
+        self.build_agents()
+
+    def build_agents(self):
+        exp_r = EXPECTED_RELIABILITY[self.r_dist]
+        threshold = payoff_threshold(self.r_dist, self.p_g, self.p_b)
+        self.threshold = threshold
+        self.reliabilities = np.array(self.r_arr)
         for i in range(self.num_agents):
-            r_i = 0
-            exp_r_i = 0.5
-            if (self.r_dist == 'uniform'):
-                r_i = np.random.uniform(0, 1)
-            elif (self.r_dist == 'normal'):
-                r_i = np.random.normal(0.5, 0.25)
-                r_i = np.clip(r_i, 0, 1)
-            elif (self.r_dist == 'bernoulli'):
-                r_i = np.random.randint(0, 2)
-            elif (self.r_dist == 'skewed'):
-                r_i = np.random.beta(2,6)
-                exp_r_i = 0.25
-            payoff_threshold = self.p_g * exp_r_i + self.p_b * (1 - exp_r_i) - 0.0005
-            print(payoff_threshold)
             self.agents[i] = LearnTrustAgent(
-                i, r_i, self.alpha_direct, self.alpha_indirect, exp_r_i, payoff_threshold)
-            self.r_arr[i] = r_i
+                i, self.r_arr[i], self.alpha_direct, self.alpha_indirect, exp_r, threshold,
+                registers=self.trust.registers(i), rng=self.rng, profiler=self.profiler if self.num_threads == 1 else None,
+                strategy=strategy_name(self.strategy_codes[i]))
+        self.metrics = OnlineMetrics(self.trust, self.r_arr, every=self.metrics_every, payout_dtype=np.result_type(self.p_g, self.p_b))
         print("agent array: ", self.agents)
 
     def log_end_info(self, encounter_history):
-        # gather agent payoffs
-        payoffs = [0] * self.num_agents
-
-        for d in encounter_history: # d is a dict
-            if d['result'] == True:
-                payoffs[d['active_id']] += self.p_g
-                payoffs[d['passive_id']] += self.p_g
-            elif d['result'] == False:
-                payoffs[d['active_id']] += self.p_b
-                payoffs[d['passive_id']] += self.p_b
+        import pandas as pd
+        export_game_descriptions(f'{self.log_dir}/game_descriptions.csv')
+        # agent payoffs and rates were accumulated while the game was played
+        payoffs = self.metrics.payoffs
+        acceptance_rate, success_rate, opinion_mae = self.metrics.agent_rates()
 
         # put agent info into dataframe
-        for i in range(self.num_agents):
-            self.df2.loc[len(self.df2.index)] = [i, self.agents[i].get_reliability(), payoffs[i]]
-        self.df2.to_csv(self.csv_path2)
+        self.df2 = pd.DataFrame({
+            'agent_id': np.arange(self.num_agents),
+            'reliability': [agent.get_reliability() for agent in self.agents],
+            'strategy': [agent.strategy for agent in self.agents],
+            'total_payoff': payoffs,
+            'acceptance_rate': acceptance_rate,
+            'success_rate': success_rate,
+            'opinion_mae': opinion_mae
+        })
+        save_run_table(self.df2, self.csv_path2, self.run_format, self.description)
+        summary = strategy_summary(self.strategy_codes, payoffs, self.metrics.proposals, self.metrics.accepted)
+        save_run_table(summary, self.csv_path_strategies, self.run_format, self.description)
 
         # print game info
         print("Agent payoffs: ")
-        print(payoffs)
+        print(payoffs.tolist())
         print("Total payoff:")
-        print(sum(payoffs))
+        print(payoffs.sum())
+        print("Payoffs per strategy:")
+        print(summary.to_string(index=False))
 
     def run_encounter(self, i):
         '''
@@ -101,9 +218,16 @@ class Game:
         and update encounter history and total payoff according to encounter outcome
         args:
             i: encounter number in the whole game
+        returns:
+            accepted, result: whether the encounter was accepted, and whether it was good
         '''
-        active_id, passive_id = np.random.choice(
-            range(self.num_agents), size=2, replace=False)
+        profiler = self.profiler
+        timed = profiler is not None and profiler.start(i)
+        if timed:
+            t0 = profiler.clock()
+        active_id, passive_id, reliability_sample = self.sampler.next()
+        if timed:
+            t1 = profiler.clock()
         active_agent = self.agents[active_id]
         passive_agent = self.agents[passive_id]
         active_agent_opinion = active_agent.get_opinion(passive_id)
@@ -112,50 +236,339 @@ class Game:
             passive_agent.get_reliability(), # technically active agent should be blind to passive agent's true reliability, but since result of encounter is calculated in active agent function, reliability is passed
             passive_agent.get_registers(),
             self.p_g,
-            self.p_b
+            self.p_b,
+            reliability_sample
         )
+        if timed:
+            t2 = profiler.clock()
+        payout = 0
         if accepted and success:
-            self.total_payout += self.p_g
+            payout = self.p_g
+            self.metrics.row_changed(active_id) # the indirect update may have changed the whole row
         elif accepted and not success:
-            self.total_payout += self.p_b
-        encounter_dict = {
-            'active_id': active_id,
-            'passive_id': passive_id,
-            'active_reliability': active_agent.get_reliability(),
-            'passive_reliability': passive_agent.get_reliability(),
-            'active_opinion': active_agent_opinion,
-            'accepted': accepted,
-            'result': success,
-            'total_payout': self.total_payout
-        }
-        encounter_print_string = f"""ENCOUNTER {i}.
-Active ID: {active_id}
-Passive ID: {passive_id}
-Active agent reliability: {active_agent.get_reliability()}
-Passive agent reliability: {passive_agent.get_reliability()}
-Passive agent's opinion of active agent: {active_agent_opinion}
-Encounter accepted: {accepted}
-Encounter result: {success}
-Total payout: {self.total_payout}
-"""
-        encounter_print_string += '\n###########################\n'
-        self.log.write(encounter_print_string)
-        self.encounter_history.append(encounter_dict)
-        self.df.loc[len(self.df.index)] = encounter_dict
-        return encounter_print_string
+            payout = self.p_b
+            self.metrics.opinion_changed(active_id, passive_id, active_agent_opinion)
+        self.total_payout += payout
+        self.metrics.record(active_id, passive_id, accepted, success, payout)
+        if timed:
+            t3 = profiler.clock()
+        if self.keep_history:
+            self.encounter_history.append(
+                active_id,
+                passive_id,
+                active_agent.get_reliability(),
+                passive_agent.get_reliability(),
+                active_agent_opinion,
+                accepted,
+                success,
+                self.total_payout
+            )
+        if timed:
+            t4 = profiler.clock()
+        if self.log.accepts(i):
+            self.log.write((i, active_id, passive_id, active_agent.get_reliability(), passive_agent.get_reliability(),
+                            active_agent_opinion, accepted, success, self.total_payout))
+        if timed:
+            t5 = profiler.clock()
+            profiler.add('encounter', t0, t5)
+            profiler.add('encounter;sampling', t0, t1)
+            profiler.add('encounter;handle_encounter', t1, t2)
+            profiler.add('encounter;metrics', t2, t3)
+            profiler.add('encounter;history', t3, t4)
+            profiler.add('encounter;logging', t4, t5)
+        return accepted, success
 
     def run(self):
         self.initialize_agents()
         print("TEST: ", self.agents[0].get_reliability())
-        for i in range(self.num_interactions):
-            print(self.run_encounter(i))
-        self.df.to_csv(self.csv_path)
+        return self.play()
+
+    def play(self, start=0):
+        '''
+        play encounters start, ..., num_interactions - 1 and write the game's tables
+        '''
+        if self.num_threads > 1:
+            played = self.play_concurrent(start)
+        else:
+            played = self.num_interactions
+            for i in range(start, self.num_interactions):
+                self.run_encounter(i)
+                if self.convergence.enabled and (i + 1) % self.metrics_every == 0 and self.check_convergence():
+                    played = i + 1
+                    break
+                if self.checkpoint_every and (i + 1) % self.checkpoint_every == 0 and i + 1 < self.num_interactions:
+                    self.checkpoint(i + 1)
+        self.stopped_at = played
+        self.stop_reason = 'converged' if played < self.num_interactions else 'num_interactions'
+        if self.checkpoint_writer is not None:
+            self.checkpoint_writer.close()
+            self.checkpoint_writer = None
+        self.log.close()
+        self.metrics.finish()
+        save_run_table(self.metrics.snapshot_columns(), self.csv_path_metrics, self.run_format, self.description)
+        if self.keep_history:
+            save_run_table(self.encounter_history.to_columns(), self.csv_path, self.run_format, self.description)
+        self.played = True
+        self.encounter_table = None
+        if self.convergence.enabled:
+            self.save_convergence()
+        if self.profiler is not None:
+            self.save_profile()
         return self.encounter_history
 
+    def check_convergence(self) -> bool:
+        '''
+        pass the window of the metrics snapshot just taken to the convergence monitor
+        returns:
+            whether the game should stop
+        '''
+        snapshot = self.metrics.snapshots[-1]
+        if not self.convergence.check(snapshot['encounter'], snapshot['opinion_mae'], snapshot['window_encounters'],
+                                      snapshot['window_accepted'], snapshot['window_payout']):
+            return False
+        print(f"Converged at encounter {self.convergence.converged_at}: {self.convergence.reason}")
+        if self.convergence.action == 'thin':
+            self.log = SampledSink(self.log, self.convergence.thin_every)
+        return self.convergence.action == 'stop'
+
+    def save_convergence(self):
+        '''
+        write the convergence tests of every window, with when and why the game stopped in the binary table's header
+        '''
+        params = dict(self.description, stopped_at=self.stopped_at, stop_reason=self.stop_reason, **self.convergence.summary())
+        save_run_table(self.convergence.columns(), self.csv_path_convergence, self.run_format, params)
+
+    def play_concurrent(self, start=0):
+        '''
+        play encounters start, ..., num_interactions - 1 in batches, each batch on the thread pool
+        returns:
+            number of encounters played, fewer than num_interactions if the game converged and stopped
+        '''
+        pool = EncounterPool(self.num_threads, self.num_agents)
+        i = start
+        try:
+            while i < self.num_interactions:
+                end = min(i + self.thread_batch_size, self.num_interactions)
+                for every in (self.metrics_every, self.checkpoint_every):
+                    if every:
+                        end = min(end, (i // every + 1) * every)
+                self.run_batch(i, end, pool)
+                i = end
+                if self.convergence.enabled and i % self.metrics_every == 0 and self.check_convergence():
+                    return i
+                if self.checkpoint_every and i % self.checkpoint_every == 0 and i < self.num_interactions:
+                    self.checkpoint(i)
+        finally:
+            pool.close()
+        return self.num_interactions
+
+    def run_batch(self, start, end, pool):
+        '''
+        play encounters start, ..., end - 1 as conflict-free waves on the thread pool. a wave of at least MIN_BATCH_DECISIONS
+        encounters is decided on this thread with one strategies.decide call; the agents decide smaller waves on the threads.
+        the opinion updates run on the threads; metrics, history and log are merged on this thread, in encounter order
+        args:
+            start, end: encounter numbers of the batch
+            pool: EncounterPool the waves run on
+        '''
+        profiler = self.profiler
+        timed = profiler is not None and profiler.start(start // self.thread_batch_size)
+        if timed:
+            t0 = profiler.clock()
+        draws = [self.sampler.next() for _ in range(end - start)]
+        active_ids, passive_ids, _ = (np.array(column) for column in zip(*draws))
+        waves = conflict_free_waves(active_ids, passive_ids, self.num_agents)
+        if timed:
+            t1 = profiler.clock()
+        agents, locks = self.agents, pool.locks
+        opinions = [None] * len(draws)
+        decisions = [None] * len(draws)
+        outcomes = [None] * len(draws)
+        p_g, p_b = self.p_g, self.p_b
+
+        def play(k):
+            active_id, passive_id, reliability_sample = draws[k]
+            active_agent, passive_agent = agents[active_id], agents[passive_id]
+            stripes = locks.acquire(active_id, passive_id)
+            try:
+                if decisions[k] is None:
+                    opinions[k] = active_agent.get_opinion(passive_id)
+                outcomes[k] = active_agent.handle_encounter(passive_id, passive_agent.get_reliability(), passive_agent.get_registers(),
+                                                            p_g, p_b, reliability_sample, accepted=decisions[k])
+            finally:
+                locks.release(stripes)
+
+        for wave in waves:
+            if len(wave) >= MIN_BATCH_DECISIONS:
+                # no agent appears twice in a wave, so the whole wave is decided before any of it is played
+                active, passive = active_ids[wave], passive_ids[wave]
+                wave_opinions = self.trust.get_opinions(active, passive)
+                wave_accepted = decide(self.strategy_codes[active], wave_opinions, self.reliabilities[passive], p_g, p_b, self.threshold)
+                for k, opinion, accepted in zip(wave.tolist(), wave_opinions.tolist(), wave_accepted.tolist()):
+                    opinions[k], decisions[k] = opinion, accepted
+            pool.run(play, wave)
+            # the rows a wave changed are not touched again until the next wave, so their errors are read as the wave left them
+            for k in wave.tolist():
+                accepted, success = outcomes[k]
+                if accepted and success:
+                    self.metrics.row_changed(draws[k][0])
+                elif accepted:
+                    self.metrics.opinion_changed(draws[k][0], draws[k][1], opinions[k])
+        if timed:
+            t2 = profiler.clock()
+        for k, (active_id, passive_id, _) in enumerate(draws):
+            accepted, success = outcomes[k]
+            payout = (self.p_g if success else self.p_b) if accepted else 0
+            self.total_payout += payout
+            self.metrics.record(active_id, passive_id, accepted, success, payout)
+            active_agent, passive_agent = agents[active_id], agents[passive_id]
+            if self.keep_history:
+                self.encounter_history.append(active_id, passive_id, active_agent.get_reliability(), passive_agent.get_reliability(),
+                                              opinions[k], accepted, success, self.total_payout)
+            if self.log.accepts(start + k):
+                self.log.write((start + k, active_id, passive_id, active_agent.get_reliability(), passive_agent.get_reliability(),
+                                opinions[k], accepted, success, self.total_payout))
+        if timed:
+            t3 = profiler.clock()
+            profiler.add('batch', t0, t3)
+            profiler.add('batch;sampling', t0, t1)
+            profiler.add('batch;waves', t1, t2)
+            profiler.add('batch;merge', t2, t3)
+            profiler.count('waves', len(waves))
+
+    def save_profile(self):
+        '''
+        write the per-phase summary table, a Chrome trace and folded stacks of the profiled encounters, and print the summary
+        '''
+        summary = self.profiler.summary()
+        save_run_table(summary, self.csv_path_profile, self.run_format, self.description)
+        self.profiler.write_chrome_trace(f'{self.log_dir}/game{self.run_no}/game_profile_{self.run_no}.trace.json')
+        self.profiler.write_folded(f'{self.log_dir}/game{self.run_no}/game_profile_{self.run_no}.folded')
+        print("Profile (1 in", self.profiler.sample_every, "batches timed):" if self.num_threads > 1 else "encounters timed):")
+        print(summary.to_string(index=False))
+        print("Counters:", self.profiler.counters_dict())
+
+    def get_state(self, next_encounter: int):
+        '''
+        returns (arrays, meta): copies of everything needed to continue the game at encounter next_encounter
+        '''
+        arrays = {'reliabilities': np.asarray(self.r_arr), 'strategy_codes': self.strategy_codes, 'opinions': self.trust.get_state()}
+        sampler_state = self.sampler.get_state()
+        for name in ('active', 'passive', 'uniforms'):
+            arrays[f'sampler_{name}'] = sampler_state[name]
+        metrics_arrays, metrics_scalars = self.metrics.get_state()
+        for name, array in metrics_arrays.items():
+            arrays[f'metrics_{name}'] = array
+        if self.keep_history:
+            for name in self.encounter_history.dtypes:
+                arrays[f'history_{name}'] = self.encounter_history.column(name).copy()
+        if self.topology is not None:
+            arrays['topology_indptr'] = self.topology.indptr
+            arrays['topology_indices'] = self.topology.indices
+        if self.pairing_weights is not None:
+            arrays['pairing_weights'] = self.pairing_weights
+        kwargs = dict(self.describe(), **self.log_config, run_format=self.run_format, metrics_every=self.metrics_every,
+                      keep_history=self.keep_history, checkpoint_every=self.checkpoint_every, checkpoint_path=self.checkpoint_path,
+                      profile_every=self.profile_every, propagation=self.propagation,
+                      num_threads=self.num_threads, thread_batch_size=self.thread_batch_size,
+                      convergence=self.convergence.settings(),
+                      log_dir=self.log_dir, agent_log_dir=self.agent_log_dir)
+        kwargs['strategies'] = kwargs.pop('agent_type')
+        meta = {
+            'game': 'simulation',
+            'kwargs': kwargs,
+            'next_encounter': next_encounter,
+            'total_payout': self.total_payout,
+            'rng': rng_state(self.rng),
+            'rounding_rng': rng_state(self.rounding_rng),
+            'sampler_position': sampler_state['position'],
+            'metrics': metrics_scalars,
+            'convergence': self.convergence.get_state(),
+            'log_offsets': {'log': self.log.tell()}
+        }
+        return arrays, meta
+
+    def restore(self, arrays: dict, meta: dict):
+        '''
+        set the game to the state saved by get_state
+        '''
+        self.description = self.describe()
+        self.r_arr = arrays['reliabilities'].tolist()
+        self.strategy_codes = arrays['strategy_codes']
+        self.build_agents()
+        self.trust.set_state(arrays['opinions'])
+        set_rng_state(self.rng, meta['rng'])
+        set_rng_state(self.rounding_rng, meta['rounding_rng'])
+        self.sampler.set_state({'active': arrays['sampler_active'], 'passive': arrays['sampler_passive'],
+                                'uniforms': arrays['sampler_uniforms'], 'position': meta['sampler_position']})
+        self.metrics.set_state({name[len('metrics_'):]: array for name, array in arrays.items() if name.startswith('metrics_')},
+                               meta['metrics'])
+        if self.keep_history:
+            self.encounter_history.restore({name: arrays[f'history_{name}'] for name in self.encounter_history.dtypes})
+        self.total_payout = meta['total_payout']
+        self.convergence.set_state(meta['convergence'])
+        if self.convergence.converged and self.convergence.action == 'thin':
+            self.log = SampledSink(self.log, self.convergence.thin_every)
+
+    def checkpoint(self, next_encounter: int):
+        '''
+        save the game state; the copy is taken here and written to self.checkpoint_path in a background thread
+        '''
+        if self.checkpoint_writer is None:
+            self.checkpoint_writer = CheckpointWriter()
+        arrays, meta = self.get_state(next_encounter)
+        self.checkpoint_writer.submit(self.checkpoint_path, arrays, meta)
+
+
+def resume(checkpoint_path, **kwargs):
+    '''
+    continue a game from its last checkpoint; the result is identical to a run that never stopped
+    args:
+        checkpoint_path: checkpoint written by Game.checkpoint
+        kwargs: Game arguments to override, e.g. checkpoint_every
+    returns:
+        the Game, after it has been run
+    '''
+    arrays, meta = load_checkpoint(checkpoint_path)
+    game_kwargs = dict(meta['kwargs'], **kwargs)
+    if 'topology_indptr' in arrays:
+        game_kwargs['topology'] = Topology(game_kwargs['num_agents'], arrays['topology_indptr'], arrays['topology_indices'],
+                                           game_kwargs['topology'])
+    if 'pairing_weights' in arrays:
+        game_kwargs['pairing_weights'] = arrays['pairing_weights']
+    game = Game(log_offsets=meta['log_offsets'], **game_kwargs)
+    game.restore(arrays, meta)
+    game.play(meta['next_encounter'])
+    return game
+
+
+def replay(run_no, descriptions_path='logs/game_descriptions.csv', **kwargs):
+    '''
+    regenerate a logged run from its recorded description and seed
+    args:
+        run_no: run number of the logged game
+        descriptions_path: game_descriptions.csv the run was recorded in
+        kwargs: other Game arguments, e.g. log_dir and log_sink, so the replay does not overwrite the original logs.
+            a run with 'weighted' pairing is replayed with its recorded weights, unless pairing_weights is given
+    returns:
+        the Game, after it has been run
+    '''
+    description = load_game_description(descriptions_path, run_no)
+    pairing_weights = kwargs.pop('pairing_weights', description['pairing_weights'])
+    if description['pairing'] == 'weighted' and pairing_weights is None:
+        raise ValueError(f'run {run_no} was recorded without its pairing weights; pass them to replay as pairing_weights')
+    game = Game(run_no=run_no, num_agents=description['num_agents'], r_dist=description['r_dist'],
+                num_interactions=description['num_interactions'], p_g=description['p_g'], p_b=description['p_b'],
+                alpha_direct=description['alpha_direct'], alpha_indirect=description['alpha_indirect'],
+                seed=description['seed'], pairing=description['pairing'], pairing_weights=pairing_weights, topology=description['topology'],
+                strategies=description['agent_type'], precision=description['precision'], **kwargs)
+    game.run()
+    return game
+
 
 def main():
+    from config import Config
     # TODO: maybe allow user to input different reliability distributions
-    # TODO: implement the other agents: play_always, play_never, and know_reliability
     '''
     args = sys.argv[1:]
     if len(args) != 2:
@@ -167,7 +580,13 @@ def main():
 
     game = Game(run_no=Config.run_no, num_agents=Config.num_agents, r_dist=Config.r_dist,
                 num_interactions=Config.num_encounters, p_g=Config.p_g, p_b=Config.p_b, 
-                alpha_direct=Config.alpha_direct, alpha_indirect=Config.alpha_indirect)
+                alpha_direct=Config.alpha_direct, alpha_indirect=Config.alpha_indirect, seed=Config.seed, pairing=Config.pairing,
+                pairing_weights=Config.pairing_weights, topology=Config.topology,
+                strategies=Config.strategies, log_sink=Config.log_sink, log_every=Config.log_every, log_echo=Config.log_echo,
+                log_buffer_size=Config.log_buffer_size, run_format=Config.run_format,
+                metrics_every=Config.metrics_every, keep_history=Config.keep_history, checkpoint_every=Config.checkpoint_every,
+                profile_every=Config.profile_every, propagation=Config.propagation, precision=Config.precision,
+                num_threads=Config.num_threads, thread_batch_size=Config.thread_batch_size, convergence=Config.convergence)
     
     game.run()
     game.log_end_info(game.encounter_history)
@@ -3,21 +3,79 @@ This Python library is for experimentation for benchmark 3:
 Average number of attempts until successful encounter.
 '''
 
-from agent import *
-import numpy as np
-import pandas as pd
-import sys
 import os
-import agent
+import numpy as np
+from agent import LearnTrustAgent
+from trust_matrix import make_trust_store
+from recorder import EncounterRecorder
+from descriptions import record_game_description, record_pairing_weights, load_game_description, export_game_descriptions
+from distributions import sample_reliabilities, EXPECTED_RELIABILITY, payoff_threshold
+from sampling import PartnerSampler, WeightedPairs, GraphPairs, make_pairs
+from topology import Topology, make_topology
+from runfile import save_run_table, RUN_FORMATS
+from profiling import Profiler
+from strategies import parse_mix, mix_spec, assign_strategies, strategy_name, STRATEGIES
+from checkpoint import CheckpointWriter, load_checkpoint, rng_state, set_rng_state
+from log_sinks import make_sink, format_failure, FAILURE_LOG_DTYPE, SampledSink
+from convergence import make_monitor
 
 class Game:
-    def __init__(self, run_no=0, num_agents=100, r_dist='uniform', num_interactions=100, p_g=2, p_b=-2, alpha_direct=0.1, alpha_indirect=0.1):
+    def __init__(self, run_no=0, num_agents=100, r_dist='uniform', num_interactions=100, p_g=2, p_b=-2, alpha_direct=0.1, alpha_indirect=0.1,
+                 seed=None, pairing='uniform', pairing_weights=None, topology=None, strategies='learn_trust',
+                 record_attempts=False, log_sink='text', log_every=1, log_echo=True, log_buffer_size=1000,
+                 run_format='csv', checkpoint_every=0, checkpoint_path=None, profile_every=0, propagation='eager',
+                 precision='float64', convergence=None, log_dir='logs_failures', log_offsets=None):
         self.run_no = run_no
+        # every random draw of the game comes from its own generator, so a run is reproducible from its seed
+        if seed is None:
+            seed = int(np.random.SeedSequence().generate_state(1, np.uint64)[0] >> 1)
+        self.seed = seed
+        self.rng = np.random.default_rng(seed)
+        # contact graph: None for all-to-all, or a Topology or spec such as 'regular:8', 'small_world:8:0.1' or
+        # 'scale_free:3' (see topology.py). with a graph, agents only hold opinions of and meet their neighbours
+        if isinstance(topology, str):
+            topology = make_topology(topology, num_agents, self.rng)
+        self.topology = topology
+        if topology is not None:
+            if pairing not in ('uniform', 'graph'):
+                raise ValueError(f"a game with a topology only supports 'graph' pairing, got {pairing}")
+            pairing = 'graph'
+        # who meets whom: 'uniform', 'local:<radius>', 'weighted' (with pairing_weights) or 'graph', see sampling.py
+        self.pairing = pairing
+        self.pairing_weights = pairing_weights
+        self.partners = PartnerSampler(self.rng, num_agents, pairs=make_pairs(pairing, num_agents, pairing_weights, topology)) # pre-samples partners and outcome uniforms in blocks
         self.agents_per_trial = 20
+        # agents a trial picks its passive agents from: all of them, or with a contact graph only those with neighbours to meet
+        pairs = self.partners.pairs
+        self.trial_agents = num_agents
+        if isinstance(pairs, GraphPairs) and pairs.connected.size < num_agents:
+            if pairs.connected.size < self.agents_per_trial:
+                raise ValueError(f'a trial needs {self.agents_per_trial} agents with neighbours, the graph has {pairs.connected.size}')
+            self.trial_agents = pairs.connected
+        # cap on proposals (accepted or not) per passive agent, so an agent that rejects every partner it can meet cannot stall the trial
+        self.max_proposals = 10 * num_agents
+        # only the attempt counts are needed for the benchmark, so by default each passive agent's attempts are
+        # computed in vectorized chunks without recording them. record_attempts plays them one at a time and keeps
+        # every attempt in encounter_history, the encounter log and the encounter CSV. weighted pairing redraws
+        # collisions from the game's generator, so it always takes the per-attempt path to keep the draws identical
+        self.record_attempts = record_attempts or isinstance(self.partners.pairs, WeightedPairs)
         self.num_agents = num_agents  # total number of agents involved in the simulation
         self.acceptance_threshold = 0  # tau_i
         self.r_dist = r_dist
+        # population mix of decision strategies, e.g. 'learn_trust' or 'learn_trust:0.8,play_never:0.2' (see strategies.py),
+        # and each agent's strategy code, assigned with the reliabilities
+        self.mix = parse_mix(strategies)
+        self.strategy_codes = None
         self.agents = [None for i in range(num_agents)]
+        # all agents' opinions live in one N x N matrix, or along the graph's edges if there is a topology;
+        # each agent's registers are a view over its part of the store. with propagation='lazy', indirect updates are
+        # recorded and only applied when the opinions are read (LazyTrustMatrix, see trust_matrix.py)
+        self.propagation = propagation
+        # storage of the opinions: 'float64', 'float32', 'float16', or 'uint16'/'uint8' fixed-point codes rounded stochastically
+        # (see trust_matrix.py). the rounding draws come from a generator of their own, so the game's other draws do not move
+        self.precision = precision
+        self.rounding_rng = np.random.default_rng(np.random.SeedSequence(seed).spawn(1)[0])
+        self.trust = make_trust_store(num_agents, topology, propagation, precision, self.rounding_rng)
         # storage of each agent's true reliability score
         self.r_arr = [0 for i in range(num_agents)]
         self.num_interactions = num_interactions
@@ -27,60 +85,140 @@ class Game:
         # decay constant. how much a player weighs incoming opinions from other player it had a "good" encounter with
         self.alpha_indirect = alpha_indirect
         self.total_payout = 0  # total payoff accumulated
-        # list of dictionaries, each with the following keys: ['active_id', 'passive_id', 'accepted', 'result']
-        self.encounter_history = []
+        self.num_proposals = 0 # encounters decided by the passive agents, accepted or not
+        # columnar record of encounters with the following columns: ['active_id', 'passive_id', 'active_reliability',
+        # 'passive_reliability', 'passive_opinion', 'accepted', 'result', 'total_payout']. iterating over it yields dicts
+        self.encounter_history = EncounterRecorder(num_interactions * self.agents_per_trial, payout_dtype=np.result_type(p_g, p_b))
         # create new directory to store logs of each run of the game
-        os.makedirs(os.path.dirname(f'logs_failures/game{self.run_no}/'), exist_ok=True)
-        self.game_desc_df = pd.read_csv('logs_failures/game_descriptions.csv')
-        self.log = open(
-            f'logs_failures/game{self.run_no}/game_log_{self.run_no}.txt', 'w')
-        self.log_failures = open(
-            f'logs_failures/game{self.run_no}/game_log_failures_{self.run_no}.txt', 'w')
-        self.df = pd.DataFrame(columns=['active_id', 'passive_id', 'active_reliability',
-                               'passive_reliability', 'passive_opinion', 'accepted', 'result', 'total_payout'])
-        self.df_failures = pd.DataFrame(columns=['passive_id', 'num_attempts', 'total_penalty_payout'])
-        self.df_aggregate_failures = pd.DataFrame(columns=['mean_num_attempts'])
-        self.csv_path = f'logs_failures/game{self.run_no}/game_log_{self.run_no}.csv'
-        self.csv_path_failures = f'logs_failures/game{self.run_no}/game_log_failures_{self.run_no}.csv'
-        self.csv_path_aggregate_failures = f'logs_failures/game{self.run_no}/game_log_aggregate_failures_{self.run_no}.csv'
+        self.log_dir = log_dir
+        if run_format not in RUN_FORMATS:
+            raise ValueError(f'unknown run format: {run_format}, expected one of {RUN_FORMATS}')
+        self.run_format = run_format # output tables as 'csv', binary 'npy' tables (see runfile.py) or 'both'
+        os.makedirs(os.path.dirname(f'{log_dir}/game{self.run_no}/'), exist_ok=True)
+        # encounter and failures logs. records are only formatted if the sink consumes them (see log_sinks.py).
+        # only the failures log is echoed to stdout. a resumed game continues its logs from the positions saved in the checkpoint
+        self.log_config = {'log_sink': log_sink, 'log_every': log_every, 'log_echo': log_echo, 'log_buffer_size': log_buffer_size}
+        log_offsets = log_offsets or {}
+        self.log = make_sink(log_sink, f'{log_dir}/game{self.run_no}/game_log_{self.run_no}.txt',
+                             every=log_every, echo=False, buffer_size=log_buffer_size, offset=log_offsets.get('log'))
+        self.log_failures = make_sink(log_sink, f'{log_dir}/game{self.run_no}/game_log_failures_{self.run_no}.txt',
+                                      every=log_every, echo=log_echo, buffer_size=log_buffer_size,
+                                      formatter=format_failure, dtype=FAILURE_LOG_DTYPE, offset=log_offsets.get('log_failures'))
+        # save the whole game state every checkpoint_every trials (0: never), see checkpoint.py
+        self.checkpoint_every = checkpoint_every
+        self.checkpoint_path = checkpoint_path or f'{log_dir}/game{self.run_no}/checkpoint_{self.run_no}.npz'
+        self.checkpoint_writer = None
+        # opt-in per-phase timers and counters, timing one in every profile_every trials (0: off), see profiling.py
+        self.profile_every = profile_every
+        self.profiler = Profiler(profile_every, agent_scope='trial;attempts;handle_encounter') if profile_every else None
+        # adaptive run length: every convergence.every trials, test whether the opinion error, the share of proposals accepted
+        # and the payoff per proposal have settled (see convergence.py; convergence is None, a dict of settings or a
+        # ConvergenceMonitor). once they have, action 'stop' ends the game and 'thin' keeps playing but only logs every
+        # thin_every-th record
+        self.convergence = make_monitor(convergence)
+        self.stopped_at = None # number of trials played, once the game has run
+        self.stop_reason = None # 'converged' or 'num_interactions'
+        # passive agents and their attempt counts, one row per trial
+        self.all_passive_ids = np.empty((num_interactions, self.agents_per_trial), dtype=int)
+        self.all_attempt_counts = np.empty((num_interactions, self.agents_per_trial), dtype=int)
+        # these tables are built once, at the end of run(), as dicts of NumPy columns from encounter_history and the
+        # per-trial attempt counts. they only become DataFrames (df, df_failures, df_aggregate_failures) when a CSV is
+        # written or they are read, so runs that only export 'npy' run tables never import pandas
+        self.played = False # set once play() has written the game's tables
+        self.failure_columns = None
+        self.aggregate_failure_columns = None
+        self.tables = {} # DataFrames built so far, by property name
+        self.csv_path = f'{log_dir}/game{self.run_no}/game_log_{self.run_no}.csv'
+        self.csv_path_failures = f'{log_dir}/game{self.run_no}/game_log_failures_{self.run_no}.csv'
+        self.csv_path_aggregate_failures = f'{log_dir}/game{self.run_no}/game_log_aggregate_failures_{self.run_no}.csv'
+        self.csv_path_profile = f'{log_dir}/game{self.run_no}/game_profile_{self.run_no}.csv'
+        self.csv_path_strategies = f'{log_dir}/game{self.run_no}/game_strategies_{self.run_no}.csv'
+        self.csv_path_convergence = f'{log_dir}/game{self.run_no}/game_convergence_{self.run_no}.csv'
 
-    def initialize_agents(self):
-        game_desc_df_row = {
+    def table(self, name: str, columns: dict) -> 'pd.DataFrame':
+        '''
+        returns the DataFrame of a table, built from its columns on first access (None before the game has run)
+        '''
+        if name not in self.tables:
+            if columns is None:
+                return None
+            import pandas as pd
+            table = pd.DataFrame(columns)
+            if 'strategy' in table:
+                table['strategy'] = pd.Categorical(table['strategy'], categories=list(STRATEGIES))
+            self.tables[name] = table
+        return self.tables[name]
+
+    @property
+    def df(self):
+        '''
+        encounter table, only kept when attempts are recorded
+        '''
+        return self.table('df', self.encounter_history.to_columns()) if self.played and self.record_attempts else None
+
+    @property
+    def df_failures(self):
+        '''
+        one row per passive turn: passive_id, strategy, num_attempts and total_penalty_payout
+        '''
+        return self.table('df_failures', self.failure_columns)
+
+    @property
+    def df_aggregate_failures(self):
+        '''
+        one row per trial: mean_num_attempts
+        '''
+        return self.table('df_aggregate_failures', self.aggregate_failure_columns)
+
+    def describe(self) -> dict:
+        return {
             'run_no': self.run_no,
             'num_agents': self.num_agents,
             'r_dist': self.r_dist,
-            'agent_type': 'learn_trust',
+            'agent_type': mix_spec(self.mix),
             'num_interactions': self.num_interactions,
             'p_g': self.p_g,
-            'p_b': self.p_b
+            'p_b': self.p_b,
+            'alpha_direct': self.alpha_direct,
+            'alpha_indirect': self.alpha_indirect,
+            'seed': self.seed,
+            'pairing': self.pairing,
+            'topology': self.topology.spec if self.topology is not None else None,
+            'precision': self.precision
         }
-        self.game_desc_df.loc[self.run_no] = game_desc_df_row
-        self.game_desc_df.to_csv('logs/game_descriptions.csv', index=False)
+
+    def initialize_agents(self):
+        game_desc_df_row = self.describe()
+        if self.pairing_weights is not None:
+            game_desc_df_row['pairing_weights'] = record_pairing_weights(f'{self.log_dir}/game_descriptions.csv', self.run_no, self.pairing_weights)
+        record_game_description(f'{self.log_dir}/game_descriptions.csv', game_desc_df_row)
+        self.description = game_desc_df_row # stored in the header of binary run tables
+        reliabilities = sample_reliabilities(self.rng, self.r_dist, self.num_agents)
+        self.build_agents(reliabilities, assign_strategies(self.mix, self.num_agents, self.rng))
+
+    def build_agents(self, reliabilities, strategy_codes):
+        self.reliabilities = reliabilities
+        self.strategy_codes = strategy_codes
+        self.r_arr = self.reliabilities.tolist()
+        exp_r = EXPECTED_RELIABILITY[self.r_dist]
+        threshold = payoff_threshold(self.r_dist, self.p_g, self.p_b)
         for i in range(self.num_agents):
-            r_i = 0
-            exp_r_i = 0.5
-            if (self.r_dist == 'uniform'):
-                r_i = np.random.uniform(0, 1)
-            elif (self.r_dist == 'normal'):
-                r_i = np.random.normal(0.5, 0.25)
-                r_i = np.clip(r_i, 0, 1)
-            elif (self.r_dist == 'bernoulli'):
-                r_i = np.random.randint(0, 1)
-            elif (self.r_dist == 'skewed'):
-                r_i = np.random.beta(2,6)
-                exp_r_i = 0.25
-            payoff_threshold = self.p_g * exp_r_i + self.p_b * (1 - exp_r_i) - 0.0005
             self.agents[i] = LearnTrustAgent(
-                i, r_i, self.alpha_direct, self.alpha_indirect, exp_r_i, payoff_threshold)
-            self.r_arr[i] = r_i
+                i, self.r_arr[i], self.alpha_direct, self.alpha_indirect, exp_r, threshold,
+                registers=self.trust.registers(i), rng=self.rng, profiler=self.profiler,
+                strategy=strategy_name(strategy_codes[i]))
         # print("agent array: ", self.agents)
 
-    def run_encounter(self, i, active_id, passive_id):
+    def run_encounter(self, i, active_id, passive_id, reliability_sample=None):
         '''
         initiate an encounter between two random agents, have the passive agent run the encounter,
         and update encounter history and total payoff according to encounter outcome
         args:
             i: encounter number in the whole game
+            active_id, passive_id: agents taking part in the encounter
+            reliability_sample: uniform that decides the outcome if the encounter is accepted
+        returns:
+            accepted, result: whether the encounter was accepted, and whether it was good
         '''
         active_agent = self.agents[active_id]
         passive_agent = self.agents[passive_id]
@@ -90,73 +228,362 @@ class Game:
             active_agent.get_reliability(),
             active_agent.get_registers(),
             self.p_g,
-            self.p_b
+            self.p_b,
+            reliability_sample
         )
         if accepted and result:
             self.total_payout += self.p_g
         elif accepted and not result:
             self.total_payout += self.p_b
-        encounter_dict = {
-            'active_id': active_id,
-            'passive_id': passive_id,
-            'active_reliability': active_agent.get_reliability(),
-            'passive_reliability': passive_agent.get_reliability(),
-            'passive_opinion': passive_agent.get_registers()[active_id],
-            'accepted': accepted,
-            'result': result,
-            'total_payout': self.total_payout
-        }
-        encounter_print_string = f"ENCOUNTER {i}.\nActive ID: {active_id}\nPassive ID: {passive_id}\nActive agent reliability: {active_agent.get_reliability()}\nPassive agent reliability: {passive_agent.get_reliability()}\nPassive agent's opinion of active agent: {passive_agent_opinion}\nEncounter accepted: {accepted}\nEncounter result: {result}\nTotal payout: {self.total_payout}\n"
-        encounter_print_string += '\n###########################\n'
-        self.log.write(encounter_print_string)
-        self.encounter_history.append(encounter_dict)
-        self.df.loc[len(self.df.index)] = encounter_dict
-        return [accepted, result, encounter_print_string]
+        self.encounter_history.append(
+            active_id,
+            passive_id,
+            active_agent.get_reliability(),
+            passive_agent.get_reliability(),
+            passive_agent.get_registers()[active_id],
+            accepted,
+            result,
+            self.total_payout
+        )
+        if self.log.accepts(len(self.encounter_history) - 1):
+            self.log.write((i, active_id, passive_id, active_agent.get_reliability(), passive_agent.get_reliability(),
+                            passive_agent_opinion, accepted, result, self.total_payout))
+        return accepted, result
+
+    def count_attempts(self, passive_id):
+        '''
+        fast path of one passive agent's attempts-until-success loop, with the same draws, acceptance
+        decisions and opinion updates as playing the attempts one at a time with run_encounter, but
+        without recording them. partners are drawn ahead in chunks and each chunk is decided at once,
+        up to the first partner whose opinion an earlier attempt in the chunk has changed
+        args:
+            passive_id: agent looking for a successful encounter
+        returns:
+            attempt_count: number of accepted encounters, including the successful one
+        '''
+        passive_agent = self.agents[passive_id]
+        registers = passive_agent.get_registers() # the passive agent's opinions, updated in place
+        attempt_count = 0
+        proposals = 0
+        chunk_size = 8 # most agents succeed within a few attempts; chunks double for the ones that do not
+        while True:
+            active_ids, reliability_samples = self.partners.peek(passive_id, min(chunk_size, self.max_proposals - proposals))
+            chunk_size *= 2
+            size = len(active_ids)
+            positions = registers.positions(active_ids)
+            opinions = registers.values(positions)
+            accepted = passive_agent.decide_fn(opinions, self.reliabilities[active_ids], self.p_g, self.p_b,
+                                               passive_agent.payoff_threshold)
+            result = accepted & (reliability_samples < self.reliabilities[active_ids])
+            # the same stopping rules as the per-attempt loop
+            stop = result | (np.cumsum(accepted) > self.num_agents - attempt_count)
+            if proposals + size >= self.max_proposals:
+                stop[self.max_proposals - proposals - 1] = True
+            done = bool(stop.any())
+            end = int(np.argmax(stop)) + 1 if done else size
+            if accepted[:end - 1].any():
+                # an opinion only changes when an encounter is accepted, so a repeated partner is decided on a stale
+                # opinion exactly when its first attempt in the chunk was accepted. the chunk is cut before that point
+                _, first, inverse = np.unique(active_ids[:end], return_index=True, return_inverse=True)
+                stale = (np.arange(end) != first[inverse]) & accepted[first][inverse]
+                if stale.any():
+                    end = int(np.argmax(stale))
+                    done = False
+
+            played = slice(0, end)
+            accepted, result = accepted[played], result[played]
+            updated = positions[played][accepted]
+            registers.assign(updated, (1 - passive_agent.alpha_direct) * registers.values(updated)
+                             + passive_agent.alpha_direct * result[accepted])
+            num_good = int(np.count_nonzero(result))
+            num_accepted = int(np.count_nonzero(accepted))
+            self.total_payout += num_good * self.p_g + (num_accepted - num_good) * self.p_b
+            attempt_count += num_accepted
+            if self.profiler is not None:
+                self.profiler.count('chunks')
+                self.profiler.count('proposals', end)
+                self.profiler.count('direct_updates', num_accepted)
+                self.profiler.count('register_entries', len(updated))
+            proposals += end
+            self.num_proposals += end
+            self.partners.advance(end)
+            if done:
+                if num_good:
+                    active_id = int(active_ids[end - 1])
+                    passive_agent.adopt_opinions(active_id, self.agents[active_id].get_registers())
+                return attempt_count
 
     def run(self):
         self.initialize_agents()
         print("TEST: ", self.agents[0].get_reliability())
-        for j in range(self.num_interactions):
-            attempt_counts = [0] * self.agents_per_trial
-            passive_ids = np.random.choice(range(self.num_agents), size=self.agents_per_trial, replace=False)
+        return self.play()
+
+    def play(self, start=0):
+        '''
+        play trials start, ..., num_interactions - 1 and write the game's tables
+        '''
+        all_passive_ids, all_attempt_counts = self.all_passive_ids, self.all_attempt_counts
+        profiler = self.profiler
+        played = self.num_interactions
+        for j in range(start, self.num_interactions):
+            if self.convergence.enabled and j > start and j % self.convergence.every == 0 and self.check_convergence(j):
+                played = j
+                break
+            if self.checkpoint_every and j > start and j % self.checkpoint_every == 0:
+                self.checkpoint(j)
+            timed = profiler is not None and profiler.start(j)
+            if timed:
+                trial_start = profiler.clock()
+            attempt_counts = all_attempt_counts[j]
+            passive_ids = self.rng.choice(self.trial_agents, size=self.agents_per_trial, replace=False)
+            all_passive_ids[j] = passive_ids
+            if timed:
+                t0 = profiler.clock()
+                profiler.add('trial;passive_sampling', trial_start, t0)
             for i in range(self.agents_per_trial):
                 passive_id = passive_ids[i]
-                df_failures_row = {
-                    'passive_id': passive_id
-                }
-                active_range_pool = list(range(self.num_agents))
-                active_range_pool.remove(passive_id)
+                if not self.record_attempts:
+                    attempt_counts[i] = attempt_count = self.count_attempts(passive_id)
+                    if timed:
+                        t1 = profiler.clock()
+                    if self.log_failures.accepts(j * self.agents_per_trial + i):
+                        self.log_failures.write((j, passive_id, attempt_count, (attempt_count - 1) * self.p_b))
+                    if timed:
+                        t2 = profiler.clock()
+                        profiler.add('trial;attempts', t0, t1)
+                        profiler.add('trial;logging', t1, t2)
+                        t0 = t2
+                    continue
                 attempt_count = 0
+                proposals = 0
                 while True:
-                    active_id = np.random.choice(active_range_pool, size=1)[0]
-                    accepted, result = (self.run_encounter(i, active_id, passive_id))[:2]
+                    proposals += 1
+                    active_id, reliability_sample = self.partners.next(passive_id)
+                    accepted, result = self.run_encounter(i, active_id, passive_id, reliability_sample)
                     if accepted and not result:
                             attempt_count += 1
                     if accepted and result:
                         attempt_count += 1
                         break
-                    if attempt_count > self.num_agents:
+                    if attempt_count > self.num_agents or proposals >= self.max_proposals:
                         break
+                self.num_proposals += proposals
                 attempt_counts[i] = attempt_count
-                df_failures_row['num_attempts'] = attempt_count
-                df_failures_row['total_penalty_payout'] = (attempt_count - 1) * self.p_b
-                log_failures_print_string = f'Run {j}: Passive agent {passive_id} took {attempt_count} attempts to get a successful encounter. Penalty this agent incurred: {(attempt_count - 1) * self.p_b}\n'
-                print(log_failures_print_string)
-                self.log_failures.write(log_failures_print_string)
-                self.df_failures.loc[len(self.df_failures.index)] = df_failures_row
-            df_agg_failures_row = {
-                'mean_num_attempts': np.mean(attempt_counts)
-            }
-            self.df_aggregate_failures.loc[len(self.df_aggregate_failures.index)] = df_agg_failures_row
-        self.df.to_csv(self.csv_path)
-        self.df_failures.to_csv(self.csv_path_failures)
-        self.df_aggregate_failures.to_csv(self.csv_path_aggregate_failures)
+                if timed:
+                    t1 = profiler.clock()
+                if self.log_failures.accepts(j * self.agents_per_trial + i):
+                    self.log_failures.write((j, passive_id, attempt_count, (attempt_count - 1) * self.p_b))
+                if timed:
+                    t2 = profiler.clock()
+                    profiler.add('trial;attempts', t0, t1)
+                    profiler.add('trial;logging', t1, t2)
+                    t0 = t2
+            if timed:
+                profiler.add('trial', trial_start, profiler.clock())
+        else:
+            if self.convergence.enabled and self.num_interactions % self.convergence.every == 0:
+                self.check_convergence(self.num_interactions) # the last window, so the steady state covers the whole game
+        self.stopped_at = played
+        self.stop_reason = 'converged' if played < self.num_interactions else 'num_interactions'
+        all_passive_ids, all_attempt_counts = all_passive_ids[:played], all_attempt_counts[:played]
+        if self.checkpoint_writer is not None:
+            self.checkpoint_writer.close()
+            self.checkpoint_writer = None
+        self.log.close()
+        self.log_failures.close()
+        self.played = True
+        self.tables = {}
+        self.failure_columns = {
+            'passive_id': all_passive_ids.ravel(),
+            'strategy': np.array(list(STRATEGIES))[self.strategy_codes[all_passive_ids.ravel()]],
+            'num_attempts': all_attempt_counts.ravel(),
+            'total_penalty_payout': (all_attempt_counts.ravel() - 1) * self.p_b
+        }
+        self.aggregate_failure_columns = {'mean_num_attempts': all_attempt_counts.mean(axis=1)}
+        # with CSV output, the DataFrames are built once here and kept for df and df_failures
+        csv = self.run_format in ('csv', 'both')
+        if self.record_attempts:
+            save_run_table(self.df if csv else self.encounter_history.to_columns(), self.csv_path, self.run_format, self.description)
+        save_run_table(self.df_failures if csv else self.failure_columns, self.csv_path_failures, self.run_format, self.description)
+        save_run_table(self.df_aggregate_failures if csv else self.aggregate_failure_columns, self.csv_path_aggregate_failures,
+                       self.run_format, self.description)
+        save_run_table(self.strategy_attempts(), self.csv_path_strategies, self.run_format, self.description)
+        if self.convergence.enabled:
+            params = dict(self.description, stopped_at=self.stopped_at, stop_reason=self.stop_reason, **self.convergence.summary())
+            save_run_table(self.convergence.columns(), self.csv_path_convergence, self.run_format, params)
+        if profiler is not None:
+            self.save_profile()
         return self.encounter_history
 
+    def check_convergence(self, next_trial: int) -> bool:
+        '''
+        pass the window of trials that ends before next_trial to the convergence monitor
+        returns:
+            whether the game should stop
+        '''
+        windows = self.convergence.windows
+        decided = self.num_proposals - sum(window['decided'] for window in windows)
+        accepted = int(self.all_attempt_counts[next_trial - self.convergence.every:next_trial].sum())
+        payout = self.total_payout - sum(window['payout'] for window in windows)
+        if not self.convergence.check(next_trial, self.trust.opinion_error(self.reliabilities), decided, accepted, payout):
+            return False
+        print(f"Converged at trial {self.convergence.converged_at}: {self.convergence.reason}")
+        if self.convergence.action == 'thin':
+            self.thin_logs()
+        return self.convergence.action == 'stop'
+
+    def thin_logs(self):
+        self.log = SampledSink(self.log, self.convergence.thin_every)
+        self.log_failures = SampledSink(self.log_failures, self.convergence.thin_every)
+
+    def strategy_attempts(self) -> dict:
+        '''
+        returns a dict of columns with one row per strategy present among the passive agents: the number of passive
+        turns, and the mean and (sample) standard deviation of their attempts until success
+        '''
+        codes = self.strategy_codes[self.failure_columns['passive_id']]
+        attempts = self.failure_columns['num_attempts'].astype(np.float64)
+        counts = np.bincount(codes, minlength=len(STRATEGIES))
+        present = np.flatnonzero(counts)
+        counts = counts[present]
+        means = np.bincount(codes, weights=attempts, minlength=len(STRATEGIES))[present] / counts
+        squares = np.bincount(codes, weights=(attempts - means[np.searchsorted(present, codes)]) ** 2, minlength=len(STRATEGIES))[present]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            stds = np.sqrt(squares / (counts - 1))
+        return {'strategy': np.array([strategy_name(code) for code in present]), 'num_turns': counts, 'mean_num_attempts': means,
+                'std_num_attempts': np.where(counts > 1, stds, np.nan)}
+
+    def save_profile(self):
+        '''
+        write the per-phase summary table, a Chrome trace and folded stacks of the profiled trials, and print the summary
+        '''
+        summary = self.profiler.summary()
+        save_run_table(summary, self.csv_path_profile, self.run_format, self.description)
+        self.profiler.write_chrome_trace(f'{self.log_dir}/game{self.run_no}/game_profile_{self.run_no}.trace.json')
+        self.profiler.write_folded(f'{self.log_dir}/game{self.run_no}/game_profile_{self.run_no}.folded')
+        print("Profile (1 in", self.profiler.sample_every, "trials timed):")
+        print(summary.to_string(index=False))
+        print("Counters:", self.profiler.counters_dict())
+
+    def get_state(self, next_trial: int):
+        '''
+        returns (arrays, meta): copies of everything needed to continue the game at trial next_trial
+        '''
+        partner_state = self.partners.get_state()
+        arrays = {
+            'reliabilities': self.reliabilities.copy(),
+            'strategy_codes': self.strategy_codes,
+            'opinions': self.trust.get_state(),
+            'partner_draws': partner_state['draws'],
+            'passive_ids': self.all_passive_ids[:next_trial].copy(),
+            'attempt_counts': self.all_attempt_counts[:next_trial].copy()
+        }
+        if self.record_attempts:
+            for name in self.encounter_history.dtypes:
+                arrays[f'history_{name}'] = self.encounter_history.column(name).copy()
+        if self.topology is not None:
+            arrays['topology_indptr'] = self.topology.indptr
+            arrays['topology_indices'] = self.topology.indices
+        if self.pairing_weights is not None:
+            arrays['pairing_weights'] = self.pairing_weights
+        kwargs = dict(self.describe(), **self.log_config, record_attempts=self.record_attempts, run_format=self.run_format,
+                      checkpoint_every=self.checkpoint_every, checkpoint_path=self.checkpoint_path, profile_every=self.profile_every,
+                      propagation=self.propagation, convergence=self.convergence.settings(), log_dir=self.log_dir)
+        kwargs['strategies'] = kwargs.pop('agent_type')
+        meta = {
+            'game': 'simulation_failures',
+            'kwargs': kwargs,
+            'next_trial': next_trial,
+            'total_payout': self.total_payout,
+            'num_proposals': self.num_proposals,
+            'convergence': self.convergence.get_state(),
+            'rng': rng_state(self.rng),
+            'rounding_rng': rng_state(self.rounding_rng),
+            'partner_position': partner_state['position'],
+            'log_offsets': {'log': self.log.tell(), 'log_failures': self.log_failures.tell()}
+        }
+        return arrays, meta
+
+    def restore(self, arrays: dict, meta: dict):
+        '''
+        set the game to the state saved by get_state
+        '''
+        self.description = self.describe()
+        self.build_agents(arrays['reliabilities'], arrays['strategy_codes'])
+        self.trust.set_state(arrays['opinions'])
+        set_rng_state(self.rng, meta['rng'])
+        set_rng_state(self.rounding_rng, meta['rounding_rng'])
+        self.partners.set_state({'draws': arrays['partner_draws'], 'position': meta['partner_position']})
+        next_trial = meta['next_trial']
+        self.all_passive_ids[:next_trial] = arrays['passive_ids']
+        self.all_attempt_counts[:next_trial] = arrays['attempt_counts']
+        if self.record_attempts:
+            self.encounter_history.restore({name: arrays[f'history_{name}'] for name in self.encounter_history.dtypes})
+        self.total_payout = meta['total_payout']
+        self.num_proposals = meta['num_proposals']
+        self.convergence.set_state(meta['convergence'])
+        if self.convergence.converged and self.convergence.action == 'thin':
+            self.thin_logs()
+
+    def checkpoint(self, next_trial: int):
+        '''
+        save the game state; the copy is taken here and written to self.checkpoint_path in a background thread
+        '''
+        if self.checkpoint_writer is None:
+            self.checkpoint_writer = CheckpointWriter()
+        arrays, meta = self.get_state(next_trial)
+        self.checkpoint_writer.submit(self.checkpoint_path, arrays, meta)
+
+
+def resume(checkpoint_path, **kwargs):
+    '''
+    continue a game from its last checkpoint; the result is identical to a run that never stopped
+    args:
+        checkpoint_path: checkpoint written by Game.checkpoint
+        kwargs: Game arguments to override, e.g. checkpoint_every
+    returns:
+        the Game, after it has been run
+    '''
+    arrays, meta = load_checkpoint(checkpoint_path)
+    game_kwargs = dict(meta['kwargs'], **kwargs)
+    if 'topology_indptr' in arrays:
+        game_kwargs['topology'] = Topology(game_kwargs['num_agents'], arrays['topology_indptr'], arrays['topology_indices'],
+                                           game_kwargs['topology'])
+    if 'pairing_weights' in arrays:
+        game_kwargs['pairing_weights'] = arrays['pairing_weights']
+    game = Game(log_offsets=meta['log_offsets'], **game_kwargs)
+    game.restore(arrays, meta)
+    game.play(meta['next_trial'])
+    return game
+
+
+def replay(run_no, descriptions_path='logs_failures/game_descriptions.csv', **kwargs):
+    '''
+    regenerate a logged run from its recorded description and seed
+    args:
+        run_no: run number of the logged game
+        descriptions_path: game_descriptions.csv the run was recorded in
+        kwargs: other Game arguments, e.g. log_dir and log_sink, so the replay does not overwrite the original logs.
+            a run with 'weighted' pairing is replayed with its recorded weights, unless pairing_weights is given
+    returns:
+        the Game, after it has been run
+    '''
+    description = load_game_description(descriptions_path, run_no)
+    pairing_weights = kwargs.pop('pairing_weights', description['pairing_weights'])
+    if description['pairing'] == 'weighted' and pairing_weights is None:
+        raise ValueError(f'run {run_no} was recorded without its pairing weights; pass them to replay as pairing_weights')
+    game = Game(run_no=run_no, num_agents=description['num_agents'], r_dist=description['r_dist'],
+                num_interactions=description['num_interactions'], p_g=description['p_g'], p_b=description['p_b'],
+                alpha_direct=description['alpha_direct'], alpha_indirect=description['alpha_indirect'],
+                seed=description['seed'], pairing=description['pairing'], pairing_weights=pairing_weights, topology=description['topology'],
+                strategies=description['agent_type'], precision=description['precision'], **kwargs)
+    game.run()
+    return game
+
 
 def main():
+    from config import Config
     # TODO: maybe allow user to input different reliability distributions
-    # TODO: implement the other agents: play_always, play_never, and know_reliability
     '''
     args = sys.argv[1:]
     if len(args) != 2:
@@ -171,8 +598,14 @@ def main():
     num_interactions = 750
 
     game = Game(num_agents=num_agents, r_dist=r_dist,
-                num_interactions=num_interactions)
+                num_interactions=num_interactions, seed=Config.seed, pairing=Config.pairing,
+                pairing_weights=Config.pairing_weights, topology=Config.topology,
+                strategies=Config.strategies, record_attempts=Config.record_attempts, log_sink=Config.log_sink, log_every=Config.log_every,
+                log_echo=Config.log_echo, log_buffer_size=Config.log_buffer_size, run_format=Config.run_format,
+                checkpoint_every=Config.checkpoint_every, profile_every=Config.profile_every, propagation=Config.propagation,
+                precision=Config.precision, convergence=Config.convergence)
     encounter_history = game.run()
+    export_game_descriptions(f'{game.log_dir}/game_descriptions.csv')
 
     # print(encounter_history)
 
@@ -0,0 +1,209 @@
+'''
+This Python library holds the agent strategies: the rules agents use to decide
+whether to accept an encounter. Every strategy is one vectorized function of
+NumPy arrays (or scalars), and decide() runs a batch of encounters of a mixed
+population with one call per strategy present rather than one call per agent.
+Engines decide in batches where a batch is large enough to pay for the call
+(MIN_BATCH_DECISIONS): the waves of simulation.py's threaded mode, the runs of
+a scheduler tick in event_simulation.py, a wave on each shard of
+distributed.py, a chunk of attempts in simulation_failures.py and one
+encounter in each of many replicates in batch.py. simulation.py's serial loop
+decides one encounter at a time with LearnTrustAgent.decide.
+
+Strategies:
+* learn_trust: accept if the expected payoff under the agent's opinion of its partner reaches its threshold
+* know_reliability: the same, with the partner's true reliability in place of the opinion
+* play_always: accept every encounter
+* play_never: reject every encounter
+
+A population is a mix of strategies, e.g. 'learn_trust:0.8,play_always:0.1,play_never:0.1'.
+'''
+
+import numpy as np
+
+# strategy name -> decision function(opinions, reliabilities, p_g, p_b, thresholds) returning accepted.
+# a strategy's code is its position in this registry
+STRATEGIES = {}
+
+# smallest batch an engine decides with one decide call: below it, the call costs more than the agents deciding one
+# encounter at a time (about 1 us each); from 64 encounters on it is 2-4 times cheaper per encounter
+MIN_BATCH_DECISIONS = 64
+
+
+def register_strategy(name: str):
+    '''
+    decorator adding a decision function to STRATEGIES under the given name
+    '''
+    def register(decide_fn):
+        if name in STRATEGIES:
+            raise ValueError(f'strategy {name} is already registered')
+        STRATEGIES[name] = decide_fn
+        return decide_fn
+    return register
+
+
+@register_strategy('learn_trust')
+def learn_trust(opinions, reliabilities, p_g, p_b, thresholds):
+    return opinions * p_g + (1 - opinions) * p_b >= thresholds
+
+
+@register_strategy('play_always')
+def play_always(opinions, reliabilities, p_g, p_b, thresholds):
+    return np.ones(np.shape(opinions), dtype=bool) if np.ndim(opinions) else True
+
+
+@register_strategy('play_never')
+def play_never(opinions, reliabilities, p_g, p_b, thresholds):
+    return np.zeros(np.shape(opinions), dtype=bool) if np.ndim(opinions) else False
+
+
+@register_strategy('know_reliability')
+def know_reliability(opinions, reliabilities, p_g, p_b, thresholds):
+    return reliabilities * p_g + (1 - reliabilities) * p_b >= thresholds
+
+
+def strategy_code(name: str) -> int:
+    if name not in STRATEGIES:
+        raise ValueError(f'unknown strategy: {name}, expected one of {list(STRATEGIES)}')
+    return list(STRATEGIES).index(name)
+
+
+def strategy_name(code: int) -> str:
+    return list(STRATEGIES)[code]
+
+
+def parse_mix(spec) -> dict:
+    '''
+    parse a population mix
+    args:
+        spec: a strategy name, 'name:fraction,name:fraction,...', or a dict mapping name to fraction
+    returns:
+        dict mapping strategy name to its fraction of the population; fractions sum to 1
+    '''
+    if isinstance(spec, dict):
+        mix = dict(spec)
+    else:
+        mix = {}
+        for part in str(spec).split(','):
+            name, _, fraction = part.strip().partition(':')
+            mix[name] = float(fraction) if fraction else 1.0
+    for name, fraction in mix.items():
+        strategy_code(name)
+        if fraction < 0:
+            raise ValueError(f'negative fraction for strategy {name}: {fraction}')
+    total = sum(mix.values())
+    if total <= 0:
+        raise ValueError(f'empty population mix: {spec}')
+    if abs(total - 1) < 1e-9:
+        total = 1 # already normalized, e.g. a mix_spec string: keep the fractions exactly as given
+    return {name: fraction / total for name, fraction in mix.items() if fraction > 0}
+
+
+def mix_spec(mix: dict) -> str:
+    '''
+    returns the canonical string of a mix, e.g. 'learn_trust' or 'learn_trust:0.8,play_never:0.2'
+    '''
+    if len(mix) == 1:
+        return next(iter(mix))
+    return ','.join(f'{name}:{fraction!r}' for name, fraction in mix.items())
+
+
+def assign_strategies(mix: dict, num_agents: int, rng: np.random.Generator) -> np.ndarray:
+    '''
+    give every agent a strategy
+    args:
+        mix: dict mapping strategy name to fraction, see parse_mix
+        num_agents: number of agents
+        rng: random generator that shuffles the strategies over the agents; only drawn from for mixed populations
+    returns:
+        int8 array of strategy codes. each strategy gets its fraction of the agents, rounded by largest remainder
+    '''
+    names = list(mix)
+    if len(names) == 1:
+        return np.full(num_agents, strategy_code(names[0]), dtype=np.int8)
+    exact = np.array([mix[name] for name in names]) * num_agents
+    counts = np.floor(exact).astype(int)
+    counts[np.argsort(counts - exact, kind='stable')[:num_agents - counts.sum()]] += 1
+    codes = np.repeat(np.array([strategy_code(name) for name in names], dtype=np.int8), counts)
+    return rng.permutation(codes)
+
+
+def decide(codes, opinions, reliabilities, p_g, p_b, thresholds):
+    '''
+    decide a batch of encounters of a mixed population
+    args:
+        codes: strategy codes of the deciding agents
+        opinions: the deciding agents' opinions of their partners
+        reliabilities: the partners' true reliabilities
+        p_g, p_b: payoffs of a good and a bad encounter
+        thresholds: the deciding agents' payoff thresholds, an array or one value for all
+    returns:
+        boolean array, whether each encounter is accepted
+    '''
+    codes = np.asarray(codes)
+    names = list(STRATEGIES)
+    if codes.size == 0 or (codes == codes.flat[0]).all():
+        # one strategy, the common case: skip finding the strategies present, which dominates for small batches
+        accepted = STRATEGIES[names[codes.flat[0] if codes.size else 0]](opinions, reliabilities, p_g, p_b, thresholds)
+        if np.shape(accepted) == codes.shape:
+            return np.asarray(accepted)
+        return np.broadcast_to(accepted, codes.shape).copy()
+    # every strategy present decides the whole batch and each encounter keeps its own agent's decision:
+    # cheaper than gathering each strategy's encounters, above all for the small batches of simulation.py
+    present = np.flatnonzero(np.bincount(codes.ravel(), minlength=len(names)))
+    accepted = np.empty(codes.shape, dtype=bool)
+    for code in present.tolist():
+        np.copyto(accepted, STRATEGIES[names[code]](opinions, reliabilities, p_g, p_b, thresholds), where=codes == code)
+    return accepted
+
+
+def decision_runs(keys) -> np.ndarray:
+    '''
+    split a sequence of encounters into runs that can be decided with one decide call before any of them is played
+    args:
+        keys: per encounter, what its decision reads and its updates may change, e.g. the active agent's row of opinions
+    returns:
+        array ends, where ends[s] is the end of the longest run starting at encounter s in which no key repeats.
+        no encounter of such a run changes an opinion a later encounter of the run decides on
+    '''
+    keys = np.asarray(keys)
+    n = len(keys)
+    following = np.full(n, n, dtype=np.intp) # position of the next encounter with the same key
+    order = np.argsort(keys, kind='stable')
+    repeated = keys[order[1:]] == keys[order[:-1]]
+    following[order[:-1][repeated]] = order[1:][repeated]
+    return np.minimum.accumulate(following[::-1])[::-1]
+
+
+def strategy_summary(codes, payoffs, proposals=None, accepted=None) -> 'pd.DataFrame':
+    '''
+    per-strategy aggregates of a population
+    args:
+        codes: strategy code of every agent
+        payoffs: payoff of every agent
+        proposals, accepted: optional per-agent numbers of encounters decided and accepted
+    returns:
+        DataFrame with one row per strategy present: number of agents, total, mean and standard
+        deviation of their payoffs, and (with proposals and accepted) their acceptance rate
+    '''
+    import pandas as pd
+    codes = np.asarray(codes)
+    payoffs = np.asarray(payoffs, dtype=np.float64)
+    minlength = len(STRATEGIES)
+    counts = np.bincount(codes, minlength=minlength)
+    totals = np.bincount(codes, weights=payoffs, minlength=minlength)
+    squares = np.bincount(codes, weights=payoffs ** 2, minlength=minlength)
+    present = np.flatnonzero(counts)
+    means = totals[present] / counts[present]
+    summary = pd.DataFrame({
+        'strategy': [strategy_name(code) for code in present],
+        'num_agents': counts[present],
+        'total_payoff': totals[present],
+        'mean_payoff': means,
+        'std_payoff': np.sqrt(np.maximum(squares[present] / counts[present] - means ** 2, 0))
+    })
+    if proposals is not None and accepted is not None:
+        decided = np.bincount(codes, weights=proposals, minlength=minlength)[present]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            summary['acceptance_rate'] = np.bincount(codes, weights=accepted, minlength=minlength)[present] / decided
+    return summary
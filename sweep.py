@@ -0,0 +1,160 @@
+'''
+This Python library runs parameter sweeps of the payoff game (simulation.py).
+Every cell of a parameter grid is run as an independent Game in a process pool,
+each with its own RNG seed, and the results are gathered into one summary table.
+Finished cells are saved as they complete, so an interrupted sweep resumes
+where it left off.
+'''
+
+import hashlib
+import itertools
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+import pandas as pd
+from config import Config
+
+# Game arguments that a grid may sweep over
+SWEEP_PARAMS = ['num_agents', 'r_dist', 'num_interactions', 'p_g', 'p_b', 'alpha_direct', 'alpha_indirect', 'topology', 'strategies']
+
+
+def expand_grid(grid: dict, num_replicates: int = 1) -> list:
+    '''
+    turn a parameter grid into a list of cells, in a fixed order
+    args:
+        grid: dict mapping a Game argument to the list of values to sweep over
+        num_replicates: number of independently seeded runs per parameter combination
+    returns:
+        list of dicts, each holding one value per swept parameter plus 'replicate'
+    '''
+    for param in grid:
+        if param not in SWEEP_PARAMS:
+            raise ValueError(f'cannot sweep over {param}, expected one of {SWEEP_PARAMS}')
+    names = list(grid)
+    cells = []
+    for values in itertools.product(*(grid[name] for name in names)):
+        for replicate in range(num_replicates):
+            cell = dict(zip(names, values))
+            cell['replicate'] = replicate
+            cells.append(cell)
+    return cells
+
+
+def cell_key(cell: dict) -> str:
+    '''
+    file-name-safe identifier of a cell
+    '''
+    return '_'.join(f'{name}={cell[name]}' for name in sorted(cell))
+
+
+def cell_seed(cell: dict, seed) -> int:
+    '''
+    seed of a cell, derived from the root seed and the cell's parameters, so it does not
+    change when the grid is extended or reordered
+    '''
+    digest = int(hashlib.sha256(cell_key(cell).encode()).hexdigest()[:16], 16)
+    return int(np.random.SeedSequence([seed, digest]).generate_state(1)[0])
+
+
+def opinion_error(game) -> float:
+    '''
+    mean absolute error of all opinions versus the true reliability of the agent they are about.
+    with a topology, only the opinions along graph edges are counted
+    '''
+    return game.trust.opinion_error(game.r_arr)
+
+
+def run_cell(cell: dict, seed: int, run_no: int, sweep_dir: str, convergence: dict = None) -> dict:
+    '''
+    run one Game for a cell and return its summary row. runs in a worker process.
+    with convergence settings whose action is 'stop' (see convergence.py), the cell ends once its game has settled
+    '''
+    from simulation import Game
+    params = {name: value for name, value in cell.items() if name in SWEEP_PARAMS}
+    # the summary row only needs the game's running metrics: keep no encounter history, and write the metrics
+    # (and convergence) tables as binary tables, without pandas or CSV formatting
+    game = Game(run_no=run_no, seed=seed, log_sink='null', keep_history=False, run_format='npy', log_dir=os.path.join(sweep_dir, 'logs'),
+                agent_log_dir=os.path.join(sweep_dir, 'agent_logs'), convergence=convergence, **params)
+    game.run()
+    metrics = game.metrics
+    row = dict(cell, run_no=run_no, seed=seed)
+    row['final_total_payout'] = game.total_payout
+    row['acceptance_rate'] = metrics.num_accepted / metrics.num_encounters
+    row['success_rate'] = metrics.num_successes / metrics.num_accepted if metrics.num_accepted else np.nan
+    row['opinion_mae'] = opinion_error(game)
+    # the totals and rates above cover the encounters played, stopped_at of num_interactions
+    row['stopped_at'] = game.stopped_at
+    row['stop_reason'] = game.stop_reason
+    if game.convergence.enabled:
+        summary = game.convergence.summary()
+        row['converged_at'] = summary['converged_at']
+        for name in ('steady_opinion_error', 'steady_acceptance_rate', 'steady_payout_rate'):
+            row[name] = summary[name]
+    return row
+
+
+def write_json_atomic(path: str, data: dict):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+def run_sweep(grid: dict, sweep_dir: str, num_replicates: int = 1, seed=0, max_workers=None, convergence: dict = None) -> pd.DataFrame:
+    '''
+    run every cell of a grid across a process pool and write sweep_dir/summary.csv
+    args:
+        grid: dict mapping a Game argument to the list of values to sweep over
+        sweep_dir: directory for per-cell results, game logs and the summary
+        num_replicates: independently seeded runs per parameter combination
+        seed: root seed. each cell's seed is derived from it and the cell's parameters
+        max_workers: number of worker processes, defaults to all cores
+        convergence: convergence settings of every cell's game (see convergence.py), None to play every encounter
+    returns:
+        summary DataFrame with one row per cell
+    '''
+    cells = expand_grid(grid, num_replicates)
+    cells_dir = os.path.join(sweep_dir, 'cells')
+    os.makedirs(cells_dir, exist_ok=True)
+
+    # finished cells keep their run numbers; new cells get run numbers no earlier sweep has used
+    used_run_nos = [-1]
+    for name in os.listdir(cells_dir):
+        if name.endswith('.json'):
+            with open(os.path.join(cells_dir, name)) as f:
+                used_run_nos.append(json.load(f)['run_no'])
+    next_run_no = max(used_run_nos) + 1
+    pending = []
+    for cell in cells:
+        if not os.path.exists(os.path.join(cells_dir, cell_key(cell) + '.json')):
+            pending.append((cell, cell_seed(cell, seed), next_run_no))
+            next_run_no += 1
+    print(f'{len(cells) - len(pending)} of {len(cells)} cells already finished')
+
+    if pending:
+        with ProcessPoolExecutor(max_workers=max_workers or os.cpu_count()) as executor:
+            futures = {executor.submit(run_cell, cell, seed_, run_no, sweep_dir, convergence): cell
+                       for cell, seed_, run_no in pending}
+            for done, future in enumerate(as_completed(futures), 1):
+                row = future.result()
+                write_json_atomic(os.path.join(cells_dir, cell_key(futures[future]) + '.json'), row)
+                print(f'[{done}/{len(pending)}] {cell_key(futures[future])}: total payout {row["final_total_payout"]}')
+
+    rows = []
+    for cell in cells:
+        with open(os.path.join(cells_dir, cell_key(cell) + '.json')) as f:
+            rows.append(json.load(f))
+    summary = pd.DataFrame(rows)
+    summary.to_csv(os.path.join(sweep_dir, 'summary.csv'), index=False)
+    return summary
+
+
+def main():
+    summary = run_sweep(Config.sweep_grid, Config.sweep_dir, num_replicates=Config.sweep_replicates, seed=Config.sweep_seed,
+                        convergence=Config.convergence)
+    print(summary)
+
+
+if __name__ == "__main__":
+    main()
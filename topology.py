@@ -0,0 +1,148 @@
+'''
+This Python library builds the contact graphs used by topology-aware games.
+Graphs are undirected, have no self loops, and are stored in CSR layout: the
+neighbours of agent i are indices[indptr[i]:indptr[i + 1]], sorted by id.
+
+Generators:
+* random_regular: union of random Hamiltonian cycles, every agent has degree close to d
+* small_world: Watts-Strogatz ring lattice with random rewiring
+* scale_free: Barabasi-Albert preferential attachment
+'''
+
+import numpy as np
+
+
+class Topology:
+    '''
+    Undirected graph in CSR layout.
+
+    Attributes
+    ----------
+    num_agents : int
+        number of agents (nodes)
+    indptr : np.ndarray
+        row pointers, length num_agents + 1
+    indices : np.ndarray
+        sorted neighbour ids of each agent, concatenated
+    spec : str
+        description of how the graph was built, e.g. 'regular:8'
+
+    Methods
+    -------
+    neighbors(i)
+        returns the sorted neighbour ids of agent i
+    degrees()
+        returns every agent's degree
+    '''
+
+    def __init__(self, num_agents: int, indptr: np.ndarray, indices: np.ndarray, spec: str = 'custom'):
+        self.num_agents = num_agents
+        self.indptr = indptr
+        self.indices = indices
+        self.spec = spec
+
+    @classmethod
+    def from_edges(cls, num_agents: int, sources, targets, spec: str = 'custom'):
+        '''
+        build a topology from edge endpoint arrays. edges are made symmetric, and self loops
+        and duplicate edges are dropped.
+        '''
+        sources = np.asarray(sources, dtype=np.int64)
+        targets = np.asarray(targets, dtype=np.int64)
+        keep = sources != targets
+        rows = np.concatenate([sources[keep], targets[keep]])
+        cols = np.concatenate([targets[keep], sources[keep]])
+        keys = np.unique(rows * num_agents + cols) # sorts by row, then column, and drops duplicates
+        rows, cols = keys // num_agents, keys % num_agents
+        indptr = np.zeros(num_agents + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows, minlength=num_agents), out=indptr[1:])
+        return cls(num_agents, indptr, cols.astype(np.int32), spec)
+
+    def neighbors(self, i: int) -> np.ndarray:
+        return self.indices[self.indptr[i]:self.indptr[i + 1]]
+
+    def degrees(self) -> np.ndarray:
+        return np.diff(self.indptr)
+
+    @property
+    def num_edges(self) -> int:
+        return len(self.indices) // 2
+
+
+def random_regular(num_agents: int, degree: int, rng: np.random.Generator) -> Topology:
+    '''
+    union of degree // 2 random Hamiltonian cycles. every agent gets degree `degree` (rounded down
+    to an even number), minus the rare duplicate edges
+    '''
+    sources, targets = [], []
+    for _ in range(max(degree // 2, 1)):
+        cycle = rng.permutation(num_agents)
+        sources.append(cycle)
+        targets.append(np.roll(cycle, -1))
+    return Topology.from_edges(num_agents, np.concatenate(sources), np.concatenate(targets), f'regular:{degree}')
+
+
+def small_world(num_agents: int, degree: int, rewire_prob: float, rng: np.random.Generator) -> Topology:
+    '''
+    Watts-Strogatz graph: a ring where every agent is linked to its degree // 2 nearest
+    neighbours on each side, and each link's far end is rewired to a random agent with
+    probability rewire_prob
+    '''
+    agents = np.arange(num_agents)
+    sources = np.repeat(agents, max(degree // 2, 1))
+    offsets = np.tile(np.arange(1, max(degree // 2, 1) + 1), num_agents)
+    targets = (sources + offsets) % num_agents
+    rewire = rng.random(len(targets)) < rewire_prob
+    targets[rewire] = rng.integers(0, num_agents, np.count_nonzero(rewire))
+    return Topology.from_edges(num_agents, sources, targets, f'small_world:{degree}:{rewire_prob}')
+
+
+def scale_free(num_agents: int, edges_per_agent: int, rng: np.random.Generator) -> Topology:
+    '''
+    Barabasi-Albert graph: agents join one at a time and link to edges_per_agent existing agents,
+    chosen in proportion to their current degree
+    '''
+    m = edges_per_agent
+    # start from a clique of m + 1 agents
+    seed_agents = np.arange(m + 1)
+    seed_sources, seed_targets = np.triu_indices(m + 1, k=1)
+    endpoints = np.empty(2 * (len(seed_sources) + m * (num_agents - m - 1)), dtype=np.int64)
+    endpoints[:2 * len(seed_sources)] = np.concatenate([seed_agents[seed_sources], seed_agents[seed_targets]])
+    num_endpoints = 2 * len(seed_sources)
+    sources = np.empty(m * (num_agents - m - 1), dtype=np.int64)
+    targets = np.empty_like(sources)
+    position = 0
+    for agent in range(m + 1, num_agents):
+        # sampling an endpoint uniformly is sampling an agent in proportion to its degree
+        chosen = set()
+        while len(chosen) < m:
+            chosen.add(int(endpoints[int(rng.random() * num_endpoints)]))
+        for target in chosen:
+            sources[position] = agent
+            targets[position] = target
+            endpoints[num_endpoints] = agent
+            endpoints[num_endpoints + 1] = target
+            num_endpoints += 2
+            position += 1
+    return Topology.from_edges(num_agents,
+                               np.concatenate([seed_sources, sources]),
+                               np.concatenate([seed_targets, targets]),
+                               f'scale_free:{edges_per_agent}')
+
+
+def make_topology(spec: str, num_agents: int, rng: np.random.Generator) -> Topology:
+    '''
+    build a topology from its spec string
+    args:
+        spec: 'regular:<degree>', 'small_world:<degree>:<rewire_prob>' or 'scale_free:<edges_per_agent>'
+        num_agents: number of agents
+        rng: random generator the graph is drawn from
+    '''
+    kind, *args = spec.split(':')
+    if kind == 'regular':
+        return random_regular(num_agents, int(args[0]), rng)
+    if kind == 'small_world':
+        return small_world(num_agents, int(args[0]), float(args[1]), rng)
+    if kind == 'scale_free':
+        return scale_free(num_agents, int(args[0]), rng)
+    raise ValueError(f'unknown topology: {spec}')
@@ -0,0 +1,838 @@
+'''
+This Python library stores every agent's reliability opinions in one
+contiguous N x N NumPy matrix. Row i holds agent i's opinions of every other
+agent; the diagonal is unused and is never touched by updates.
+
+For large populations, SparseTrustMatrix only stores opinions along the edges
+of a contact graph (see topology.py), in CSR layout, so memory and the cost of
+an update scale with an agent's degree rather than with N.
+
+LazyTrustMatrix defers indirect updates: blends are recorded per row and only
+applied when the whole row is needed, while single opinions are computed on
+demand for acceptance decisions.
+
+Opinions are stored as float64 by default. Dense and sparse stores can also hold
+them as float32 or float16, or as uint16 or uint8 fixed-point codes with unbiased
+stochastic rounding (FixedPointCodec), which cuts their memory by 2x to 8x.
+'''
+
+from collections.abc import MutableMapping
+import math
+import numpy as np
+
+
+PRECISIONS = ('float64', 'float32', 'float16', 'uint16', 'uint8')
+
+
+class FixedPointCodec:
+    '''
+    Stores opinions in [0, 1] as unsigned integer codes, opinion = code / scale.
+    Encoding rounds up with probability equal to the fractional part, so a rounded
+    opinion equals the exact one on average and small EMA steps are not lost.
+
+    Attributes
+    ----------
+    dtype : np.dtype
+        uint8 or uint16
+    scale : int
+        code of opinion 1. it is even, so the common prior of 0.5 is exact
+    rng : np.random.Generator
+        generator of the rounding draws
+    '''
+
+    def __init__(self, dtype, rng: np.random.Generator):
+        self.dtype = np.dtype(dtype)
+        self.scale = int(np.iinfo(self.dtype).max) - 1
+        self.rng = rng
+
+    def encode(self, opinions) -> np.ndarray:
+        scaled = np.asarray(opinions, dtype=np.float64) * self.scale
+        codes = np.floor(scaled + self.rng.random(scaled.shape))
+        return np.clip(codes, 0, self.scale).astype(self.dtype)
+
+    def encode_one(self, opinion: float) -> int:
+        return min(max(math.floor(opinion * self.scale + self.rng.random()), 0), self.scale)
+
+    def decode(self, codes) -> np.ndarray:
+        return codes / self.scale
+
+
+class RegisterView(MutableMapping):
+    '''
+    Dict-like view over one agent's row of opinions. Keys are the ids of the
+    other agents (the owner's own id is excluded), values are opinions.
+
+    Attributes
+    ----------
+    row : np.ndarray
+        1-D array of opinions, indexed by agent id
+    owner : int
+        id of the agent that holds these opinions
+    '''
+
+    def __init__(self, row: np.ndarray, owner: int):
+        self.row = row
+        self.owner = owner
+
+    def __getitem__(self, agent_id):
+        if agent_id == self.owner:
+            raise KeyError(agent_id)
+        return float(self.row[agent_id])
+
+    def __setitem__(self, agent_id, opinion):
+        if agent_id == self.owner:
+            raise KeyError(agent_id)
+        self.row[agent_id] = opinion
+
+    def __delitem__(self, agent_id):
+        raise TypeError('opinion registers have a fixed set of keys')
+
+    def __iter__(self):
+        for agent_id in range(len(self.row)):
+            if agent_id != self.owner:
+                yield agent_id
+
+    def __len__(self):
+        return len(self.row) - 1
+
+    def __contains__(self, agent_id):
+        return agent_id != self.owner and 0 <= agent_id < len(self.row)
+
+    def __repr__(self):
+        return f'RegisterView(owner={self.owner}, n={len(self)})'
+
+    def fill(self, opinion: float):
+        '''
+        set every opinion in this row to the same value
+        '''
+        self.row[:] = opinion
+
+    def positions(self, agent_ids: np.ndarray) -> np.ndarray:
+        '''
+        returns the indices into row of the opinions of agent_ids
+        '''
+        return agent_ids
+
+    def values(self, positions: np.ndarray) -> np.ndarray:
+        '''
+        returns the opinions at the given indices into row, as float64
+        '''
+        return self.row[positions].astype(np.float64, copy=False)
+
+    def assign(self, positions: np.ndarray, opinions: np.ndarray):
+        '''
+        set the opinions at the given indices into row
+        '''
+        self.row[positions] = opinions
+
+    def snapshot(self) -> 'RegisterView':
+        '''
+        returns a detached copy of these opinions, e.g. to send them as delayed gossip
+        '''
+        return RegisterView(self.row.copy(), self.owner)
+
+    def values_array(self, source):
+        '''
+        returns the opinions held in source (a RegisterView or any mapping of
+        agent id to opinion) as a dense array aligned with this row
+        '''
+        if isinstance(source, RegisterView):
+            return source.row
+        dense = self.row.copy()
+        for agent_id, opinion in source.items():
+            dense[agent_id] = opinion
+        return dense
+
+    def blend(self, source, alpha: float, exclude: int):
+        '''
+        indirect opinion update: blend the source agent's opinions into this row
+        as row = (1 - alpha) * row + alpha * source, for every agent except the
+        owner and the excluded agent (normally the source agent itself).
+        args:
+            source: registers of the agent whose opinions are being adopted
+            alpha: decay constant for second-hand opinions
+            exclude: agent id whose opinion is left untouched
+        returns:
+            number of opinions updated
+        '''
+        row = self.row
+        source_row = self.values_array(source)
+        own, excluded = row[self.owner], row[exclude]
+        np.multiply(row, 1 - alpha, out=row)
+        row += alpha * source_row
+        row[self.owner] = own
+        row[exclude] = excluded
+        return len(row) - 1 - (exclude != self.owner)
+
+
+class TrustMatrix:
+    '''
+    N x N opinion store shared by all agents of a game.
+
+    Attributes
+    ----------
+    num_agents : int
+        number of agents (rows and columns)
+    opinions : np.ndarray
+        (num_agents, num_agents) array, opinions[i, j] is agent i's opinion of agent j
+    codec : FixedPointCodec
+        encoding of opinions stored as fixed-point codes, or None for a float dtype
+
+    Methods
+    -------
+    registers(i)
+        returns a RegisterView over row i
+    direct_update(i, j, success, alpha)
+        first-hand update of agent i's opinion of agent j
+    indirect_update(i, j, alpha)
+        blend agent j's row into agent i's row, skipping columns i and j
+    '''
+
+    def __init__(self, num_agents: int, initial_opinion: float = 0.5, dtype=np.float64, codec: FixedPointCodec = None):
+        self.num_agents = num_agents
+        self.codec = codec
+        if codec is not None:
+            dtype, initial_opinion = codec.dtype, round(initial_opinion * codec.scale)
+        self.opinions = np.full((num_agents, num_agents), initial_opinion, dtype=dtype)
+
+    def registers(self, i: int) -> RegisterView:
+        if self.codec is not None:
+            return QuantizedRegisterView(self.opinions[i], i, self.codec)
+        return RegisterView(self.opinions[i], i)
+
+    def get_opinion(self, i: int, j: int) -> float:
+        if self.codec is not None:
+            return float(self.opinions[i, j]) / self.codec.scale
+        return float(self.opinions[i, j])
+
+    def get_opinions(self, rows: np.ndarray, cols: np.ndarray) -> np.ndarray:
+        '''
+        returns the opinions of agents rows[k] about agents cols[k] as float64, the values get_opinion returns one at a time
+        '''
+        return np.asarray(self.decoded(self.opinions[rows, cols]), dtype=np.float64)
+
+    def direct_update(self, i: int, j: int, success: bool, alpha: float):
+        if self.codec is not None:
+            registers = self.registers(i)
+            registers[j] = (1 - alpha) * registers[j] + alpha * success
+        else:
+            self.opinions[i, j] = (1 - alpha) * self.opinions[i, j] + alpha * success
+
+    def indirect_update(self, i: int, j: int, alpha: float):
+        self.registers(i).blend(self.registers(j), alpha, exclude=j)
+
+    def off_diagonal(self) -> np.ndarray:
+        '''
+        returns a flat copy of every opinion, excluding the unused diagonal
+        '''
+        mask = ~np.eye(self.num_agents, dtype=bool)
+        return self.decoded(self.opinions[mask])
+
+    def decoded(self, opinions: np.ndarray) -> np.ndarray:
+        '''
+        returns stored opinions as opinion values: decodes fixed-point codes, leaves floats as they are
+        '''
+        return self.codec.decode(opinions) if self.codec is not None else opinions
+
+    @property
+    def nbytes(self) -> int:
+        '''
+        memory held by the stored opinions
+        '''
+        return self.opinions.nbytes
+
+    def get_state(self) -> np.ndarray:
+        '''
+        returns a copy of every opinion, for checkpoints
+        '''
+        return self.opinions.copy()
+
+    def set_state(self, opinions: np.ndarray):
+        # copy in place: agents' registers are views over the existing array
+        self.opinions[...] = opinions
+
+    @property
+    def num_opinions(self) -> int:
+        return self.num_agents * (self.num_agents - 1)
+
+    def row_sizes(self) -> np.ndarray:
+        '''
+        returns the number of opinions each agent holds
+        '''
+        return np.full(self.num_agents, self.num_agents - 1)
+
+    def row_errors(self, reliabilities) -> np.ndarray:
+        '''
+        returns, for every agent, the summed absolute error of its opinions versus the true reliabilities
+        '''
+        errors = np.abs(self.decoded(self.opinions) - np.asarray(reliabilities)[None, :])
+        np.fill_diagonal(errors, 0)
+        return errors.sum(axis=1)
+
+    def row_error(self, i: int, reliabilities: np.ndarray) -> float:
+        errors = np.abs(self.decoded(self.opinions[i]) - reliabilities)
+        errors[i] = 0
+        return float(errors.sum())
+
+    def opinion_error(self, reliabilities) -> float:
+        '''
+        mean absolute error of all opinions versus the true reliability of the agent they are about
+        '''
+        errors = np.abs(self.decoded(self.opinions) - np.asarray(reliabilities)[None, :])
+        np.fill_diagonal(errors, 0)
+        return errors.sum() / (self.num_agents * (self.num_agents - 1))
+
+
+class SparseRegisterView(MutableMapping):
+    '''
+    Dict-like view over one agent's opinions of its neighbours in a contact graph.
+    Keys are the neighbours' ids, values are opinions.
+
+    Attributes
+    ----------
+    row : np.ndarray
+        opinions of the neighbours, aligned with keys
+    keys : np.ndarray
+        sorted ids of the neighbours
+    owner : int
+        id of the agent that holds these opinions
+    '''
+
+    def __init__(self, row: np.ndarray, keys: np.ndarray, owner: int):
+        self.row = row
+        self.keys = keys
+        self.owner = owner
+
+    def position(self, agent_id) -> int:
+        pos = int(np.searchsorted(self.keys, agent_id))
+        if pos == len(self.keys) or self.keys[pos] != agent_id:
+            raise KeyError(agent_id)
+        return pos
+
+    def __getitem__(self, agent_id):
+        return float(self.row[self.position(agent_id)])
+
+    def __setitem__(self, agent_id, opinion):
+        self.row[self.position(agent_id)] = opinion
+
+    def __delitem__(self, agent_id):
+        raise TypeError('opinion registers have a fixed set of keys')
+
+    def __iter__(self):
+        return iter(self.keys.tolist())
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __contains__(self, agent_id):
+        try:
+            self.position(agent_id)
+        except KeyError:
+            return False
+        return True
+
+    def __repr__(self):
+        return f'SparseRegisterView(owner={self.owner}, degree={len(self)})'
+
+    def fill(self, opinion: float):
+        self.row[:] = opinion
+
+    def positions(self, agent_ids: np.ndarray) -> np.ndarray:
+        '''
+        returns the indices into row of the opinions of agent_ids, which must all be neighbours
+        '''
+        return np.searchsorted(self.keys, agent_ids)
+
+    def values(self, positions: np.ndarray) -> np.ndarray:
+        return self.row[positions].astype(np.float64, copy=False)
+
+    def assign(self, positions: np.ndarray, opinions: np.ndarray):
+        self.row[positions] = opinions
+
+    def snapshot(self) -> 'SparseRegisterView':
+        return SparseRegisterView(self.row.copy(), self.keys, self.owner)
+
+    def blend(self, source, alpha: float, exclude: int):
+        '''
+        indirect opinion update restricted to the graph: blend the source agent's opinions
+        into this row, for every agent that both the owner and the source agent are linked to,
+        except the excluded agent (normally the source agent itself).
+        args:
+            source: registers of the agent whose opinions are being adopted
+            alpha: decay constant for second-hand opinions
+            exclude: agent id whose opinion is left untouched
+        returns:
+            number of opinions updated
+        '''
+        if isinstance(source, SparseRegisterView):
+            source_keys, source_row = source.keys, source.row
+        else:
+            source_keys = np.array(sorted(source), dtype=self.keys.dtype)
+            source_row = np.array([source[agent_id] for agent_id in source_keys.tolist()], dtype=self.row.dtype)
+        # the owner is never one of its own neighbours, so only the excluded agent needs to be dropped
+        common, ours, theirs = np.intersect1d(self.keys, source_keys, assume_unique=True, return_indices=True)
+        keep = common != exclude
+        ours, theirs = ours[keep], theirs[keep]
+        self.row[ours] = (1 - alpha) * self.row[ours] + alpha * source_row[theirs]
+        return len(ours)
+
+
+class QuantizedRows:
+    '''
+    Mixin for register views whose row holds fixed-point codes: reads decode the
+    codes and writes encode the new opinions with stochastic rounding.
+    '''
+
+    def __getitem__(self, agent_id):
+        return super().__getitem__(agent_id) / self.codec.scale
+
+    def __setitem__(self, agent_id, opinion):
+        super().__setitem__(agent_id, self.codec.encode_one(opinion))
+
+    def fill(self, opinion: float):
+        self.row[:] = self.codec.encode(np.full(len(self.row), opinion))
+
+    def values(self, positions: np.ndarray) -> np.ndarray:
+        return self.codec.decode(self.row[positions])
+
+    def assign(self, positions: np.ndarray, opinions: np.ndarray):
+        self.row[positions] = self.codec.encode(opinions)
+
+    def snapshot(self):
+        return self.float_view()
+
+    def blend(self, source, alpha: float, exclude: int):
+        '''
+        blend in float64 (see RegisterView.blend and SparseRegisterView.blend), then re-encode the opinions that changed
+        '''
+        if isinstance(source, QuantizedRows):
+            source = source.float_view()
+        decoded = self.float_view()
+        before = decoded.row.copy()
+        touched = decoded.blend(source, alpha, exclude)
+        changed = np.flatnonzero(decoded.row != before)
+        self.row[changed] = self.codec.encode(decoded.row[changed])
+        return touched
+
+
+class QuantizedRegisterView(QuantizedRows, RegisterView):
+    '''
+    RegisterView over a row of fixed-point codes, see FixedPointCodec.
+
+    Attributes
+    ----------
+    codec : FixedPointCodec
+        encoding of the row's opinions
+    '''
+
+    def __init__(self, row: np.ndarray, owner: int, codec: FixedPointCodec):
+        super().__init__(row, owner)
+        self.codec = codec
+
+    def float_view(self) -> RegisterView:
+        '''
+        returns a detached, decoded float64 copy of these opinions
+        '''
+        return RegisterView(self.codec.decode(self.row), self.owner)
+
+
+class QuantizedSparseRegisterView(QuantizedRows, SparseRegisterView):
+    '''
+    SparseRegisterView over fixed-point codes, see FixedPointCodec.
+
+    Attributes
+    ----------
+    codec : FixedPointCodec
+        encoding of the row's opinions
+    '''
+
+    def __init__(self, row: np.ndarray, keys: np.ndarray, owner: int, codec: FixedPointCodec):
+        super().__init__(row, keys, owner)
+        self.codec = codec
+
+    def float_view(self) -> SparseRegisterView:
+        return SparseRegisterView(self.codec.decode(self.row), self.keys, self.owner)
+
+
+class SparseTrustMatrix:
+    '''
+    Opinion store that only holds opinions along the edges of a contact graph. The
+    opinions of all agents are one flat array aligned with the graph's CSR indices.
+
+    Attributes
+    ----------
+    topology : topology.Topology
+        contact graph; agent i holds opinions of topology.neighbors(i) only
+    data : np.ndarray
+        data[k] is the opinion of agent i about agent topology.indices[k], for
+        topology.indptr[i] <= k < topology.indptr[i + 1]
+    codec : FixedPointCodec
+        encoding of opinions stored as fixed-point codes, or None for a float dtype
+
+    Methods
+    -------
+    registers(i)
+        returns a SparseRegisterView over agent i's neighbours
+    direct_update(i, j, success, alpha)
+        first-hand update of agent i's opinion of neighbour j
+    indirect_update(i, j, alpha)
+        blend neighbour j's opinions into agent i's, over their common neighbours
+    '''
+
+    def __init__(self, topology, initial_opinion: float = 0.5, dtype=np.float64, codec: FixedPointCodec = None):
+        self.topology = topology
+        self.num_agents = topology.num_agents
+        self.codec = codec
+        if codec is not None:
+            dtype, initial_opinion = codec.dtype, round(initial_opinion * codec.scale)
+        self.data = np.full(len(topology.indices), initial_opinion, dtype=dtype)
+        self.edge_keys = None # built by the first get_opinions
+
+    def registers(self, i: int) -> SparseRegisterView:
+        start, stop = self.topology.indptr[i], self.topology.indptr[i + 1]
+        if self.codec is not None:
+            return QuantizedSparseRegisterView(self.data[start:stop], self.topology.indices[start:stop], i, self.codec)
+        return SparseRegisterView(self.data[start:stop], self.topology.indices[start:stop], i)
+
+    def get_opinion(self, i: int, j: int) -> float:
+        return self.registers(i)[j]
+
+    def get_opinions(self, rows: np.ndarray, cols: np.ndarray) -> np.ndarray:
+        '''
+        returns the opinions of agents rows[k] about their neighbours cols[k] as float64
+        '''
+        if self.edge_keys is None:
+            # (row, column) of every stored opinion as one sorted key, row * num_agents + column
+            self.edge_keys = np.repeat(np.arange(self.num_agents), self.topology.degrees()) * self.num_agents + self.topology.indices
+        positions = np.searchsorted(self.edge_keys, np.asarray(rows) * self.num_agents + np.asarray(cols))
+        return np.asarray(self.decoded(self.data[positions]), dtype=np.float64)
+
+    def direct_update(self, i: int, j: int, success: bool, alpha: float):
+        registers = self.registers(i)
+        registers[j] = (1 - alpha) * registers[j] + alpha * success
+
+    def indirect_update(self, i: int, j: int, alpha: float):
+        self.registers(i).blend(self.registers(j), alpha, exclude=j)
+
+    def off_diagonal(self) -> np.ndarray:
+        '''
+        returns a flat copy of every stored opinion
+        '''
+        return self.decoded(self.data).copy()
+
+    def decoded(self, opinions: np.ndarray) -> np.ndarray:
+        return self.codec.decode(opinions) if self.codec is not None else opinions
+
+    @property
+    def nbytes(self) -> int:
+        return self.data.nbytes
+
+    def get_state(self) -> np.ndarray:
+        return self.data.copy()
+
+    def set_state(self, data: np.ndarray):
+        self.data[...] = data
+
+    @property
+    def num_opinions(self) -> int:
+        return len(self.data)
+
+    def row_sizes(self) -> np.ndarray:
+        return self.topology.degrees()
+
+    def row_errors(self, reliabilities) -> np.ndarray:
+        errors = np.abs(self.decoded(self.data) - np.asarray(reliabilities)[self.topology.indices])
+        rows = np.repeat(np.arange(self.num_agents), self.topology.degrees())
+        return np.bincount(rows, weights=errors, minlength=self.num_agents)
+
+    def row_error(self, i: int, reliabilities: np.ndarray) -> float:
+        registers = self.registers(i)
+        return float(np.abs(self.decoded(registers.row) - reliabilities[registers.keys]).sum())
+
+    def opinion_error(self, reliabilities) -> float:
+        '''
+        mean absolute error of all stored opinions versus the true reliability of the agent they are about
+        '''
+        if len(self.data) == 0:
+            return 0.0
+        return float(np.abs(self.decoded(self.data) - np.asarray(reliabilities)[self.topology.indices]).mean())
+
+
+
+class LazyRegisterView(RegisterView):
+    '''
+    Dict-like view over one agent's row of a LazyTrustMatrix. Reading an opinion
+    materializes only that opinion; blending records a pending operation.
+
+    Attributes
+    ----------
+    matrix : LazyTrustMatrix
+        store the row belongs to
+    owner : int
+        id of the agent that holds these opinions
+    '''
+
+    def __init__(self, matrix: 'LazyTrustMatrix', owner: int):
+        self.matrix = matrix
+        self.owner = owner
+
+    @property
+    def row(self) -> np.ndarray:
+        # whole-row access (e.g. the vectorized attempts engine) materializes the row, and the caller may write to it
+        return self.matrix.writable_row(self.owner)
+
+    def __getitem__(self, agent_id):
+        if agent_id == self.owner:
+            raise KeyError(agent_id)
+        return self.matrix.get_opinion(self.owner, agent_id)
+
+    def __setitem__(self, agent_id, opinion):
+        if agent_id == self.owner:
+            raise KeyError(agent_id)
+        self.matrix.set_opinion(self.owner, agent_id, opinion)
+
+    def __iter__(self):
+        for agent_id in range(self.matrix.num_agents):
+            if agent_id != self.owner:
+                yield agent_id
+
+    def __len__(self):
+        return self.matrix.num_agents - 1
+
+    def __contains__(self, agent_id):
+        return agent_id != self.owner and 0 <= agent_id < self.matrix.num_agents
+
+    def __repr__(self):
+        return f'LazyRegisterView(owner={self.owner}, n={len(self)})'
+
+    def fill(self, opinion: float):
+        self.writable_row()[:] = opinion
+
+    def writable_row(self) -> np.ndarray:
+        return self.matrix.writable_row(self.owner)
+
+    def values(self, positions: np.ndarray) -> np.ndarray:
+        return self.matrix.materialized_row(self.owner)[positions]
+
+    def assign(self, positions: np.ndarray, opinions: np.ndarray):
+        self.writable_row()[positions] = opinions
+
+    def snapshot(self) -> RegisterView:
+        return RegisterView(self.matrix.materialized_row(self.owner).copy(), self.owner)
+
+    def blend(self, source, alpha: float, exclude: int):
+        '''
+        record an indirect opinion update, see RegisterView.blend
+        returns:
+            number of opinions the update will change
+        '''
+        return self.matrix.add_blend(self.owner, source, alpha, exclude)
+
+
+class LazyTrustMatrix(TrustMatrix):
+    '''
+    N x N opinion store that propagates indirect updates lazily. A blend into row i
+    is recorded as a pending (source agent, alpha) operation and is only applied
+    when row i is read as a whole; single opinions, as needed for acceptance
+    decisions, are computed from the pending operations on demand.
+
+    A pending operation reads its source's current opinions, so a row that is
+    about to change first flushes the rows whose operations read it, and the
+    source of a new operation is flushed when it is recorded. When a row is
+    flushed, its pending blends are folded into one pass:
+    row = decay * row + weights @ sources. Results match eager propagation up to
+    floating-point rounding.
+
+    Attributes
+    ----------
+    base : np.ndarray
+        (num_agents, num_agents) opinions before the pending operations
+    pending : list
+        per row, list of (source, alpha, exclude, values) operations. values holds the source's
+        opinions for sources outside the matrix, e.g. delayed gossip, and is None otherwise
+    overrides : list
+        per row, dict mapping column to (opinion, number of pending operations it already includes),
+        for direct updates made while operations were pending
+    readers : list
+        per row, set of rows with pending operations that read it
+    max_pending : int
+        a row with this many pending operations is flushed
+
+    Methods
+    -------
+    flush(i)
+        apply row i's pending operations
+    flush_all()
+        apply every pending operation
+    '''
+
+    def __init__(self, num_agents: int, initial_opinion: float = 0.5, dtype=np.float64, max_pending: int = 4):
+        super().__init__(num_agents, initial_opinion, dtype)
+        self.max_pending = max_pending
+        self.pending = [[] for _ in range(num_agents)]
+        self.overrides = [{} for _ in range(num_agents)]
+        self.readers = [set() for _ in range(num_agents)]
+
+    @property
+    def opinions(self) -> np.ndarray:
+        self.flush_all()
+        return self.base
+
+    @opinions.setter
+    def opinions(self, opinions: np.ndarray):
+        self.base = opinions
+
+    def registers(self, i: int) -> LazyRegisterView:
+        return LazyRegisterView(self, i)
+
+    def get_opinion(self, i: int, j: int) -> float:
+        if not self.pending[i]:
+            return float(self.base[i, j])
+        value, start = self.overrides[i].get(j, (None, 0))
+        if value is None:
+            value = float(self.base[i, j])
+        pending = self.pending[i]
+        for k in range(start, len(pending)):
+            source, alpha, exclude, values = pending[k]
+            if j != exclude:
+                # sources never have pending operations of their own, see changing
+                value = (1 - alpha) * value + alpha * float(self.base[source, j] if values is None else values[j])
+        return value
+
+    def get_opinions(self, rows: np.ndarray, cols: np.ndarray) -> np.ndarray:
+        '''
+        returns the opinions of agents rows[k] about agents cols[k], read from base where a row has nothing pending
+        '''
+        opinions = self.base[rows, cols].astype(np.float64)
+        pending = self.pending
+        for k, (i, j) in enumerate(zip(np.asarray(rows).tolist(), np.asarray(cols).tolist())):
+            if pending[i]:
+                opinions[k] = self.get_opinion(i, j)
+        return opinions
+
+    def changing(self, i: int):
+        '''
+        row i is about to change: apply the pending operations that read it first
+        '''
+        for reader in list(self.readers[i]):
+            self.flush(reader)
+
+    def set_opinion(self, i: int, j: int, opinion: float):
+        self.changing(i)
+        if self.pending[i]:
+            self.overrides[i][j] = (opinion, len(self.pending[i]))
+        else:
+            self.base[i, j] = opinion
+
+    def direct_update(self, i: int, j: int, success: bool, alpha: float):
+        self.set_opinion(i, j, (1 - alpha) * self.get_opinion(i, j) + alpha * success)
+
+    def add_blend(self, i: int, source, alpha: float, exclude: int) -> int:
+        '''
+        record the blend of the source registers into row i, see RegisterView.blend
+        '''
+        self.changing(i)
+        if isinstance(source, LazyRegisterView) and source.matrix is self:
+            s = source.owner
+            self.flush(s)
+            self.readers[s].add(i)
+            operation = (s, alpha, exclude, None)
+        else:
+            # e.g. delayed gossip: keep the source's opinions themselves
+            if isinstance(source, RegisterView):
+                values = source.row.copy()
+            else:
+                values = RegisterView(self.materialized_row(i).copy(), i).values_array(source)
+            operation = (-1, alpha, exclude, values)
+        self.pending[i].append(operation)
+        if len(self.pending[i]) >= self.max_pending:
+            self.flush(i)
+        return self.num_agents - 1 - (exclude != i)
+
+    def flush(self, i: int):
+        '''
+        apply row i's pending operations, folded into a single pass over the row
+        '''
+        pending = self.pending[i]
+        if not pending:
+            return
+        # excluded columns and direct-update overrides do not follow the folded weights: compute them one by one
+        columns = {exclude for _, _, exclude, _ in pending if exclude != i} | set(self.overrides[i])
+        exact = {j: self.get_opinion(i, j) for j in columns}
+        alphas = np.array([alpha for _, alpha, _, _ in pending])
+        # keep[k]: product of (1 - alpha) over operations k, k + 1, ...
+        keep = np.cumprod((1 - alphas)[::-1])[::-1]
+        weights = alphas * np.append(keep[1:], 1.0)
+        sources = np.stack([self.base[source] if values is None else values for source, _, _, values in pending])
+        row = self.base[i]
+        own = row[i]
+        row *= keep[0]
+        row += weights @ sources
+        row[i] = own
+        for j, opinion in exact.items():
+            row[j] = opinion
+        for source, _, _, _ in pending:
+            if source >= 0:
+                self.readers[source].discard(i)
+        pending.clear()
+        self.overrides[i].clear()
+
+    def flush_all(self):
+        for i in range(self.num_agents):
+            self.flush(i)
+
+    def materialized_row(self, i: int) -> np.ndarray:
+        '''
+        returns row i with its pending operations applied. the row must not be modified
+        '''
+        self.flush(i)
+        return self.base[i]
+
+    def writable_row(self, i: int) -> np.ndarray:
+        '''
+        returns row i with its pending operations applied, for the caller to modify in place
+        '''
+        self.flush(i)
+        self.changing(i)
+        return self.base[i]
+
+    def row_error(self, i: int, reliabilities: np.ndarray) -> float:
+        errors = np.abs(self.materialized_row(i) - reliabilities)
+        errors[i] = 0
+        return float(errors.sum())
+
+
+PROPAGATION_MODES = ('eager', 'lazy')
+
+
+def make_trust_store(num_agents: int, topology=None, propagation: str = 'eager', precision: str = 'float64',
+                     rng: np.random.Generator = None):
+    '''
+    build the opinion store of a game
+    args:
+        num_agents: number of agents
+        topology: contact graph (see topology.py), or None for all-to-all opinions
+        propagation: 'eager' applies indirect updates at once, 'lazy' defers them until the opinions are read
+        precision: storage of the opinions, one of PRECISIONS. 'uint16' and 'uint8' are fixed-point codes
+        rng: generator of the stochastic rounding of fixed-point precisions
+    '''
+    if propagation not in PROPAGATION_MODES:
+        raise ValueError(f'unknown propagation mode: {propagation}, expected one of {PROPAGATION_MODES}')
+    if precision not in PRECISIONS:
+        raise ValueError(f'unknown precision: {precision}, expected one of {PRECISIONS}')
+    dtype, codec = np.float64, None
+    if precision.startswith('uint'):
+        if rng is None:
+            raise ValueError(f'{precision} opinions need a random generator for stochastic rounding')
+        codec = FixedPointCodec(precision, rng)
+    else:
+        dtype = np.dtype(precision)
+    if topology is not None:
+        if propagation == 'lazy':
+            raise ValueError('lazy propagation is only supported without a topology')
+        return SparseTrustMatrix(topology, dtype=dtype, codec=codec)
+    if propagation == 'lazy':
+        if precision != 'float64':
+            raise ValueError(f"lazy propagation only supports float64 opinions, got {precision}")
+        return LazyTrustMatrix(num_agents)
+    return TrustMatrix(num_agents, dtype=dtype, codec=codec)
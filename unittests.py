@@ -1,7 +1,34 @@
+import json
+import os
+import socket
+import tempfile
+import threading
+import time
 import unittest
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import Pipe
 import numpy as np
+import pandas as pd
 from agent import LearnTrustAgent
 from config import TestConfig as Config
+from trust_matrix import TrustMatrix, SparseTrustMatrix, LazyTrustMatrix, RegisterView, FixedPointCodec, make_trust_store, PRECISIONS
+from recorder import EncounterRecorder
+from log_sinks import NullSink, TextSink, SampledSink
+from batch import BatchGame, spawn_seeds
+from descriptions import record_game_description, export_game_descriptions
+import simulation
+import event_simulation
+import simulation_failures
+import checkpoint
+import benchmark
+from concurrency import conflict_free_waves
+import distributed
+import strategies
+import sweep
+from runfile import load_table, convert_csv
+from sampling import AliasTable, LocalPairs, WeightedPairs, UniformPairs, GraphPairs
+from topology import Topology, make_topology
+from convergence import ConvergenceMonitor, make_monitor
 
 num_agents = Config.num_agents
 num_encounters = Config.num_encounters
@@ -84,5 +111,817 @@ class TestAgentClass(unittest.TestCase):
             self.assertEqual(accepted, predicted_expected_payoff >= active_agent.payoff_threshold)
 
 
+class TestTrustMatrix(unittest.TestCase):
+    '''
+    Test that agents backed by a shared TrustMatrix update opinions exactly like
+    the original per-agent register dicts
+    '''
+
+    def test_matches_dict_registers(self):
+        n = 30
+        alpha_direct, alpha_indirect = 0.1, 0.2
+        rng = np.random.default_rng(0)
+        trust = TrustMatrix(n)
+        agents = [LearnTrustAgent(i, rng.uniform(0, 1), alpha_direct, alpha_indirect, 0.5, -0.5,
+                                  registers=trust.registers(i)) for i in range(n)]
+        # reference implementation: plain dicts updated element by element
+        reference = [{j: 0.5 for j in range(n) if j != i} for i in range(n)]
+
+        for _ in range(500):
+            active_id, passive_id = rng.choice(n, size=2, replace=False)
+            state = np.random.get_state()
+            accepted, success = agents[active_id].handle_encounter(
+                passive_id, agents[passive_id].get_reliability(), agents[passive_id].get_registers(),
+                Config.p_g, Config.p_b)
+            np.random.set_state(state)
+            sample = np.random.random()
+            if accepted:
+                ref = reference[active_id]
+                self.assertEqual(success, sample < agents[passive_id].get_reliability())
+                ref[passive_id] = (1 - alpha_direct) * ref[passive_id] + alpha_direct * success
+                if success:
+                    for j, opinion in reference[passive_id].items():
+                        if j != active_id:
+                            ref[j] = (1 - alpha_indirect) * ref[j] + alpha_indirect * opinion
+
+        for i in range(n):
+            self.assertEqual(dict(agents[i].get_registers()), reference[i])
+        # the unused diagonal is never written
+        self.assertTrue(np.all(np.diag(trust.opinions) == 0.5))
+
+
+class TestEncounterRecorder(unittest.TestCase):
+    '''
+    Test the columnar EncounterRecorder: geometric growth, iteration, and payoff aggregation
+    '''
+
+    def test_payoffs(self):
+        rng = np.random.default_rng(1)
+        recorder = EncounterRecorder(capacity=4, payout_dtype=np.int64)
+        history = []
+        total_payout = 0
+        for _ in range(1000):
+            active_id, passive_id = rng.choice(num_agents, size=2, replace=False)
+            accepted, result = bool(rng.random() < 0.8), bool(rng.random() < 0.5)
+            if accepted:
+                total_payout += Config.p_g if result else Config.p_b
+            recorder.append(active_id, passive_id, 0.5, 0.5, 0.5, accepted, result, total_payout)
+            history.append((active_id, passive_id, accepted, result))
+
+        self.assertEqual(len(recorder), 1000)
+        self.assertEqual([d['active_id'] for d in recorder], [h[0] for h in history])
+
+        expected = [0] * num_agents
+        for active_id, passive_id, accepted, result in history:
+            if accepted:
+                expected[active_id] += Config.p_g if result else Config.p_b
+                expected[passive_id] += Config.p_g if result else Config.p_b
+        payoffs = recorder.payoffs(num_agents, Config.p_g, Config.p_b)
+        self.assertEqual(payoffs.tolist(), expected)
+        self.assertEqual(payoffs.sum(), 2 * total_payout)
+
+
+class TestLogSinks(unittest.TestCase):
+    '''
+    Test that log records are only formatted when a sink consumes them
+    '''
+
+    def test_lazy_formatting(self):
+        formatted = []
+        def formatter(record):
+            formatted.append(record)
+            return f'{record}\n'
+
+        self.assertFalse(NullSink().accepts(0))
+
+        sink = SampledSink(TextSink(None, formatter, buffer_size=4), every=3)
+        for i in range(10):
+            if sink.accepts(i):
+                sink.write((i,))
+        self.assertEqual(formatted, [(0,), (3,), (6,), (9,)])
+        sink.close()
+
+
+class TestBatchGame(unittest.TestCase):
+    '''
+    Test that each replicate of a BatchGame is reproducible and plays the same game as a
+    sequential simulation driven by the same draws
+    '''
+
+    def test_replicates_match_sequential_games(self):
+        seeds = spawn_seeds(7, 4)
+        batch_game = BatchGame(seeds, num_agents=20, num_interactions=300, block_size=64)
+        trajectories = batch_game.run()
+
+        # replicate 2 run on its own, with a different block size, is unchanged
+        single = BatchGame(seeds[2:3], num_agents=20, num_interactions=300, block_size=1000)
+        self.assertTrue(np.array_equal(single.run()[0], trajectories[2]))
+
+        # replay replicate 2 one encounter at a time against a TrustMatrix
+        trust = TrustMatrix(20)
+        reliabilities = batch_game.reliabilities[2]
+        rng = np.random.default_rng(seeds[2])
+        rng.uniform(0, 1, 20)
+        total_payout = 0
+        for t in range(300):
+            u_active, u_passive, u_outcome = rng.random(3)
+            active_id, passive_id = int(u_active * 20), int(u_passive * 19)
+            passive_id += passive_id >= active_id
+            opinion = trust.get_opinion(active_id, passive_id)
+            accepted = opinion * 2 + (1 - opinion) * -2 >= -0.0005
+            success = accepted and u_outcome < reliabilities[passive_id]
+            if accepted:
+                total_payout += 2 if success else -2
+                trust.direct_update(active_id, passive_id, success, 0.1)
+                if success:
+                    trust.indirect_update(active_id, passive_id, 0.1)
+            self.assertEqual(trajectories[2, t], total_payout)
+        self.assertTrue(np.array_equal(trust.opinions, batch_game.opinions[2]))
+        self.assertEqual(batch_game.payoffs()[2].sum(), 2 * total_payout)
+
+
+def record_description(path, run_no):
+    record_game_description(path, {'run_no': run_no, 'num_agents': num_agents, 'r_dist': 'uniform'})
+
+
+class TestGameDescriptions(unittest.TestCase):
+    '''
+    Test that game descriptions written from parallel processes are all kept
+    '''
+
+    def test_parallel_writers(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'game_descriptions.csv')
+            run_nos = list(range(40))[::-1]
+            with ProcessPoolExecutor(max_workers=4) as executor:
+                list(executor.map(record_description, [path] * len(run_nos), run_nos))
+            record_description(path, 7) # rewriting a run replaces its row
+            self.assertFalse(os.path.exists(path)) # the CSV is only written on export
+            self.assertEqual(sorted(export_game_descriptions(path)['run_no']), list(range(40)))
+            self.assertEqual(sorted(pd.read_csv(path)['run_no']), list(range(40)))
+
+
+class TestSweep(unittest.TestCase):
+    '''
+    Test the parameter grid, the per-cell seeds, and that a sweep resumes from its finished cells
+    '''
+
+    def test_grid_and_seeds(self):
+        grid = {'num_agents': [10, 20], 'alpha_direct': [0.1, 0.2]}
+        cells = sweep.expand_grid(grid, num_replicates=2)
+        self.assertEqual(len(cells), 8)
+        self.assertEqual(cells[0], {'num_agents': 10, 'alpha_direct': 0.1, 'replicate': 0})
+        self.assertRaises(ValueError, sweep.expand_grid, {'seed': [1]})
+        seeds = {sweep.cell_key(cell): sweep.cell_seed(cell, 7) for cell in cells}
+        self.assertEqual(len(set(seeds.values())), 8)
+        # reordering or extending the grid keeps every existing cell's seed
+        extended = sweep.expand_grid({'alpha_direct': [0.3, 0.2, 0.1], 'num_agents': [20, 10]}, num_replicates=2)
+        for cell in extended:
+            if sweep.cell_key(cell) in seeds:
+                self.assertEqual(sweep.cell_seed(cell, 7), seeds[sweep.cell_key(cell)])
+
+    def test_resume(self):
+        grid = {'num_agents': [10, 20], 'num_interactions': [100, 200]}
+        with tempfile.TemporaryDirectory() as sweep_dir:
+            first = sweep.run_sweep(grid, sweep_dir, seed=Config.seed, max_workers=1)
+            cells_dir = os.path.join(sweep_dir, 'cells')
+            written = {name: os.stat(os.path.join(cells_dir, name)).st_mtime_ns for name in os.listdir(cells_dir)}
+            with open(os.path.join(sweep_dir, 'summary.csv')) as f:
+                summary = f.read()
+            second = sweep.run_sweep(grid, sweep_dir, seed=Config.seed, max_workers=1)
+            self.assertEqual({name: os.stat(os.path.join(cells_dir, name)).st_mtime_ns for name in os.listdir(cells_dir)}, written)
+            with open(os.path.join(sweep_dir, 'summary.csv')) as f:
+                self.assertEqual(f.read(), summary)
+            self.assertTrue(second.equals(first))
+            self.assertEqual(len(first), 4)
+            self.assertEqual(first['run_no'].tolist(), [0, 1, 2, 3])
+            # cells only write binary metric tables, no CSV encounter logs
+            logs = [name for _, _, names in os.walk(os.path.join(sweep_dir, 'logs')) for name in names]
+            self.assertFalse([name for name in logs if name.endswith('.csv')])
+
+
+class TestSeededGame(unittest.TestCase):
+    '''
+    Test that a Game is fully determined by its seed: it matches the corresponding BatchGame
+    replicate, and replay() regenerates it from game_descriptions.csv
+    '''
+
+    def test_seeded_game(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            game = simulation.Game(run_no=3, num_agents=30, r_dist='skewed', num_interactions=500, seed=11,
+                                   log_sink='null', log_dir=tmp_dir, agent_log_dir=tmp_dir)
+            game.run()
+            batch_game = BatchGame([11], num_agents=30, r_dist='skewed', num_interactions=500)
+            self.assertTrue(np.array_equal(game.encounter_history.column('total_payout'), batch_game.run()[0]))
+            self.assertTrue(np.array_equal(game.trust.opinions, batch_game.opinions[0]))
+
+            replay_dir = os.path.join(tmp_dir, 'replay')
+            replayed = simulation.replay(3, os.path.join(tmp_dir, 'game_descriptions.csv'), log_sink='null',
+                                         log_dir=replay_dir, agent_log_dir=replay_dir)
+            self.assertEqual(replayed.seed, 11)
+            self.assertTrue(replayed.df.equals(game.df))
+
+    def test_weighted_replay(self):
+        # the weights of a 'weighted' run are saved with its description, so every engine can replay it
+        weights = np.arange(1, 21) % 5
+        engines = [(simulation, {'agent_log_dir': 'agents'}), (simulation_failures, {}), (event_simulation, {'agent_log_dir': 'agents'})]
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            for module, dirs in engines:
+                log_dir = os.path.join(tmp_dir, module.__name__)
+                dirs = {name: os.path.join(log_dir, path) for name, path in dirs.items()}
+                game = module.Game(run_no=4, num_agents=20, num_interactions=300, seed=11, pairing='weighted', pairing_weights=weights,
+                                   log_sink='null', log_echo=False, log_dir=log_dir, **dirs)
+                game.run()
+                replay_dir = os.path.join(log_dir, 'replay')
+                replay_dirs = {name: replay_dir for name in dirs}
+                replayed = module.replay(4, os.path.join(log_dir, 'game_descriptions.csv'), log_sink='null', log_echo=False,
+                                         log_dir=replay_dir, **replay_dirs)
+                self.assertTrue(np.array_equal(replayed.encounter_history.to_columns()['passive_id'],
+                                               game.encounter_history.to_columns()['passive_id']), module.__name__)
+                self.assertTrue(np.array_equal(replayed.trust.opinions, game.trust.opinions), module.__name__)
+
+
+class TestPairSampling(unittest.TestCase):
+    '''
+    Test the alias table and the pair distributions
+    '''
+
+    def test_alias_table(self):
+        weights = np.array([0, 1, 2, 3, 10, 0.5])
+        table = AliasTable(weights)
+        counts = np.bincount(table.sample(np.random.default_rng(0).random(200000)), minlength=len(weights))
+        self.assertEqual(counts[0], 0)
+        self.assertTrue(np.allclose(counts / counts.sum(), weights / weights.sum(), atol=0.005))
+
+    def test_pairs(self):
+        rng = np.random.default_rng(0)
+        for pairs in [UniformPairs(1000), LocalPairs(1000, 4), WeightedPairs(np.arange(1000) % 7)]:
+            active, passive, uniforms = pairs.draw(rng, 50000)
+            self.assertTrue(np.all(active != passive))
+            self.assertTrue(np.all((0 <= passive) & (passive < 1000)))
+            partners = pairs.partners(rng, active, rng.random(active.size))
+            self.assertTrue(np.all(partners != active))
+        active, passive, _ = LocalPairs(1000, 4).draw(rng, 50000)
+        distance = np.minimum(np.abs(active - passive), 1000 - np.abs(active - passive))
+        self.assertEqual(sorted(set(distance.tolist())), [1, 2, 3, 4])
+
+
+class TestTopology(unittest.TestCase):
+    '''
+    Test the generated graphs and the sparse opinion store
+    '''
+
+    def test_generators(self):
+        rng = np.random.default_rng(0)
+        for spec in ['regular:6', 'small_world:6:0.2', 'scale_free:3']:
+            topology = make_topology(spec, 500, rng)
+            rows = np.repeat(np.arange(500), topology.degrees())
+            edges = set(zip(rows.tolist(), topology.indices.tolist()))
+            self.assertTrue(all((j, i) in edges for i, j in edges))
+            self.assertTrue(all(i != j for i, j in edges))
+            active, passive, _ = GraphPairs(topology).draw(rng, 10000)
+            self.assertTrue(all(edge in edges for edge in zip(active.tolist(), passive.tolist())))
+
+    def test_isolated_agents(self):
+        # agent 39 has no neighbours: it never starts an encounter, and no trial picks it as the passive agent
+        sources = np.arange(39)
+        topology = Topology.from_edges(40, sources, (sources + 1) % 39) # a ring over agents 0, ..., 38
+        with tempfile.TemporaryDirectory() as log_dir:
+            for record_attempts in (False, True):
+                game = simulation_failures.Game(num_agents=40, num_interactions=30, seed=Config.seed, topology=topology,
+                                                record_attempts=record_attempts, log_sink='null', log_echo=False, log_dir=log_dir)
+                game.run()
+                self.assertNotIn(39, game.all_passive_ids.tolist())
+            game = simulation.Game(num_agents=40, num_interactions=500, seed=Config.seed, topology=topology, log_sink='null',
+                                   log_echo=False, log_dir=log_dir, agent_log_dir=os.path.join(log_dir, 'agents'))
+            game.run()
+            self.assertNotIn(39, game.encounter_history.to_columns()['active_id'].tolist())
+
+    def test_complete_graph_matches_dense(self):
+        n = 30
+        sources, targets = np.triu_indices(n, k=1)
+        sparse = SparseTrustMatrix(Topology.from_edges(n, sources, targets))
+        dense = TrustMatrix(n)
+        rng = np.random.default_rng(1)
+        for _ in range(500):
+            i, j = rng.choice(n, 2, replace=False)
+            success = rng.random() < 0.5
+            for trust in (sparse, dense):
+                trust.direct_update(i, j, success, Config.alpha_direct)
+                if success:
+                    trust.indirect_update(i, j, Config.alpha_indirect)
+        self.assertTrue(np.array_equal(sparse.data, dense.off_diagonal()))
+
+
+class TestEventGame(unittest.TestCase):
+    '''
+    Test the event-driven game against sequential play of the same encounters
+    '''
+
+    def test_zero_latency_matches_sequential(self):
+        with tempfile.TemporaryDirectory() as log_dir:
+            game = event_simulation.Game(num_agents=50, num_interactions=2000, seed=Config.seed, gossip_latency=0.0,
+                                         tick=1e-6, log_sink='null', log_echo=False, log_dir=log_dir,
+                                         agent_log_dir=os.path.join(log_dir, 'agents'))
+            game.run()
+        self.assertTrue(np.all(np.diff(game.start_times) >= 0))
+        trust = TrustMatrix(50)
+        threshold = game.agents[0].payoff_threshold
+        agents = [LearnTrustAgent(i, game.r_arr[i], Config.alpha_direct, Config.alpha_indirect, 0.5, threshold,
+                                  registers=trust.registers(i)) for i in range(50)]
+        for encounter in game.encounter_history:
+            active, passive = agents[encounter['active_id']], agents[encounter['passive_id']]
+            accepted, success = active.handle_encounter(passive.id, passive.reliability, passive.registers, Config.p_g, Config.p_b,
+                                                        reliability_sample=0.0 if encounter['result'] else 1.0)
+            self.assertEqual(accepted, encounter['accepted'])
+        self.assertTrue(np.array_equal(trust.opinions, game.trust.opinions))
+
+
+class TestFailuresFastPath(unittest.TestCase):
+    '''
+    Test that the vectorized attempts-until-success engine plays exactly the same game as the per-attempt loop
+    '''
+
+    def test_matches_per_attempt_loop(self):
+        with tempfile.TemporaryDirectory() as log_dir:
+            games = []
+            for record_attempts in (True, False):
+                for kwargs in ({'r_dist': 'skewed'}, {'pairing': 'local:3'}):
+                    game = simulation_failures.Game(num_agents=60, num_interactions=30, seed=Config.seed, record_attempts=record_attempts,
+                                                    log_sink='null', log_echo=False, log_dir=log_dir, **kwargs)
+                    game.run()
+                    games.append(game)
+        for recorded, fast in zip(games[:2], games[2:]):
+            self.assertTrue(recorded.df_failures.equals(fast.df_failures))
+            self.assertTrue(recorded.df_aggregate_failures.equals(fast.df_aggregate_failures))
+            self.assertTrue(np.array_equal(recorded.trust.opinions, fast.trust.opinions))
+            self.assertEqual(recorded.total_payout, fast.total_payout)
+            self.assertIsNone(fast.df)
+
+
+class TestRunTables(unittest.TestCase):
+    '''
+    Test the binary run tables written by a game and by the CSV converter
+    '''
+
+    def test_round_trip(self):
+        with tempfile.TemporaryDirectory() as log_dir:
+            game = simulation.Game(num_agents=20, num_interactions=500, seed=Config.seed, log_sink='null', log_echo=False,
+                                   run_format='both', log_dir=log_dir, agent_log_dir=os.path.join(log_dir, 'agents'))
+            game.run()
+            table = load_table(game.csv_path)
+            self.assertIsInstance(table['total_payout'], np.memmap)
+            self.assertTrue(table.to_dataframe().equals(game.df))
+            self.assertEqual(table.params['seed'], Config.seed)
+            converted = load_table(convert_csv(game.csv_path, os.path.join(log_dir, 'converted')))
+            self.assertTrue(np.array_equal(converted['passive_id'], game.df['passive_id']))
+            self.assertTrue(np.allclose(converted['passive_opinion'], game.df['passive_opinion']))
+
+
+class TestOnlineMetrics(unittest.TestCase):
+    '''
+    Test that the running metrics agree with the ones rebuilt from the full history
+    '''
+
+    def test_matches_history(self):
+        with tempfile.TemporaryDirectory() as log_dir:
+            game = simulation.Game(num_agents=40, num_interactions=3000, seed=Config.seed, log_sink='null', log_echo=False,
+                                   metrics_every=250, log_dir=log_dir, agent_log_dir=os.path.join(log_dir, 'agents'))
+            game.run()
+        metrics = game.metrics
+        accepted = game.encounter_history.column('accepted')
+        self.assertTrue(np.array_equal(metrics.payoffs, game.encounter_history.payoffs(40, Config.p_g, Config.p_b)))
+        self.assertAlmostEqual(metrics.opinion_mae(), game.trust.opinion_error(game.r_arr))
+        snapshots = metrics.snapshots_dataframe()
+        self.assertEqual(len(snapshots), 12)
+        self.assertEqual(snapshots['total_payout'].iloc[-1], game.total_payout)
+        self.assertAlmostEqual(snapshots['acceptance_rate'].iloc[-1], accepted.mean())
+        self.assertEqual(snapshots['window_payout'].sum(), game.total_payout)
+
+
+class TestCheckpoint(unittest.TestCase):
+    '''
+    Test that a game resumed from a checkpoint finishes exactly like one that was never interrupted
+    '''
+
+    def read_logs(self, game, names):
+        logs = []
+        for name in names:
+            with open(getattr(game, name).path) as f:
+                logs.append(f.read())
+        return logs
+
+    def test_resume(self):
+        with tempfile.TemporaryDirectory() as log_dir:
+            kwargs = dict(num_agents=30, num_interactions=1000, seed=Config.seed, log_sink='text', log_echo=False,
+                          agent_log_dir=os.path.join(log_dir, 'agents'))
+            games = []
+            for run_no, checkpoint_every in ((0, 0), (1, 300)):
+                game = simulation.Game(run_no=run_no, checkpoint_every=checkpoint_every, log_dir=log_dir, **kwargs)
+                game.run()
+                games.append(game)
+            # the checkpoint was taken after encounter 900; the resumed run replays the last 100 on top of it
+            resumed = checkpoint.resume(games[1].checkpoint_path)
+            self.assertTrue(resumed.df.equals(games[0].df))
+            self.assertTrue(np.array_equal(resumed.trust.opinions, games[0].trust.opinions))
+            self.assertTrue(np.array_equal(resumed.metrics.payoffs, games[0].metrics.payoffs))
+            self.assertEqual(resumed.metrics.snapshots, games[0].metrics.snapshots)
+            self.assertEqual(self.read_logs(resumed, ['log']), self.read_logs(games[0], ['log']))
+
+            games = []
+            for run_no, checkpoint_every in ((0, 0), (1, 7)):
+                game = simulation_failures.Game(run_no=run_no, num_agents=40, num_interactions=30, seed=Config.seed, pairing='local:3',
+                                                log_sink='text', log_echo=False, checkpoint_every=checkpoint_every, log_dir=log_dir)
+                game.run()
+                games.append(game)
+            resumed = checkpoint.resume(games[1].checkpoint_path)
+            self.assertTrue(resumed.df_failures.equals(games[0].df_failures))
+            self.assertTrue(np.array_equal(resumed.trust.opinions, games[0].trust.opinions))
+            self.assertEqual(resumed.total_payout, games[0].total_payout)
+            self.assertEqual(self.read_logs(resumed, ['log', 'log_failures']), self.read_logs(games[0], ['log', 'log_failures']))
+
+
+class TestBenchmark(unittest.TestCase):
+    '''
+    Test the benchmark grid, a small case and the regression check
+    '''
+
+    def test_case_and_compare(self):
+        grid = {'game': ['simulation', 'simulation_failures'], 'num_agents': [50, 20000], 'num_interactions': [200],
+                'r_dist': ['uniform'], 'topology': [None]}
+        cases = benchmark.expand_cases(grid)
+        self.assertEqual([case['num_agents'] for case in cases], [50, 50]) # dense 20000-agent games are skipped
+        rows = [benchmark.run_case(case, seed=Config.seed) for case in cases]
+        self.assertEqual(rows[0]['encounters'], 200)
+        self.assertTrue(all(row['encounters_per_sec'] > 0 and row['peak_rss_mb'] > 0 for row in rows))
+        baseline = {'cases': rows}
+        slower = {'cases': [dict(rows[0], encounters_per_sec=rows[0]['encounters_per_sec'] * 0.5), rows[1]]}
+        self.assertEqual(benchmark.compare(baseline, baseline), [])
+        regressions = benchmark.compare(baseline, slower, tolerance=0.1)
+        self.assertEqual([(regression['case'], regression['metric']) for regression in regressions],
+                         [(benchmark.case_key(cases[0]), 'encounters_per_sec')])
+
+    def test_cold_start(self):
+        # a game that only writes binary tables never imports pandas; a CSV export does
+        for game, num_encounters in (('simulation', 100), ('simulation_failures', 10)):
+            lean, tabular = (benchmark.cold_start(2, run_format, num_agents=20, num_encounters=num_encounters, seed=Config.seed, game=game)
+                             for run_format in ('npy', 'csv'))
+            self.assertFalse(lean['pandas_loaded'])
+            self.assertTrue(tabular['pandas_loaded'])
+        self.assertGreater(benchmark.description_costs(50, num_records=5)['record_seconds'], 0)
+
+
+class TestProfiler(unittest.TestCase):
+    '''
+    Test that profiling does not change a game, and that its counters and exports are consistent
+    '''
+
+    def test_profiled_game(self):
+        with tempfile.TemporaryDirectory() as log_dir:
+            games = [simulation.Game(num_agents=30, num_interactions=2000, seed=Config.seed, log_sink='null', log_echo=False,
+                                     profile_every=profile_every, log_dir=log_dir, agent_log_dir=os.path.join(log_dir, 'agents'))
+                     for profile_every in (0, 50)]
+            for game in games:
+                game.run()
+            self.assertTrue(games[0].df.equals(games[1].df))
+            profiler = games[1].profiler
+            counters = profiler.counters_dict()
+            history = games[1].encounter_history
+            accepted, result = history.column('accepted'), history.column('result')
+            self.assertEqual(counters['direct_updates'], accepted.sum())
+            self.assertEqual(counters['indirect_updates'], (accepted & result).sum())
+            self.assertEqual(counters['register_entries'], accepted.sum() + 28 * (accepted & result).sum())
+            summary = profiler.summary().set_index('phase')
+            self.assertEqual(summary.loc['encounter', 'timed_calls'], 40)
+            self.assertEqual(summary.loc['encounter;handle_encounter;decision', 'timed_calls'], 40)
+            with open(os.path.join(log_dir, 'game0', 'game_profile_0.trace.json')) as f:
+                trace = json.load(f)
+            self.assertEqual(sum(event['ph'] == 'X' for event in trace['traceEvents']), summary['timed_calls'].sum())
+
+
+class TestLazyPropagation(unittest.TestCase):
+    '''
+    Test that lazy indirect propagation matches eager propagation
+    '''
+
+    def test_matches_eager_store(self):
+        rng = np.random.default_rng(Config.seed)
+        eager, lazy = TrustMatrix(12), LazyTrustMatrix(12, max_pending=5)
+        eager.opinions[:] = lazy.opinions[:] = rng.random((12, 12))
+        for _ in range(3000):
+            i, j = rng.choice(12, size=2, replace=False)
+            action = rng.integers(4)
+            if action == 0:
+                success = rng.random() < 0.5
+                eager.direct_update(i, j, success, 0.1)
+                lazy.direct_update(i, j, success, 0.1)
+            elif action == 1:
+                eager.indirect_update(i, j, 0.2)
+                lazy.indirect_update(i, j, 0.2)
+            elif action == 2:
+                gossip = RegisterView(eager.opinions[j].copy(), j)
+                eager.registers(i).blend(gossip, 0.3, exclude=j)
+                lazy.registers(i).blend(gossip, 0.3, exclude=j)
+            else:
+                self.assertAlmostEqual(lazy.get_opinion(i, j), eager.get_opinion(i, j), places=12)
+        self.assertTrue(np.allclose(lazy.opinions, eager.opinions, rtol=0, atol=1e-12))
+
+    def test_matches_eager_game(self):
+        with tempfile.TemporaryDirectory() as log_dir:
+            games = [simulation.Game(num_agents=60, num_interactions=5000, r_dist='skewed', seed=Config.seed, log_sink='null', log_echo=False,
+                                     propagation=propagation, log_dir=log_dir, agent_log_dir=os.path.join(log_dir, 'agents'))
+                     for propagation in ('eager', 'lazy')]
+            failures = [simulation_failures.Game(num_agents=60, num_interactions=30, seed=Config.seed, log_sink='null', log_echo=False,
+                                                 propagation=propagation, log_dir=log_dir)
+                        for propagation in ('eager', 'lazy')]
+            for game in games + failures:
+                game.run()
+        eager, lazy = games
+        self.assertTrue(np.array_equal(eager.df['accepted'], lazy.df['accepted']))
+        self.assertTrue(np.allclose(eager.df['passive_opinion'], lazy.df['passive_opinion'], rtol=0, atol=1e-12))
+        self.assertTrue(np.allclose(eager.trust.opinions, lazy.trust.opinions, rtol=0, atol=1e-12))
+        self.assertTrue(failures[0].df_failures.equals(failures[1].df_failures))
+        self.assertTrue(np.allclose(failures[0].trust.opinions, failures[1].trust.opinions, rtol=0, atol=1e-12))
+
+
+class TestStrategies(unittest.TestCase):
+    '''
+    Test the strategy mixes and the vectorized decision kernel, and that mixed populations play the same game
+    in every engine
+    '''
+
+    def test_kernel(self):
+        mix = strategies.parse_mix('learn_trust:3,play_always:1,play_never:1,know_reliability:1')
+        self.assertAlmostEqual(mix['learn_trust'], 0.5)
+        self.assertEqual(strategies.parse_mix(strategies.mix_spec(mix)), mix)
+        codes = strategies.assign_strategies(mix, 101, np.random.default_rng(Config.seed))
+        self.assertEqual(np.bincount(codes).tolist(), [50, 17, 17, 17])
+        self.assertRaises(ValueError, strategies.parse_mix, 'play_sometimes')
+
+        rng = np.random.default_rng(Config.seed)
+        opinions, reliabilities, thresholds = rng.random(101), rng.random(101), rng.uniform(-1, 1, 101)
+        accepted = strategies.decide(codes, opinions, reliabilities, 2, -2, thresholds)
+        for k in range(101):
+            decide_fn = strategies.STRATEGIES[strategies.strategy_name(codes[k])]
+            self.assertEqual(accepted[k], decide_fn(opinions[k], reliabilities[k], 2, -2, thresholds[k]))
+
+        # a decision run ends just before the first key that repeats within it
+        keys = rng.integers(0, 20, 200)
+        ends = strategies.decision_runs(keys)
+        for start in range(200):
+            end = ends[start]
+            self.assertEqual(len(set(keys[start:end].tolist())), end - start)
+            self.assertTrue(end == 200 or keys[end] in keys[start:end])
+
+    def test_mixed_games(self):
+        mix = 'learn_trust:0.5,play_always:0.25,play_never:0.25'
+        with tempfile.TemporaryDirectory() as log_dir:
+            game = simulation.Game(num_agents=40, num_interactions=2000, seed=Config.seed, strategies=mix, log_sink='null',
+                                   log_echo=False, log_dir=log_dir, agent_log_dir=os.path.join(log_dir, 'agents'))
+            game.run()
+            game.log_end_info(game.encounter_history)
+            batch_game = BatchGame([Config.seed], num_agents=40, num_interactions=2000, strategies=mix)
+            self.assertTrue(np.array_equal(game.encounter_history.column('total_payout'), batch_game.run()[0]))
+            self.assertTrue(np.array_equal(game.strategy_codes, batch_game.strategy_codes[0]))
+
+            # play_never agents never accept, play_always agents accept every encounter they decide
+            strategy = game.df2['strategy'].to_numpy()
+            self.assertEqual(game.metrics.accepted[strategy == 'play_never'].sum(), 0)
+            always = strategy == 'play_always'
+            self.assertTrue(np.array_equal(game.metrics.accepted[always], game.metrics.proposals[always]))
+            summary = pd.read_csv(game.csv_path_strategies)
+            self.assertEqual(summary['num_agents'].tolist(), [20, 10, 10])
+            self.assertAlmostEqual(summary['total_payoff'].sum(), game.metrics.payoffs.sum())
+
+            failures = [simulation_failures.Game(num_agents=40, num_interactions=20, seed=Config.seed, strategies=mix,
+                                                 record_attempts=record_attempts, log_sink='null', log_echo=False, log_dir=log_dir)
+                        for record_attempts in (True, False)]
+            for failures_game in failures:
+                failures_game.run()
+        self.assertTrue(failures[0].df_failures.equals(failures[1].df_failures))
+        self.assertTrue(np.array_equal(failures[0].trust.opinions, failures[1].trust.opinions))
+        self.assertTrue((failures[1].df_failures.loc[failures[1].df_failures['strategy'] == 'play_never', 'num_attempts'] == 0).all())
+
+
+class TestConcurrentGame(unittest.TestCase):
+    '''
+    Test that conflict-free waves respect the order of the encounters, and that a game played on a thread pool
+    is identical to the same game played one encounter at a time
+    '''
+
+    def test_waves(self):
+        rng = np.random.default_rng(Config.seed)
+        active = rng.integers(30, size=500)
+        passive = (active + rng.integers(1, 30, size=500)) % 30
+        waves = conflict_free_waves(active, passive, 30)
+        self.assertEqual(sorted(np.concatenate(waves).tolist()), list(range(500)))
+        wave_of = np.empty(500, dtype=int)
+        for w, wave in enumerate(waves):
+            agents = np.concatenate([active[wave], passive[wave]])
+            self.assertEqual(len(np.unique(agents)), len(agents))
+            wave_of[wave] = w
+        for agent in range(30):
+            encounters = np.flatnonzero((active == agent) | (passive == agent))
+            self.assertTrue(np.all(np.diff(wave_of[encounters]) > 0))
+
+    def test_matches_serial_game(self):
+        with tempfile.TemporaryDirectory() as log_dir:
+            for kwargs in ({'r_dist': 'skewed'}, {'topology': 'small_world:6:0.1'}):
+                games = [simulation.Game(num_agents=60, num_interactions=4000, seed=Config.seed, log_sink='null', log_echo=False,
+                                         metrics_every=300, num_threads=num_threads, thread_batch_size=256, log_dir=log_dir,
+                                         agent_log_dir=os.path.join(log_dir, 'agents'), **kwargs)
+                         for num_threads in (1, 4)]
+                for game in games:
+                    game.run()
+                serial, threaded = games
+                self.assertTrue(serial.df.equals(threaded.df))
+                self.assertTrue(np.array_equal(serial.trust.get_state(), threaded.trust.get_state()))
+                self.assertTrue(serial.metrics.snapshots_dataframe().equals(threaded.metrics.snapshots_dataframe()))
+
+
+class TestShardedGame(unittest.TestCase):
+    '''
+    Test the message framing, and that a game sharded over local workers plays the same game as simulation.Game
+    '''
+
+    def test_messages(self):
+        arrays = {'rows': np.full((3, 500), 0.5), 'ids': np.array([4, 7, 9]), 'flags': np.array([True, False]), 'empty': np.empty((0, 500))}
+        left, right = socket.socketpair()
+        with left, right:
+            for compress_level in (0, 1):
+                sent, payload = distributed.send_message(left, {'op': 'wave', 'n': 3}, arrays, compress_level)
+                header, received, received_bytes, received_payload = distributed.recv_message(right)
+                self.assertEqual(header, {'op': 'wave', 'n': 3})
+                self.assertEqual((received_bytes, received_payload), (sent, payload))
+                self.assertEqual(compress_level == 1, sent < payload)
+                for name, array in arrays.items():
+                    self.assertEqual(received[name].dtype, array.dtype)
+                    self.assertTrue(np.array_equal(received[name], array))
+
+    def test_token(self):
+        with self.assertRaises(ValueError):
+            distributed.serve(host='0.0.0.0')
+        receiver, sender = Pipe(duplex=False)
+        threading.Thread(target=distributed.serve, kwargs={'ready': sender, 'token': 'shared secret'}, daemon=True).start()
+        worker = f'127.0.0.1:{receiver.recv()}'
+        for token in (None, 'wrong'):
+            with self.assertRaises(PermissionError):
+                distributed.Cluster([worker], token=token)
+        with distributed.Cluster([worker], token='shared secret') as cluster:
+            self.assertEqual(len(cluster), 1)
+            self.assertEqual(cluster.stats['messages'], 0)
+
+    def test_bad_hello(self):
+        # malformed, oversized or missing hellos close the connection, and the worker keeps serving
+        timeout = distributed.HANDSHAKE_TIMEOUT
+        distributed.HANDSHAKE_TIMEOUT = 0.2
+        try:
+            receiver, sender = Pipe(duplex=False)
+            threading.Thread(target=distributed.serve, kwargs={'ready': sender, 'token': 'secret'}, daemon=True).start()
+            port = receiver.recv()
+            frames = [distributed.FRAME.pack(5, 0, False) + b'notjs', distributed.FRAME.pack(2, 2 ** 63, False) + b'{}',
+                      distributed.FRAME.pack(2 ** 31, 0, False), distributed.FRAME.pack(2, 0, True) + b'[]', b'']
+            for frame in frames:
+                with socket.create_connection(('127.0.0.1', port)) as sock:
+                    sock.sendall(frame)
+                    sock.settimeout(5)
+                    try:
+                        sock.recv(1) # the worker closes the connection (after the timeout for the silent peer)
+                    except ConnectionError:
+                        pass
+            with distributed.Cluster([f'127.0.0.1:{port}'], token='secret') as cluster:
+                self.assertEqual(len(cluster), 1)
+        finally:
+            distributed.HANDSHAKE_TIMEOUT = timeout
+
+    def test_matches_game(self):
+        kwargs = {'num_agents': 50, 'num_interactions': 3000, 'r_dist': 'skewed', 'seed': Config.seed, 'log_sink': 'null', 'log_echo': False,
+                  'strategies': 'learn_trust:0.8,know_reliability:0.2'}
+        with tempfile.TemporaryDirectory() as log_dir, distributed.Cluster(num_shards=3) as cluster:
+            game = simulation.Game(log_dir=log_dir, agent_log_dir=os.path.join(log_dir, 'agents'), **kwargs)
+            game.run()
+            sharded = distributed.ShardedGame(cluster=cluster, batch_size=700, log_dir=log_dir, agent_log_dir=os.path.join(log_dir, 'agents'), **kwargs)
+            sharded.run()
+            self.assertTrue(sharded.df.equals(game.df))
+            self.assertTrue(np.array_equal(sharded.opinions(), game.trust.opinions))
+            self.assertTrue(np.allclose(sharded.row_errors, game.trust.row_errors(game.r_arr)))
+
+
+class TestPrecision(unittest.TestCase):
+    '''
+    Test the reduced-precision and fixed-point opinion stores
+    '''
+
+    def test_fixed_point_codec(self):
+        codec = FixedPointCodec('uint8', np.random.default_rng(Config.seed))
+        self.assertEqual(codec.decode(codec.encode(np.array([0.0, 0.5, 1.0]))).tolist(), [0.0, 0.5, 1.0])
+        # stochastic rounding is unbiased: the mean of many encodings of one opinion is the opinion itself
+        codes = codec.encode(np.full(200000, 0.3013))
+        self.assertTrue(set(np.unique(codes).tolist()) <= {76, 77})
+        self.assertAlmostEqual(codec.decode(codes).mean(), 0.3013, places=3)
+        sizes = {precision: make_trust_store(50, precision=precision, rng=np.random.default_rng()).nbytes for precision in PRECISIONS}
+        self.assertEqual([sizes['float64'] // sizes[precision] for precision in PRECISIONS], [1, 2, 4, 4, 8])
+        with self.assertRaises(ValueError):
+            make_trust_store(50, propagation='lazy', precision='float32')
+
+    def test_games(self):
+        with tempfile.TemporaryDirectory() as log_dir:
+            for precision in ('float32', 'uint8'):
+                # the fast attempts engine still plays exactly the per-attempt game, rounding draws included
+                games = [simulation_failures.Game(num_agents=60, num_interactions=20, seed=Config.seed, record_attempts=record_attempts,
+                                                  precision=precision, log_sink='null', log_echo=False, log_dir=log_dir)
+                         for record_attempts in (True, False)]
+                for game in games:
+                    game.run()
+                self.assertTrue(games[0].df_failures.equals(games[1].df_failures))
+                self.assertTrue(np.array_equal(games[0].trust.opinions, games[1].trust.opinions))
+                game = simulation.Game(num_agents=40, num_interactions=2000, seed=Config.seed, topology='regular:6', precision=precision,
+                                       log_sink='null', log_echo=False, log_dir=log_dir, agent_log_dir=os.path.join(log_dir, 'agents'))
+                game.run()
+                opinions = game.trust.off_diagonal()
+                self.assertEqual(game.trust.data.dtype, np.dtype(precision))
+                self.assertTrue(((opinions >= 0) & (opinions <= 1)).all())
+                self.assertAlmostEqual(game.metrics.row_errors.sum(), game.trust.row_errors(game.r_arr).sum(), places=6)
+
+
+class TestConvergence(unittest.TestCase):
+    '''
+    Test the convergence monitor, and that a game stopped once it has converged is the prefix of the full game
+    '''
+
+    def test_monitor(self):
+        rng = np.random.default_rng(Config.seed)
+        settled = ConvergenceMonitor('stop', num_windows=5, start=2000)
+        drifting = ConvergenceMonitor('stop', num_windows=5)
+        for w in range(1, 61):
+            decided = 1000
+            accepted = rng.binomial(decided, 0.4)
+            self.assertEqual(settled.check(100 * w, 0.1, decided, accepted, 0.5 * accepted), 100 * w == 2000)
+            self.assertFalse(drifting.check(100 * w, 0.3 - 0.004 * w, decided, accepted, 0.5 * accepted))
+        self.assertEqual(settled.converged_at, 2000)
+        self.assertIsNone(drifting.converged_at)
+        self.assertAlmostEqual(settled.summary()['steady_acceptance_rate'], 0.4, places=1)
+        self.assertEqual(settled.columns()['converged'].sum(), 41)
+        restored = make_monitor(json.loads(json.dumps(settled.settings())))
+        restored.set_state(json.loads(json.dumps(settled.get_state())))
+        self.assertEqual(restored.summary(), settled.summary())
+        self.assertEqual(make_monitor(settled).windows, [])
+        self.assertFalse(make_monitor(None).enabled)
+        # a window without encounters is recorded but cannot make a game converge
+        self.assertFalse(drifting.check(6100, 0.05, 0, 0, 0))
+        with self.assertRaises(ValueError):
+            ConvergenceMonitor('sometimes')
+
+    def test_long_run(self):
+        # 20000 windows: 2M encounters at metrics_every=100. a check costs the same at every window
+        rng = np.random.default_rng(Config.seed)
+        errors, accepted, payout = 0.1 + 0.01 * rng.random(20000), rng.binomial(100, 0.4, 20000), rng.normal(0, 10, 20000)
+        monitor = ConvergenceMonitor('thin', start=10 ** 9)
+        start = time.perf_counter()
+        for w in range(20000):
+            monitor.check(100 * (w + 1), errors[w], 100, accepted[w], payout[w])
+        self.assertLess(time.perf_counter() - start, 5)
+        # the running sums give the block statistics over the last 2k = 10000 windows
+        k = 5000
+        statistics = monitor.statistics()
+        self.assertAlmostEqual(statistics['opinion_change'], errors[-k:].mean() - errors[-2 * k:-k].mean(), places=12)
+        self.assertAlmostEqual(statistics['acceptance_change'], (accepted[-k:].sum() - accepted[-2 * k:-k].sum()) / (100 * k), places=12)
+        self.assertAlmostEqual(statistics['payoff_slope'], np.polyfit(np.arange(2 * k), payout[-2 * k:] / 100, 1)[0], places=12)
+
+    def test_stopped_game(self):
+        with tempfile.TemporaryDirectory() as log_dir:
+            games = [simulation.Game(num_agents=20, num_interactions=30000, seed=Config.seed, log_sink='null', log_echo=False,
+                                     metrics_every=200, convergence=convergence, num_threads=num_threads, log_dir=log_dir,
+                                     agent_log_dir=os.path.join(log_dir, 'agents'))
+                     for convergence, num_threads in ((None, 1), ({'action': 'stop'}, 1), (ConvergenceMonitor('stop'), 2))]
+            for game in games:
+                game.run()
+            full, stopped, threaded = games
+            self.assertEqual((full.stopped_at, full.stop_reason), (30000, 'num_interactions'))
+            self.assertEqual(stopped.stop_reason, 'converged')
+            self.assertLess(stopped.stopped_at, 30000)
+            self.assertEqual(stopped.stopped_at, threaded.stopped_at)
+            self.assertTrue(stopped.df.equals(full.df.iloc[:stopped.stopped_at]))
+            self.assertTrue(stopped.metrics.snapshots_dataframe().equals(full.metrics.snapshots_dataframe().iloc[:len(stopped.metrics.snapshots)]))
+            self.assertTrue(os.path.exists(stopped.csv_path_convergence))
+            # the steady state measured when the game stopped is the steady state at the end of the full game
+            steady = stopped.convergence.summary()
+            last = full.metrics.snapshots[-stopped.convergence.num_windows:]
+            self.assertAlmostEqual(steady['steady_acceptance_rate'], np.mean([snapshot['window_acceptance_rate'] for snapshot in last]), delta=0.03)
+            self.assertAlmostEqual(steady['steady_opinion_error'], last[-1]['opinion_mae'], delta=0.01)
+
+            failures = [simulation_failures.Game(num_agents=20, num_interactions=1500, seed=Config.seed, record_attempts=record_attempts,
+                                                 convergence={'action': 'stop', 'every': 25}, log_sink='null', log_echo=False, log_dir=log_dir)
+                        for record_attempts in (True, False)]
+            for failures_game in failures:
+                failures_game.run()
+            recorded, fast = failures
+            self.assertEqual(recorded.stop_reason, 'converged')
+            self.assertEqual(recorded.stopped_at, fast.stopped_at)
+            self.assertEqual(len(fast.df_failures), fast.stopped_at * fast.agents_per_trial)
+            self.assertTrue(recorded.df_failures.equals(fast.df_failures))
+            self.assertEqual(recorded.convergence.windows, fast.convergence.windows)
+
+
 if __name__ == '__main__':
     unittest.main()